@@ -0,0 +1,132 @@
+"""
+Benchmarks reading all simulations for a time step from a pyESG file.
+
+The loop which reads each simulation separately (as `PyESGReader` used to) is compared with strided reads from the
+reader, from the memory-mapped reader and from a file with the tiled layout. Run from the top level directory, e.g.
+
+    python -m benchmarks.benchmark_reader --simulations 100000 --time-steps 121
+"""
+import argparse
+import io
+import numpy as np
+import os
+import struct
+import tempfile
+import time
+
+from datetime import datetime, timedelta
+from pyesg.constants.file_layouts import CONTIGUOUS, TILED
+from pyesg.io.reader import PyESGReader
+from pyesg.io.writer import PyESGWriter
+
+
+def write_benchmark_file(file_path: str, number_simulations: int, number_outputs: int, number_time_steps: int,
+                         layout: str = CONTIGUOUS):
+    """
+    Writes a pyESG file of random simulations for benchmarking.
+    Args:
+        file_path: The path of the file to write.
+        number_simulations: The number of simulations in the file.
+        number_outputs: The number of outputs in the file.
+        number_time_steps: The number of time steps in the file (including the initial time step).
+        layout: (Optional) The layout of simulations in the file.
+    """
+    writer = PyESGWriter(file_path, layout=layout)
+    projection_dates = [datetime(2018, 1, 1) + timedelta(days=30 * i) for i in range(number_time_steps)]
+    writer.write_header(number_simulations, [f"output_{i}" for i in range(number_outputs)], projection_dates, 12.0)
+    simulations = np.random.RandomState(0).standard_normal([number_outputs, number_simulations, number_time_steps])
+    writer.write_batch_of_simulations(1, 1, simulations.astype(np.float32))
+    writer.finalise()
+
+
+def read_time_step_with_loop(reader: PyESGReader, output_index: int, time_step: int) -> np.ndarray:
+    """
+    Reads all simulations for a time step by reading each simulation separately.
+    Args:
+        reader: The reader for the file.
+        output_index: The index of the output.
+        time_step: The time step to read.
+
+    Returns:
+        All simulations for the time step.
+
+    This reads and seeks once for each simulation, as `PyESGReader` originally did.
+    """
+    simulations = np.zeros(reader.number_of_simulations)
+    file = reader._data_file
+    file.seek(reader._get_seek_position_for_output(output_index) + time_step * reader.size_of_float)
+    bytes_between_sims = (reader.number_of_time_steps - 1) * reader.size_of_float
+    for i in range(reader.number_of_simulations - 1):
+        simulations[i], = struct.unpack("<f", file.read(reader.size_of_float))
+        file.seek(bytes_between_sims, io.SEEK_CUR)
+    simulations[-1], = struct.unpack("<f", file.read(reader.size_of_float))
+    return simulations
+
+
+def time_function(function, repeats: int) -> float:
+    """
+    Returns the shortest time taken to call a function.
+    Args:
+        function: The function to call with no arguments.
+        repeats: The number of times to call the function.
+
+    Returns:
+        The shortest time (in seconds) taken for a call.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--simulations", type=int, default=100000)
+    parser.add_argument("--outputs", type=int, default=2)
+    parser.add_argument("--time-steps", type=int, default=121)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, "benchmark.pyesg")
+        tiled_file_path = os.path.join(directory, "benchmark_tiled.pyesg")
+        write_benchmark_file(file_path, args.simulations, args.outputs, args.time_steps)
+        write_benchmark_file(tiled_file_path, args.simulations, args.outputs, args.time_steps, layout=TILED)
+        output = args.outputs - 1
+        time_step = args.time_steps // 2
+        time_steps = range(0, args.time_steps, max(1, args.time_steps // 12))
+
+        reader = PyESGReader(file_path)
+        memory_mapped_reader = PyESGReader(file_path, memory_map=True)
+        tiled_reader = PyESGReader(tiled_file_path)
+        expected = read_time_step_with_loop(reader, output, time_step)
+        for benchmark_reader in (reader, memory_mapped_reader, tiled_reader):
+            assert np.array_equal(benchmark_reader.get_output_simulations_for_single_time_step(output, time_step),
+                                  expected)
+
+        benchmarks = [
+            ("loop over simulations", lambda: read_time_step_with_loop(reader, output, time_step)),
+            ("block reads, one step", lambda: reader.get_output_simulations_for_single_time_step(output, time_step)),
+            (f"block reads, {len(time_steps)} steps",
+             lambda: reader.get_output_simulations_for_time_steps(output, time_steps)),
+            ("memory map, one step",
+             lambda: np.array(memory_mapped_reader.get_output_simulations_for_single_time_step(output, time_step))),
+            (f"memory map, {len(time_steps)} steps",
+             lambda: memory_mapped_reader.get_output_simulations_for_time_steps(output, time_steps)),
+            ("tiled, one step", lambda: tiled_reader.get_output_simulations_for_single_time_step(output, time_step)),
+            (f"tiled, {len(time_steps)} steps",
+             lambda: tiled_reader.get_output_simulations_for_time_steps(output, time_steps)),
+            ("tiled, one simulation", lambda: tiled_reader.get_output_simulations_for_single_simulation(output, 1000)),
+        ]
+        print(f"{args.simulations} simulations x {args.time_steps} time steps")
+        for name, function in benchmarks:
+            print(f"{name:<25}{time_function(function, args.repeats) * 1000:>12.2f} ms")
+
+        reader.close()
+        memory_mapped_reader.close()
+        tiled_reader.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,31 @@
 import json
 from collections import OrderedDict
+from typing import List, Union
 
-from voluptuous import Schema, Coerce, Required, Maybe, All, Range, IsDir, In, Date
+from voluptuous import Schema, Coerce, Required, Optional, Maybe, All, Any, Range, IsDir, In, Date
 
 from pyesg.configuration.json_serialisable_class import JSONSerialisableClass, _has_parameters
+from pyesg.constants.compression import COMPRESSION_CODECS, COMPRESSION_FILTERS
+from pyesg.constants.compute_dtypes import FLOAT64, COMPUTE_DTYPES
+from pyesg.constants.engine_modes import PER_STEP, ENGINE_MODES
+from pyesg.constants.file_layouts import CONTIGUOUS, FILE_LAYOUTS
 from pyesg.constants.projection_frequency import PROJECTION_FREQUENCIES
+from pyesg.constants.random_number_generators import LEGACY, RANDOM_NUMBER_GENERATORS
+from pyesg.constants.yield_curve_methods import EXTRAPOLATION_METHODS, INTERPOLATION_METHODS
 
 
 class Parameters(JSONSerialisableClass):
     """
     Represents a set of parameters in the pyESG configuration.
+
+    Parameters are numbers, apart from the parameters which choose the yield curve interpolation and extrapolation
+    methods, which are strings, and the "terms" of a zero-coupon bond curve, which are a list of numbers.
     """
     _validation_schema = Schema({
-        str: Coerce(float)
+        'yield_curve_interpolation': In(INTERPOLATION_METHODS),
+        'yield_curve_extrapolation': In(EXTRAPOLATION_METHODS),
+        'terms': [Coerce(float)],
+        str: Coerce(float),
     })
 
 
@@ -44,6 +57,21 @@ class Output(JSONSerialisableClass):
         self.parameters = Parameters()  # type: Parameters
         super().__init__(**kwargs)
 
+    def get_output_ids(self) -> List[str]:
+        """
+        Returns the ids of the outputs written to the output file for this output.
+        Returns:
+            The id of the output, or for an output with a list of terms (e.g. a zero-coupon bond curve), the id of the
+            output followed by each term (e.g. "GBP_Nominal_ZCB_5" for term 5 of the output "GBP_Nominal_ZCB").
+
+        An output with a list of terms is written to the output file as a block of consecutive outputs, one for each
+        term.
+        """
+        terms = getattr(self.parameters, "terms", None)
+        if isinstance(terms, list):
+            return [f"{self.id}_{term:g}" for term in terms]
+        return [self.id]
+
 
 @_has_parameters
 class AssetClass(JSONSerialisableClass):
@@ -197,8 +225,38 @@ class PyESGConfiguration(JSONSerialisableClass):
         number_of_simulations (int): The number of simulations to produce.
         number_of_projection_steps (int): The number of time steps to project in the simulations.
         projection_frequency (str): The frequency of projections. (e.g. 'annually', 'monthly', 'weekly')
-        number_of_batches (int): The number of batches into which the simulations are split during generation.
+        number_of_batches (int): The number of batches into which the simulations are split during generation. If None,
+                                 the batches are sized automatically from `max_memory`.
+        max_memory (Union[str, int]): The maximum memory to use for a batch of simulations (e.g. "4GB"). This is only
+                                      used if `number_of_batches` is None. When batches are generated by several worker
+                                      processes, it applies to each worker.
         random_seed (int): The random seed to use when generating random samples.
+        random_number_generator (str): The random number generator to use when generating random samples.
+                                       (e.g. 'legacy', 'pcg64', 'philox')
+        engine_mode (str): The mode in which the simulation engine calculates outputs. (e.g. 'per_step',
+                           'time_vectorised')
+        stream_random_drivers (bool): Indicates whether to generate random drivers one projection step at a time, rather
+                                      than for all projection steps of a batch at once, to reduce memory usage.
+        compute_dtype (str): The floating point type used for all calculations during generation. (e.g. 'float64',
+                             'float32')
+        output_file_layout (str): The layout of simulations in the output file. (e.g. 'contiguous', 'tiled')
+        tile_number_of_simulations (int): The maximum number of simulations in each tile of the output file if the
+                                          output file has the tiled layout.
+        tile_number_of_time_steps (int): The maximum number of time steps in each tile of the output file if the output
+                                         file has the tiled layout.
+        output_file_compression (str): The codec with which to compress each tile of the output file, or None for no
+                                       compression. Compression requires the tiled layout. (e.g. 'zlib', 'lzma')
+        output_file_compression_filter (str): The filter applied to each tile of the output file before it is
+                                              compressed, or None for no filter. (e.g. 'shuffle', 'delta')
+        output_file_summary_statistics (bool): Whether to store summary statistics (mean, variance, minimum and
+                                               maximum) for each output and time step in the output file.
+        write_in_background (bool): Indicates whether to write each batch to the output file in a background thread
+                                    while the next batch is generated. This needs memory for the output values of a
+                                    second batch.
+        fuse_outputs (bool): Indicates whether outputs of the same type which can be calculated at the same time (e.g.
+                             the same output for several economies) are calculated together, with one operation on the
+                             simulations for all of them at each projection step. This only applies in the per-step
+                             engine mode and does not change the simulations.
         economies (list[Economy]): A list of the economies being modelled.
         correlations (Correlations): The correlations between the random drivers for the asset class models.
     """
@@ -216,8 +274,21 @@ class PyESGConfiguration(JSONSerialisableClass):
         Required('output_file_directory'): IsDir(),
         Required('output_file_name'): str,
         Required('projection_frequency'): In(PROJECTION_FREQUENCIES),
-        Required('number_of_batches'): All(int, Range(min=1)),
+        Optional('number_of_batches'): Maybe(All(int, Range(min=1))),
+        Optional('max_memory'): Maybe(Any(str, All(int, Range(min=1)))),
         Required('random_seed'): int,
+        Optional('random_number_generator'): In(RANDOM_NUMBER_GENERATORS),
+        Optional('engine_mode'): In(ENGINE_MODES),
+        Optional('stream_random_drivers'): bool,
+        Optional('compute_dtype'): In(COMPUTE_DTYPES),
+        Optional('output_file_layout'): In(FILE_LAYOUTS),
+        Optional('tile_number_of_simulations'): All(int, Range(min=1)),
+        Optional('tile_number_of_time_steps'): All(int, Range(min=1)),
+        Optional('output_file_compression'): Maybe(In(COMPRESSION_CODECS)),
+        Optional('output_file_compression_filter'): Maybe(In(COMPRESSION_FILTERS)),
+        Optional('output_file_summary_statistics'): bool,
+        Optional('write_in_background'): bool,
+        Optional('fuse_outputs'): bool,
         Required('start_date'): Date(),
         Required('economies'): [Economy._validation_schema],
         Required('correlations'): Correlations._validation_schema,
@@ -230,7 +301,20 @@ class PyESGConfiguration(JSONSerialisableClass):
         self.output_file_name = None  # type: str
         self.projection_frequency = None  # type: str
         self.number_of_batches = None  # type: int
+        self.max_memory = None  # type: Union[str, int]
         self.random_seed = None  # type: int
+        self.random_number_generator = LEGACY  # type: str
+        self.engine_mode = PER_STEP  # type: str
+        self.stream_random_drivers = False  # type: bool
+        self.compute_dtype = FLOAT64  # type: str
+        self.output_file_layout = CONTIGUOUS  # type: str
+        self.tile_number_of_simulations = 4096  # type: int
+        self.tile_number_of_time_steps = 16  # type: int
+        self.output_file_compression = None  # type: str
+        self.output_file_compression_filter = None  # type: str
+        self.output_file_summary_statistics = False  # type: bool
+        self.write_in_background = False  # type: bool
+        self.fuse_outputs = False  # type: bool
         self.start_date = None  # type: str
         self.economies = []  # type: List[Economy]
         self.correlations = Correlations()  # type: Correlations
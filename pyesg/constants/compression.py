@@ -0,0 +1,15 @@
+ZLIB = 'zlib'
+LZMA = 'lzma'
+
+COMPRESSION_CODECS = [
+    ZLIB,
+    LZMA,
+]
+
+SHUFFLE = 'shuffle'
+DELTA = 'delta'
+
+COMPRESSION_FILTERS = [
+    SHUFFLE,
+    DELTA,
+]
@@ -0,0 +1,7 @@
+FLOAT32 = 'float32'
+FLOAT64 = 'float64'
+
+COMPUTE_DTYPES = [
+    FLOAT32,
+    FLOAT64,
+]
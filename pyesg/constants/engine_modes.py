@@ -0,0 +1,7 @@
+PER_STEP = 'per_step'
+TIME_VECTORISED = 'time_vectorised'
+
+ENGINE_MODES = [
+    PER_STEP,
+    TIME_VECTORISED,
+]
@@ -0,0 +1,7 @@
+CONTIGUOUS = 'contiguous'
+TILED = 'tiled'
+
+FILE_LAYOUTS = [
+    CONTIGUOUS,
+    TILED,
+]
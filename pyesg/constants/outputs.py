@@ -3,6 +3,7 @@ BOND_INDEX = 'bond_index'
 CASH_ACCOUNT = 'cash_account'
 DISCOUNT_FACTOR = 'discount_factor'
 ZERO_COUPON_BOND = 'zero_coupon_bond'
+ZERO_COUPON_BOND_CURVE = 'zero_coupon_bond_curve'
 
 # Equity
 TOTAL_RETURN_INDEX = 'total_return_index'
@@ -0,0 +1,9 @@
+LEGACY = 'legacy'
+PCG64 = 'pcg64'
+PHILOX = 'philox'
+
+RANDOM_NUMBER_GENERATORS = [
+    LEGACY,
+    PCG64,
+    PHILOX,
+]
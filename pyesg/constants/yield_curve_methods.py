@@ -0,0 +1,15 @@
+LINEAR = 'linear'
+MONOTONE_CUBIC = 'monotone_cubic'
+
+INTERPOLATION_METHODS = [
+    LINEAR,
+    MONOTONE_CUBIC,
+]
+
+NO_EXTRAPOLATION = 'none'
+SMITH_WILSON = 'smith_wilson'
+
+EXTRAPOLATION_METHODS = [
+    NO_EXTRAPOLATION,
+    SMITH_WILSON,
+]
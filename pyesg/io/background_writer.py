@@ -0,0 +1,87 @@
+import numpy as np
+import queue
+import threading
+
+from pyesg.io.writer import PyESGWriter
+
+
+class BackgroundWriter:
+    """
+    Writes batches of simulations to a pyESG file with a PyESGWriter in a background thread.
+
+    This lets the next batch of simulations be generated while the previous batch is written. Batches are written in
+    the order in which they are passed to `write_batch_of_simulations`. If writing a batch fails, the error is raised by
+    the next call to `write_batch_of_simulations` or by `finalise`, and no further batches are written.
+    Args:
+        writer: The PyESGWriter with which to write batches. Its header must already have been written.
+        max_pending_batches: (Optional) The maximum number of batches which have been passed to
+                             `write_batch_of_simulations` but not yet written. Defaults to 1. The arrays of simulations
+                             for a batch must not be changed until the batch is written, so a caller which reuses its
+                             arrays needs one more array than this.
+    """
+    def __init__(self, writer: PyESGWriter, max_pending_batches: int = 1):
+        if max_pending_batches < 1:
+            raise ValueError("The maximum number of pending batches must be at least 1.")
+
+        self._writer = writer
+        self._pending_batches = threading.Semaphore(max_pending_batches)
+        self._queue = queue.Queue()
+        self._error = None  # type: BaseException
+        self._thread = threading.Thread(target=self._write_batches, name="pyesg-background-writer", daemon=True)
+        self._thread.start()
+
+    def _write_batches(self):
+        """
+        Writes the batches in the queue until it receives None. This runs in the background thread.
+        """
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            try:
+                if self._error is None:
+                    self._writer.write_batch_of_simulations(*batch)
+            except BaseException as error:
+                self._error = error
+            finally:
+                # The batch is released before waiting for the next one, so its arrays can be freed once they are reused
+                batch = None
+                self._pending_batches.release()
+
+    def _raise_error(self):
+        """
+        Raises the error from writing a batch in the background thread, if there was one.
+        """
+        if self._error is not None:
+            raise self._error
+
+    def write_batch_of_simulations(self, batch_number: int, total_batches: int, simulations: np.ndarray,
+                                   first_simulation: int = None, checkpoint: dict = None):
+        """
+        Queues a batch of simulations to be written in the background thread.
+
+        The arguments are the same as for `PyESGWriter.write_batch_of_simulations`. This waits until there is room for
+        another pending batch, so when it returns, the arrays of batches before the last `max_pending_batches` batches
+        may be reused.
+        """
+        self._raise_error()
+        self._pending_batches.acquire()
+        self._raise_error()
+        self._queue.put((batch_number, total_batches, simulations, first_simulation, checkpoint))
+
+    def close(self):
+        """
+        Waits for the batches already queued to be written and stops the background thread, without finalising the
+        file. It is safe to call this more than once.
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def finalise(self):
+        """
+        Waits for all queued batches to be written and then finalises the file with the PyESGWriter.
+        """
+        self.close()
+        self._raise_error()
+        self._writer.finalise()
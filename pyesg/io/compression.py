@@ -0,0 +1,105 @@
+import lzma
+import numpy as np
+import zlib
+
+from pyesg.constants.compression import ZLIB, LZMA, SHUFFLE, DELTA
+
+# Codecs and filters are stored in pyESG files as integer ids
+CODEC_IDS = {None: 0, ZLIB: 1, LZMA: 2}
+FILTER_IDS = {None: 0, SHUFFLE: 1, DELTA: 2}
+
+# The approximate memory used by each codec while compressing, which does not depend on the amount of data compressed.
+# zlib at its default level uses about 256KiB and lzma at its default preset (6) uses about 94MiB.
+ENCODER_MEMORY = {ZLIB: 256 * 1024, LZMA: 94 * 1024 ** 2}
+
+
+def _shuffle_bytes(values: np.ndarray) -> bytes:
+    """
+    Rearranges the bytes of 4 byte values so that the first bytes of all values come first, then the second bytes etc.
+    Args:
+        values: The values to rearrange.
+
+    Returns:
+        The rearranged bytes.
+
+    Similar values have the same high bytes, so grouping bytes by position gives long runs which compress well.
+    """
+    return np.ascontiguousarray(values).view(np.uint8).reshape(-1, 4).T.tobytes()
+
+
+def _unshuffle_bytes(data: bytes) -> np.ndarray:
+    """
+    Reverses `_shuffle_bytes`.
+    Args:
+        data: The rearranged bytes.
+
+    Returns:
+        An array of unsigned 32 bit integers containing the original bytes of each value.
+    """
+    return np.frombuffer(data, dtype=np.uint8).reshape(4, -1).T.copy().view("<u4").ravel()
+
+
+def encode_tile(values: np.ndarray, codec: str, compression_filter: str = None) -> bytes:
+    """
+    Encodes and compresses the values in a tile.
+    Args:
+        values: An array with dimension (number simulations x number time steps) containing single precision values.
+        codec: The compression codec (e.g. 'zlib', 'lzma').
+        compression_filter: (Optional) The filter applied to the values before they are compressed (e.g. 'shuffle',
+                            'delta').
+
+    Returns:
+        The compressed bytes for the tile.
+
+    The delta filter replaces the bit pattern of each value (other than the first time step) with the difference from
+    the bit pattern of the value for the previous time step in the same simulation, and then shuffles the bytes. Smooth
+    series such as cash accounts have small differences, which compress well. The differences are between integers, so
+    the filter is lossless.
+    """
+    values = np.ascontiguousarray(values, dtype="<f4")
+    if compression_filter == DELTA:
+        bit_patterns = values.view("<u4")
+        differences = bit_patterns.copy()
+        np.subtract(bit_patterns[:, 1:], bit_patterns[:, :-1], out=differences[:, 1:])
+        data = _shuffle_bytes(differences)
+    elif compression_filter == SHUFFLE:
+        data = _shuffle_bytes(values)
+    else:
+        data = values.tobytes()
+
+    if codec == ZLIB:
+        return zlib.compress(data)
+    if codec == LZMA:
+        return lzma.compress(data)
+    raise ValueError(f"The compression codec {codec} is not supported.")
+
+
+def decode_tile(data: bytes, number_simulations: int, number_time_steps: int, codec: str,
+                compression_filter: str = None) -> np.ndarray:
+    """
+    Decompresses and decodes the values in a tile.
+    Args:
+        data: The compressed bytes for the tile.
+        number_simulations: The number of simulations in the tile.
+        number_time_steps: The number of time steps in the tile.
+        codec: The compression codec (e.g. 'zlib', 'lzma').
+        compression_filter: (Optional) The filter applied to the values before they were compressed (e.g. 'shuffle',
+                            'delta').
+
+    Returns:
+        An array with dimension (number simulations x number time steps) containing the single precision values.
+    """
+    if codec == ZLIB:
+        data = zlib.decompress(data)
+    elif codec == LZMA:
+        data = lzma.decompress(data)
+    else:
+        raise ValueError(f"The compression codec {codec} is not supported.")
+
+    if compression_filter == DELTA:
+        differences = _unshuffle_bytes(data).reshape(number_simulations, number_time_steps)
+        bit_patterns = np.cumsum(differences, axis=1, dtype="<u4")  # Integer overflow reverses the subtraction
+        return bit_patterns.view("<f4")
+    if compression_filter == SHUFFLE:
+        return _unshuffle_bytes(data).view("<f4").reshape(number_simulations, number_time_steps)
+    return np.frombuffer(data, dtype="<f4").reshape(number_simulations, number_time_steps)
@@ -0,0 +1,82 @@
+import numpy as np
+import struct
+
+from typing import Dict
+
+# The original (version 1) pyESG file starts with the time the file was saved as a 64-bit little-endian Unix timestamp,
+# so its eighth byte is zero for any realistic time. Later versions start with a magic number whose eighth byte is
+# non-zero, which is how readers tell the versions apart.
+MAGIC = b"\x89PYESG\r\n"
+CONTIGUOUS_FORMAT_VERSION = 1
+TILED_FORMAT_VERSION = 2
+
+# The fields at the start of the header which are common to all versions, after the magic number and format version
+# for later versions. They are followed by the output ids (each as a 16-bit length followed by the UTF-8 encoded id)
+# and the dates of the time steps (each as a 64-bit Unix timestamp).
+HEADER_FIELDS = struct.Struct("<IIIf")
+STRING_LENGTH = struct.Struct("<H")
+TIMESTAMP = struct.Struct("<Q")
+
+# The maximum number of simulations and time steps in each tile, which ends the header for the tiled format.
+TILE_SHAPE = struct.Struct("<II")
+
+# The fixed part of the header for the tiled format: the magic number, the format version, flags (currently unused)
+# and the time the file was saved. It is followed by the same fields as the header for the contiguous format.
+TILED_HEADER_PREFIX = struct.Struct("<8sIIQ")
+TIME_SAVED_POSITION_TILED = 16
+
+# The last bytes of a tiled file contain the position of the footer followed by the magic number.
+TRAILER = struct.Struct("<Q8s")
+
+# Each footer section starts with a 4 byte tag and the length of its contents in bytes.
+SECTION_HEADER = struct.Struct("<4sQ")
+TILE_INDEX_SECTION = b"TIDX"
+COMPRESSION_SECTION = b"COMP"  # The ids of the compression codec and filter, if tiles are compressed
+COMPRESSION = struct.Struct("<II")
+STATISTICS_SECTION = b"STAT"  # Summary statistics for each output and time step
+
+# Each tile holds a block of consecutive simulations and consecutive time steps for one output. The values in a tile are
+# stored by simulation then time step.
+TILE_INDEX_DTYPE = np.dtype([
+    ("output", "<u4"),
+    ("first_simulation", "<u4"),
+    ("number_simulations", "<u4"),
+    ("first_time_step", "<u4"),
+    ("number_time_steps", "<u4"),
+    ("position", "<u8"),
+    ("size", "<u8"),
+])
+
+
+def encode_footer(sections: Dict[bytes, bytes], footer_position: int) -> bytes:
+    """
+    Encodes the footer of a tiled pyESG file.
+    Args:
+        sections: The contents of each footer section, keyed by the tag of the section.
+        footer_position: The position in the file at which the footer is written.
+
+    Returns:
+        The bytes of the footer, including the trailer which ends the file.
+    """
+    footer = [SECTION_HEADER.pack(tag, len(contents)) + contents for tag, contents in sections.items()]
+    footer.append(TRAILER.pack(footer_position, MAGIC))
+    return b"".join(footer)
+
+
+def decode_footer(footer: bytes) -> Dict[bytes, bytes]:
+    """
+    Decodes the sections of the footer of a tiled pyESG file.
+    Args:
+        footer: The bytes of the footer, excluding the trailer.
+
+    Returns:
+        The contents of each footer section, keyed by the tag of the section.
+    """
+    sections = {}
+    position = 0
+    while position < len(footer):
+        tag, length = SECTION_HEADER.unpack_from(footer, position)
+        position += SECTION_HEADER.size
+        sections[tag] = footer[position:position + length]
+        position += length
+    return sections
@@ -0,0 +1,89 @@
+import json
+import os
+
+from typing import Iterator, Tuple
+
+
+class BatchJournal:
+    """
+    Journal of the batches which have been written to a pyESG file, kept alongside the file while it is written.
+
+    The journal is a text file with one JSON record on each line. The first record describes the file being written and
+    each later record describes a batch which has been completely written. Records are flushed to disk as they are
+    added, so the journal of a run which was interrupted lists the batches which do not need to be generated again.
+    Args:
+        file_path: The path of the journal file.
+    """
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def exists(self) -> bool:
+        """
+        Returns:
+            Whether the journal file exists.
+        """
+        return os.path.exists(self.file_path)
+
+    def create(self, header: dict):
+        """
+        Creates the journal file, replacing any existing journal, with the record describing the file being written.
+        Args:
+            header: The record describing the file being written.
+        """
+        with open(self.file_path, "w") as journal_file:
+            self._write_record(journal_file, header)
+
+    def append(self, record: dict):
+        """
+        Adds the record for a batch which has been written to the journal.
+        Args:
+            record: The record for the batch.
+        """
+        with open(self.file_path, "a") as journal_file:
+            self._write_record(journal_file, record)
+
+    @staticmethod
+    def _write_record(journal_file, record: dict):
+        """
+        Writes a record to the journal file and flushes it to disk.
+        """
+        journal_file.write(json.dumps(record, sort_keys=True) + "\n")
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+
+    def read(self) -> Tuple[dict, Iterator[dict]]:
+        """
+        Reads the journal.
+        Returns:
+            A tuple of the form (header, records) containing the record describing the file being written and an
+            iterator over the records for the batches which have been written.
+
+        The records are read one at a time as they are iterated over, so the whole journal is not held in memory. The
+        last line is ignored if it is incomplete, which happens if the run was interrupted while adding it.
+        """
+        records = self._read_records()
+        header = next(records, None)
+        if header is None:
+            raise ValueError(f"The journal {self.file_path} is empty.")
+        return header, records
+
+    def _read_records(self) -> Iterator[dict]:
+        """
+        Reads the records in the journal file one line at a time, stopping at the first incomplete line.
+        """
+        with open(self.file_path) as journal_file:
+            for line in journal_file:
+                if not line.endswith("\n"):
+                    return
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    return
+                yield record
+
+    def delete(self):
+        """
+        Deletes the journal file if it exists.
+        """
+        if self.exists():
+            os.remove(self.file_path)
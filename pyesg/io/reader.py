@@ -1,37 +1,146 @@
-import io
 import numpy as np
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
 
-from binaryio.open import open_binary, BinaryReader
 from datetime import datetime
-from typing import List, Union
+from typing import List, Sequence, Tuple, Union
+
+from pyesg.constants.file_layouts import CONTIGUOUS, TILED
+from pyesg.io.compression import CODEC_IDS, FILTER_IDS, decode_tile
+from pyesg.io.file_format import MAGIC, TILED_FORMAT_VERSION, TILED_HEADER_PREFIX, HEADER_FIELDS, STRING_LENGTH, \
+    TIMESTAMP, TILE_SHAPE, TILE_INDEX_DTYPE, TILE_INDEX_SECTION, COMPRESSION, COMPRESSION_SECTION, \
+    STATISTICS_SECTION, TRAILER, decode_footer
+from pyesg.io.summary_statistics import OutputSummary, SummaryStatistics
 
 
 class PyESGReader:
     """
     Contains functionality to read a PyESG binary file.
+
+    Files with the contiguous layout and the tiled layout are both read, and the layout is detected from the file.
+    Args:
+        file_path: The path of the PyESG binary file.
+        memory_map: (Optional) Whether to memory map the simulations in the file. If True, simulations are returned as
+                    read-only single precision views of the file rather than being read into memory, so nothing is
+                    copied and processes reading the same file share the operating system's page cache. Defaults to
+                    False. For files with the tiled layout, the values in each tile are read from the memory map but
+                    the simulations returned are single precision copies, because they span several tiles.
+
+    After the reader is created, simulations are only read with positional reads (or from the memory map), which do not
+    depend on a shared file position, so a single reader can be used by several threads at once.
     """
     size_of_float = 4  # Number of bytes for a float (single-precision)
-    def __init__(self, file_path: str):
-        self._reader = open_binary(file_path, 'rb', endianness="<")  # type: BinaryReader
-        self._reader.__enter__()
-        
-        self._time_saved = datetime.fromtimestamp(self._reader.read_uint64())
-        self._number_sims = self._reader.read_uint32()
-        self._number_outputs = self._reader.read_uint32()
-        self._number_steps = self._reader.read_uint32()
-        self._annualisation_factor = self._reader.read_single()
-        self._output_ids = [self._reader.read_length_prefixed_string() for _ in range(self._number_outputs)]
-        self._time_step_dates = [datetime.fromtimestamp(self._reader.read_uint64()) for _ in range(self._number_steps)]
-        self._header_end_position = self._reader.tell()
+    read_block_size = 16 * 1024 * 1024  # Number of bytes to read at once when extracting time steps
+    header_read_size = 1024 * 1024  # Number of bytes to read at once when reading the header
+    read_gap_size = 64 * 1024  # Maximum number of unneeded bytes between simulations to read rather than skip
+    def __init__(self, file_path: str, memory_map: bool = False):
+        self._data_file = open(file_path, 'rb')
+        self._file_lock = threading.Lock()  # Only used on platforms without positional reads
+        self._read_header()
+
+        self._result_dtype = np.float32 if memory_map else np.float64
+        self._simulations_map = None  # type: np.memmap
+        self._file_map = None  # type: np.memmap
+        if self._layout == TILED and memory_map:
+            self._file_map = np.memmap(file_path, dtype=np.uint8, mode="r")
+        self._read_footer()
+        self._summary_statistics = None  # type: SummaryStatistics
+        if self._layout == TILED:
+            self._read_tile_index()
+        elif memory_map:
+            # Simulations are stored output by output, each with all simulations and all time steps for a simulation.
+            self._simulations_map = np.memmap(
+                file_path, dtype="<f4", mode="r", offset=self._get_seek_position_for_output(0),
+                shape=(self._number_outputs, self._number_sims, self._number_steps)
+            )
+
+    def _read_header(self):
+        """
+        Reads the header of the file.
+
+        The header is read in as few reads as possible and decoded from memory. The dates of the time steps are only
+        converted to `datetime` objects when they are first needed.
+        """
+        header = self._data_file.read(self.header_read_size)
+
+        def ensure_header_read_to(position: int):
+            nonlocal header
+            if len(header) < position:
+                header += self._data_file.read(position - len(header) + self.header_read_size)
+
+        # Files with the tiled layout start with a magic number followed by the format version. Files with the
+        # contiguous layout start with the time the file was saved.
+        ensure_header_read_to(TILED_HEADER_PREFIX.size + HEADER_FIELDS.size)
+        magic, version, _, time_saved = TILED_HEADER_PREFIX.unpack_from(header)
+        if magic == MAGIC:
+            if version != TILED_FORMAT_VERSION:
+                raise ValueError(f"Version {version} of the pyESG file format is not supported.")
+            self._layout = TILED
+            position = TILED_HEADER_PREFIX.size
+        else:
+            self._layout = CONTIGUOUS
+            time_saved, = TIMESTAMP.unpack_from(header)
+            position = TIMESTAMP.size
+
+        self._time_saved = datetime.fromtimestamp(time_saved)
+        self._number_sims, self._number_outputs, self._number_steps, self._annualisation_factor = \
+            HEADER_FIELDS.unpack_from(header, position)
+        position += HEADER_FIELDS.size
+
+        self._output_ids = []  # type: List[str]
+        for _ in range(self._number_outputs):
+            ensure_header_read_to(position + STRING_LENGTH.size)
+            length, = STRING_LENGTH.unpack_from(header, position)
+            position += STRING_LENGTH.size
+            ensure_header_read_to(position + length)
+            self._output_ids.append(header[position:position + length].decode("utf-8"))
+            position += length
+        self._output_indices = {output_id: i for i, output_id in enumerate(self._output_ids)}
+
+        dates_size = self._number_steps * TIMESTAMP.size
+        ensure_header_read_to(position + dates_size + TILE_SHAPE.size)
+        self._time_step_timestamps = np.frombuffer(header, dtype="<u8", count=self._number_steps, offset=position)
+        self._time_step_dates = None  # type: List[datetime]
+        self._time_step_dates_datetime64 = None  # type: np.ndarray
+        position += dates_size
+
+        if self._layout == TILED:
+            self._tile_number_of_simulations, self._tile_number_of_time_steps = TILE_SHAPE.unpack_from(header, position)
+            position += TILE_SHAPE.size
+        self._header_end_position = position
 
     def close(self) -> None:
         """
         Closes the PyESG file opened by the reader.
 
-        This should be called when you have finished reading the file to ensure the file does not remain open.
+        This should be called when you have finished reading the file to ensure the file does not remain open. If the
+        file is memory mapped, arrays already returned by the reader remain valid and the mapping is only released once
+        they are no longer used.
         """
-        self._reader.close()
+        self._data_file.close()
+        self._simulations_map = None
+        self._file_map = None
         
+    @property
+    def layout(self) -> str:
+        """
+        Returns the layout of simulations in the file.
+        Returns:
+            The layout of simulations in the file (e.g. 'contiguous', 'tiled').
+        """
+        return self._layout
+
+    @property
+    def compression(self) -> str:
+        """
+        Returns the codec with which the simulations in the file are compressed.
+        Returns:
+            The compression codec (e.g. 'zlib', 'lzma'), or None if the simulations are not compressed.
+        """
+        return self._compression if self._layout == TILED else None
+
     @property
     def time_saved(self) -> datetime:
         """
@@ -95,10 +204,27 @@ class PyESGReader:
         Returns:
             The dates for all time steps in the file.
 
-        This includes the initial time step as well as all projection time steps.
+        This includes the initial time step as well as all projection time steps. The dates are converted from the
+        timestamps in the file the first time they are needed.
         """
+        if self._time_step_dates is None:
+            self._time_step_dates = [datetime.fromtimestamp(timestamp)
+                                     for timestamp in self._time_step_timestamps.tolist()]
         return self._time_step_dates
 
+    @property
+    def time_step_dates_datetime64(self) -> np.ndarray:
+        """
+        Returns the dates for all time steps in the file as a Numpy array.
+        Returns:
+            An array of `datetime64` values containing the dates for all time steps in the file.
+
+        The dates are the same (local) dates as those returned by `time_step_dates`.
+        """
+        if self._time_step_dates_datetime64 is None:
+            self._time_step_dates_datetime64 = np.array(self.time_step_dates, dtype="datetime64[s]")
+        return self._time_step_dates_datetime64
+
     @property
     def projection_dates(self) -> List[datetime]:
         """
@@ -106,7 +232,7 @@ class PyESGReader:
         Returns:
             The dates for all projection time steps in the file.
         """
-        return self._time_step_dates[1:]
+        return self.time_step_dates[1:]
 
     @property
     def annualisation_factor(self) -> float:
@@ -118,6 +244,137 @@ class PyESGReader:
         return self._annualisation_factor
 
 
+    def _read_footer(self):
+        """
+        Reads the sections of the footer at the end of the file.
+
+        Files with the tiled layout always have a footer. Files with the contiguous layout only have a footer (after the
+        simulations) if it was written with summary statistics.
+        """
+        self._footer_sections = {}
+        file_size = os.fstat(self._data_file.fileno()).st_size
+        if self._layout == TILED:
+            has_footer = file_size >= self._header_end_position + TRAILER.size
+        else:
+            has_footer = file_size >= self._get_seek_position_for_output(self._number_outputs) + TRAILER.size
+        if has_footer:
+            footer_position, magic = TRAILER.unpack(bytes(self._read_at(file_size - TRAILER.size, TRAILER.size)))
+            has_footer = magic == MAGIC
+        if not has_footer:
+            if self._layout == TILED:
+                raise ValueError("The pyESG file is incomplete. It may not have been finalised.")
+            return
+
+        self._footer_sections = decode_footer(
+            bytes(self._read_at(footer_position, file_size - TRAILER.size - footer_position))
+        )
+
+    def _read_tile_index(self):
+        """
+        Reads the tile index from the footer of a file with the tiled layout.
+        """
+        sections = self._footer_sections
+        self._tile_index = np.frombuffer(sections[TILE_INDEX_SECTION], dtype=TILE_INDEX_DTYPE)
+        # Tiles are sorted by output, so the tiles for each output are a slice of the index.
+        self._tile_index_bounds = np.searchsorted(self._tile_index["output"], np.arange(self._number_outputs + 1))
+
+        self._compression = None
+        self._compression_filter = None
+        if COMPRESSION_SECTION in sections:
+            codec_id, filter_id = COMPRESSION.unpack(sections[COMPRESSION_SECTION])
+            self._compression = next(codec for codec, i in CODEC_IDS.items() if i == codec_id)
+            self._compression_filter = next(f for f, i in FILTER_IDS.items() if i == filter_id)
+
+    def _read_at(self, position: int, size: int) -> bytes:
+        """
+        Reads bytes from a specific position in the file.
+        Args:
+            position: The position in the file at which to start reading.
+            size: The number of bytes to read.
+
+        Returns:
+            The bytes read (or a read-only array of bytes if the file is memory mapped).
+        """
+        if self._file_map is not None:
+            return self._file_map[position:position + size]
+        data = bytearray(size)
+        self._read_into(data, position)
+        return data
+
+    def _read_into(self, buffer: Union[bytearray, np.ndarray], position: int):
+        """
+        Reads bytes from a specific position in the file into a buffer, filling the buffer.
+        Args:
+            buffer: The buffer (e.g. a contiguous Numpy array) into which to read.
+            position: The position in the file at which to start reading.
+
+        The bytes are read with positional reads, so reads from several threads do not interfere with each other. On
+        platforms without positional reads, the file position is moved under a lock instead.
+        """
+        view = memoryview(buffer).cast("B")
+        file_descriptor = self._data_file.fileno()
+        while view.nbytes > 0:
+            if hasattr(os, "preadv"):
+                size_read = os.preadv(file_descriptor, [view], position)
+            else:
+                with self._file_lock:
+                    self._data_file.seek(position)
+                    size_read = self._data_file.readinto(view)
+            if not size_read:
+                raise ValueError("The pyESG file ended unexpectedly. It may be incomplete.")
+            view = view[size_read:]
+            position += size_read
+
+    def _read_tiles(self, output_index: int, first_simulation: int, number_simulations: int,
+                    time_steps: Sequence[int]) -> np.ndarray:
+        """
+        Reads simulations for a single output from a file with the tiled layout.
+        Args:
+            output_index: The index of the output id in the list of output ids.
+            first_simulation: The (zero-indexed) first simulation to read.
+            number_simulations: The number of consecutive simulations to read.
+            time_steps: The time steps to read.
+
+        Returns:
+            An array with shape (number_simulations, number of time steps) containing the simulations.
+
+        Only the tiles containing the requested simulations and time steps are read. Within each tile, only the rows for
+        the requested simulations are read, because the values for each simulation in a tile are contiguous. Compressed
+        tiles are read and decompressed in full.
+        """
+        time_steps = np.asarray(time_steps, dtype=np.int64)
+        last_simulation = first_simulation + number_simulations
+        simulations = np.zeros([number_simulations, len(time_steps)], dtype=self._result_dtype)
+
+        tiles = self._tile_index[self._tile_index_bounds[output_index]:self._tile_index_bounds[output_index + 1]]
+        tile_last_simulations = tiles["first_simulation"].astype(np.int64) + tiles["number_simulations"]
+        tiles = tiles[(tiles["first_simulation"] < last_simulation) & (tile_last_simulations > first_simulation)]
+
+        for tile in tiles:
+            tile_first_step, tile_number_steps = int(tile["first_time_step"]), int(tile["number_time_steps"])
+            tile_last_step = tile_first_step + tile_number_steps
+            columns = np.flatnonzero((time_steps >= tile_first_step) & (time_steps < tile_last_step))
+            if columns.size == 0:
+                continue
+
+            tile_first_sim = int(tile["first_simulation"])
+            first_row = max(first_simulation, tile_first_sim) - tile_first_sim
+            last_row = min(last_simulation, tile_first_sim + int(tile["number_simulations"])) - tile_first_sim
+            if self._compression is not None:
+                values = decode_tile(self._read_at(int(tile["position"]), int(tile["size"])),
+                                     int(tile["number_simulations"]), tile_number_steps, self._compression,
+                                     self._compression_filter)[first_row:last_row]
+            else:
+                row_size = tile_number_steps * self.size_of_float
+                values = np.frombuffer(self._read_at(int(tile["position"]) + first_row * row_size,
+                                                     (last_row - first_row) * row_size), dtype="<f4")
+                values = values.reshape(last_row - first_row, tile_number_steps)
+
+            result_rows = slice(tile_first_sim + first_row - first_simulation,
+                                tile_first_sim + last_row - first_simulation)
+            simulations[result_rows, columns] = values[:, time_steps[columns] - tile_first_step]
+        return simulations
+
     def _get_seek_position_for_output(self, output_index: int) -> int:
         """
         Returns the position to seek to in the binary file for the start of simulations for an output.
@@ -143,9 +400,9 @@ class PyESGReader:
             raise TypeError("The `output` argument must be str or int.")
 
         if isinstance(output, str):
-            if not output in self._output_ids:
-                raise ValueError("The output {output} does not exist in the file.")
-            output_index = self._output_ids.index(output)
+            output_index = self._output_indices.get(output)
+            if output_index is None:
+                raise ValueError(f"The output {output} does not exist in the file.")
         else:
             if not 0 <= output < len(self._output_ids):
                 raise ValueError(f"The output index must satisfy 0 <= number < {len(self._output_ids)}")
@@ -161,14 +418,19 @@ class PyESGReader:
         Returns:
             All simulations for all time steps for the specified output.
 
-        The array returned has shape (number_simulations, number_time_steps) and includes the initial time step.
+        The array returned has shape (number_simulations, number_time_steps) and includes the initial time step. If the
+        file is memory mapped, the array is a read-only single precision view of the file.
         """
         output_index = self._get_output_index(output)
-        # Seek to start of output
-        self._reader.seek(self._get_seek_position_for_output(output_index))
+        if self._layout == TILED:
+            return self._read_tiles(output_index, 0, self._number_sims, range(self._number_steps))
+        if self._simulations_map is not None:
+            return self._simulations_map[output_index]
+
         # Read all simulations into a numpy array. They are flattened before storage
-        size_of_flattened_array = self._number_sims * self._number_steps
-        return np.array(self._reader.read_singles(size_of_flattened_array)).reshape(self._number_sims, self._number_steps)
+        simulations = np.empty(self._number_sims * self._number_steps, dtype="<f4")
+        self._read_into(simulations, self._get_seek_position_for_output(output_index))
+        return simulations.astype(self._result_dtype).reshape(self._number_sims, self._number_steps)
 
 
     def get_output_simulations_for_single_time_step(self, output: Union[str, int], time_step: int) -> np.ndarray:
@@ -181,7 +443,8 @@ class PyESGReader:
         Returns:
             All simulations for the specified time step and output.
 
-        The time step should be specified such that 0 is interpreted as the initial step.
+        The time step should be specified such that 0 is interpreted as the initial step. If the file is memory mapped,
+        the array is a read-only single precision (strided) view of the file.
         """
         if not isinstance(time_step, int):
             raise TypeError("The `time_step` argument must be an int.")
@@ -190,23 +453,64 @@ class PyESGReader:
             raise ValueError(f"The time step must satisfy 0 <= number < {self._number_steps}")
 
         output_index = self._get_output_index(output)
-        simulations = np.zeros(self._number_sims)
+        if self._layout == TILED:
+            return self._read_tiles(output_index, 0, self._number_sims, [time_step])[:, 0]
+        if self._simulations_map is not None:
+            return self._simulations_map[output_index, :, time_step]
+        return self._read_time_steps(output_index, [time_step])[:, 0]
+
+    def get_output_simulations_for_time_steps(self, output: Union[str, int],
+                                              time_steps: Sequence[int]) -> np.ndarray:
+        """
+        Returns all simulations for several time steps for a single output.
+        Args:
+            output: The id of the output or the index of the output id in the list of output ids.
+            time_steps: The time steps for which simulations are to be extracted (e.g. a list or a range).
 
-        # Seek to start of output and then to position of first simulation for the time step
-        position_first_sim = self._get_seek_position_for_output(output_index) + time_step * self.size_of_float
-        self._reader.seek(position_first_sim)
+        Returns:
+            All simulations for the specified time steps and output. The array has shape
+            (number_simulations, number of time steps specified), with the columns in the order of `time_steps`.
 
-        # Calculate number of bytes between consecutive simulations for the same time step
-        bytes_between_sims = (self._number_steps - 1) * self.size_of_float
+        The time steps should be specified such that 0 is interpreted as the initial step.
+        """
+        time_steps = list(time_steps)
+        if not all(isinstance(time_step, (int, np.integer)) for time_step in time_steps):
+            raise TypeError("The `time_steps` argument must only contain ints.")
+
+        if not all(0 <= time_step < self._number_steps for time_step in time_steps):
+            raise ValueError(f"Each time step must satisfy 0 <= number < {self._number_steps}")
+
+        output_index = self._get_output_index(output)
+        if self._layout == TILED:
+            return self._read_tiles(output_index, 0, self._number_sims, time_steps)
+        if self._simulations_map is not None:
+            return self._simulations_map[output_index][:, time_steps]
+        return self._read_time_steps(output_index, time_steps)
 
-        # We can only do number_sims - 1 in the for loop because we don't want to seek further after the last sim
-        for i in range(self._number_sims - 1):
-            simulations[i] = self._reader.read_single()
-            self._reader.seek(bytes_between_sims, io.SEEK_CUR)
+    def _read_time_steps(self, output_index: int, time_steps: List[int]) -> np.ndarray:
+        """
+        Reads all simulations for several time steps for a single output from the file.
+        Args:
+            output_index: The index of the output id in the list of output ids.
+            time_steps: The time steps to read.
 
-        # At this point we have seeked to the position of last sim. So now just get last sim.
-        simulations[-1] = self._reader.read_single()
+        Returns:
+            An array with shape (number_simulations, number of time steps) containing the simulations.
 
+        The values for a time step are spread throughout the output (one value for each simulation), so the output is
+        read in large contiguous blocks of whole simulations and the time steps are extracted from each block with
+        Numpy indexing. This avoids reading each value separately.
+        """
+        simulations = np.zeros([self._number_sims, len(time_steps)])
+        simulations_per_block = max(1, self.read_block_size // (self._number_steps * self.size_of_float))
+        block = np.empty([min(simulations_per_block, self._number_sims), self._number_steps], dtype="<f4")
+
+        output_position = self._get_seek_position_for_output(output_index)
+        for first_sim in range(0, self._number_sims, simulations_per_block):
+            number_sims_in_block = min(simulations_per_block, self._number_sims - first_sim)
+            self._read_into(block[:number_sims_in_block],
+                            output_position + first_sim * self._number_steps * self.size_of_float)
+            simulations[first_sim:first_sim + number_sims_in_block, :] = block[:number_sims_in_block, time_steps]
         return simulations
 
     def get_output_simulations_for_single_simulation(self, output: Union[str, int], simulation_number: int) -> np.ndarray:
@@ -227,9 +531,183 @@ class PyESGReader:
         if not 1 <= simulation_number <= self._number_sims:
             raise ValueError(f"The simulation number must satisfy 1 <= number <= {self._number_sims}")
 
-        # Seek to start of output and then to position of first step in simulation
         output_index = self._get_output_index(output)
+        if self._layout == TILED:
+            return self._read_tiles(output_index, simulation_number - 1, 1, range(self._number_steps))[0]
+        if self._simulations_map is not None:
+            return self._simulations_map[output_index, simulation_number - 1]
+
+        # Position of the start of the output and then of the first step in the simulation
         position_first_step = self._get_seek_position_for_output(output_index) \
                               + (simulation_number - 1) * self._number_steps * self.size_of_float
-        self._reader.seek(position_first_step)
-        return np.array(self._reader.read_singles(self._number_steps))
+        simulations = np.empty(self._number_steps, dtype="<f4")
+        self._read_into(simulations, position_first_step)
+        return simulations.astype(self._result_dtype)
+
+    def read(self, outputs: Union[str, int, Sequence[Union[str, int]]] = None,
+             sims: Union[slice, Sequence[int]] = None, steps: Union[slice, Sequence[int]] = None) -> np.ndarray:
+        """
+        Returns simulations for several outputs, restricted to a selection of simulations and time steps.
+        Args:
+            outputs: (Optional) The id or index of an output, or a list of them. Defaults to all outputs.
+            sims: (Optional) The (zero-indexed) simulations to read, as a slice or a list of indices. Defaults to all
+                  simulations.
+            steps: (Optional) The time steps to read, as a slice or a list of time steps, where 0 is the initial time
+                   step. Defaults to all time steps.
+
+        Returns:
+            An array with shape (number of outputs, number of simulations, number of time steps) containing the
+            simulations, in the order in which the outputs, simulations and time steps are specified.
+
+        Only the parts of the file which contain the selected simulations and time steps are read. The selected
+        simulations are grouped into ranges of nearby simulations, which are each read at once, and outputs are read
+        in the order in which they are stored in the file.
+        """
+        if outputs is None:
+            output_indices = list(range(self._number_outputs))
+        elif isinstance(outputs, (str, int)):
+            output_indices = [self._get_output_index(outputs)]
+        else:
+            output_indices = [self._get_output_index(output) for output in outputs]
+        simulation_indices = self._get_selected_indices(sims, self._number_sims, "sims")
+        time_steps = self._get_selected_indices(steps, self._number_steps, "steps")
+
+        result = np.zeros([len(output_indices), len(simulation_indices), len(time_steps)], dtype=self._result_dtype)
+        if result.size == 0:
+            return result
+
+        # Simulations are read in ascending order, without repeats, and then arranged in the order specified.
+        unique_simulations, result_rows = np.unique(simulation_indices, return_inverse=True)
+        simulation_ranges = self._get_simulation_ranges(unique_simulations)
+        for i_result in sorted(range(len(output_indices)), key=lambda i: output_indices[i]):
+            output_index = output_indices[i_result]
+            if self._simulations_map is not None:
+                result[i_result] = self._simulations_map[output_index][simulation_indices][:, time_steps]
+                continue
+
+            values = np.zeros([len(unique_simulations), len(time_steps)], dtype=self._result_dtype)
+            for first_simulation, last_simulation in simulation_ranges:
+                first_row, last_row = np.searchsorted(unique_simulations, [first_simulation, last_simulation])
+                block = self._read_simulation_range(output_index, first_simulation, last_simulation, time_steps)
+                values[first_row:last_row] = block[unique_simulations[first_row:last_row] - first_simulation]
+            result[i_result] = values[result_rows]
+        return result
+
+    def read_many(self, outputs: Sequence[Union[str, int]], max_workers: int = None) -> List[np.ndarray]:
+        """
+        Returns all simulations for all time steps for several outputs, reading the outputs in parallel.
+        Args:
+            outputs: The ids of the outputs or the indices of the output ids in the list of output ids.
+            max_workers: (Optional) The maximum number of threads which read outputs at once. Defaults to the default
+                         for `concurrent.futures.ThreadPoolExecutor`.
+
+        Returns:
+            A list containing the simulations for each output, in the order of `outputs`, as returned by
+            `get_output_simulations`.
+
+        Reading several outputs at once keeps more reads in flight, which helps to use the full bandwidth of fast
+        (e.g. NVMe) or network storage. Positional reads release the GIL while they wait.
+        """
+        output_indices = [self._get_output_index(output) for output in outputs]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.get_output_simulations, output_indices))
+
+    @staticmethod
+    def _get_selected_indices(selection: Union[slice, Sequence[int]], length: int, name: str) -> np.ndarray:
+        """
+        Returns the indices selected by a slice or a list of indices.
+        Args:
+            selection: A slice, a list of indices or None to select all indices.
+            length: The number of indices which can be selected.
+            name: The name of the argument, for error messages.
+
+        Returns:
+            An array of the selected indices.
+        """
+        if selection is None:
+            return np.arange(length)
+        if isinstance(selection, slice):
+            return np.arange(*selection.indices(length))
+
+        indices = np.asarray(selection)
+        if indices.ndim != 1 or (indices.size > 0 and not np.issubdtype(indices.dtype, np.integer)):
+            raise TypeError(f"The `{name}` argument must be a slice or a list of ints.")
+        if not np.all((indices >= 0) & (indices < length)):
+            raise ValueError(f"Each index in `{name}` must satisfy 0 <= number < {length}")
+        return indices.astype(np.int64)
+
+    def _get_simulation_ranges(self, simulations: np.ndarray) -> List[Tuple[int, int]]:
+        """
+        Groups simulations into ranges of consecutive simulations, each of which is read at once.
+        Args:
+            simulations: The (zero-indexed) simulations to read, in ascending order without repeats.
+
+        Returns:
+            A list of the first simulation and the simulation after the last simulation of each range, in ascending
+            order.
+
+        Simulations which are separated by fewer than `read_gap_size` bytes are put in the same range, because reading
+        the simulations in between is cheaper than a separate read. Ranges are no larger than `read_block_size` bytes.
+        """
+        simulation_size = self._number_steps * self.size_of_float
+        max_gap = self.read_gap_size // simulation_size
+        max_range = max(1, self.read_block_size // simulation_size)
+
+        gaps = np.flatnonzero(np.diff(simulations) > max_gap + 1) + 1
+        ranges = []
+        for first_simulation, last_simulation in zip(simulations[np.r_[0, gaps]], simulations[np.r_[gaps - 1, -1]] + 1):
+            ranges.extend((int(first), int(min(first + max_range, last_simulation)))
+                          for first in range(first_simulation, last_simulation, max_range))
+        return ranges
+
+    def _read_simulation_range(self, output_index: int, first_simulation: int, last_simulation: int,
+                               time_steps: np.ndarray) -> np.ndarray:
+        """
+        Reads a range of consecutive simulations for several time steps for a single output.
+        Args:
+            output_index: The index of the output id in the list of output ids.
+            first_simulation: The (zero-indexed) first simulation to read.
+            last_simulation: The simulation after the last simulation to read.
+            time_steps: The time steps to read.
+
+        Returns:
+            An array with shape (number of simulations, number of time steps) containing the simulations.
+
+        For the contiguous layout, the values from the first time step of the first simulation to the last time step of
+        the last simulation are read at once, so a single simulation only reads the time steps required.
+        """
+        number_simulations = last_simulation - first_simulation
+        if self._layout == TILED:
+            return self._read_tiles(output_index, first_simulation, number_simulations, time_steps)
+
+        first_step, last_step = int(time_steps.min()), int(time_steps.max()) + 1
+        start = first_simulation * self._number_steps + first_step
+        count = (number_simulations - 1) * self._number_steps + last_step - first_step
+        position = self._get_seek_position_for_output(output_index) + start * self.size_of_float
+
+        values = np.empty(number_simulations * self._number_steps, dtype="<f4")
+        if self._file_map is not None:
+            values[first_step:first_step + count] = np.frombuffer(self._read_at(position, count * self.size_of_float),
+                                                                  dtype="<f4")
+        else:
+            self._read_into(values[first_step:first_step + count], position)
+        return values.reshape(number_simulations, self._number_steps)[:, time_steps]
+
+    def get_output_summary(self, output: Union[str, int]) -> OutputSummary:
+        """
+        Returns the summary statistics of the simulations for a single output for each time step.
+
+        The summary statistics are calculated while the file is generated and stored in its footer, so they are
+        returned without reading any simulations.
+        Args:
+            output: The id of the output or the index of the output id in the list of output ids.
+
+        Returns:
+            The summary statistics (count, mean, variance, standard deviation, minimum and maximum) for each time step.
+        """
+        output_index = self._get_output_index(output)
+        if self._summary_statistics is None:
+            if STATISTICS_SECTION not in self._footer_sections:
+                raise ValueError("The pyESG file does not contain summary statistics.")
+            self._summary_statistics = SummaryStatistics.from_bytes(self._footer_sections[STATISTICS_SECTION])
+        return OutputSummary(self._summary_statistics, output_index)
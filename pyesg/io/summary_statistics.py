@@ -0,0 +1,197 @@
+import numpy as np
+import struct
+
+
+class SummaryStatistics:
+    """
+    Summary statistics of the simulations for each output and time step.
+
+    The statistics for separate groups of simulations (e.g. batches) can be merged without the simulations, using the
+    pairwise update of Chan et al. for the mean and sum of squared differences from the mean.
+    Attributes:
+        count (np.ndarray): The number of simulations for each output.
+        mean (np.ndarray): The mean of the simulations for each output and time step.
+        sum_squared_differences (np.ndarray): The sum of squared differences from the mean for each output and time
+                                              step.
+        minimum (np.ndarray): The minimum of the simulations for each output and time step.
+        maximum (np.ndarray): The maximum of the simulations for each output and time step.
+
+    The arrays for each output and time step have dimension (number outputs x number time steps).
+    """
+    _version = 1
+    _header = struct.Struct("<III")  # Version, number of outputs and number of time steps
+
+    # The sum of squared differences is calculated for chunks of simulations in a double precision scratch array of at
+    # most this many values (or one simulation if that is larger), so that it does not need a copy of all simulations.
+    scratch_number_of_values = 65536
+
+    def __init__(self, count: np.ndarray, mean: np.ndarray, sum_squared_differences: np.ndarray,
+                 minimum: np.ndarray, maximum: np.ndarray):
+        self.count = count
+        self.mean = mean
+        self.sum_squared_differences = sum_squared_differences
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @classmethod
+    def empty(cls, number_outputs: int, number_time_steps: int) -> 'SummaryStatistics':
+        """
+        Returns the summary statistics for no simulations.
+        Args:
+            number_outputs: The number of outputs.
+            number_time_steps: The number of time steps.
+
+        Returns:
+            Summary statistics which leave other summary statistics unchanged when merged with them.
+        """
+        shape = (number_outputs, number_time_steps)
+        return cls(np.zeros(number_outputs, dtype=np.uint64), np.zeros(shape), np.zeros(shape),
+                   np.full(shape, np.inf), np.full(shape, -np.inf))
+
+    @classmethod
+    def from_simulations(cls, simulations: np.ndarray) -> 'SummaryStatistics':
+        """
+        Calculates the summary statistics for a group of simulations.
+        Args:
+            simulations: An array with dimension (number outputs x number simulations x number time steps).
+
+        Returns:
+            The summary statistics of the simulations, calculated in double precision.
+        """
+        number_outputs, _, number_time_steps = simulations.shape
+        statistics = cls.empty(number_outputs, number_time_steps)
+
+        # Each output is processed separately to limit the size of temporary arrays.
+        for i_output in range(number_outputs):
+            statistics.calculate_for_output(i_output, simulations[i_output, :, :])
+        return statistics
+
+    def calculate_for_output(self, output_index: int, output_sims: np.ndarray):
+        """
+        Calculates the summary statistics for a single output from a group of simulations, replacing any existing
+        statistics for the output.
+        Args:
+            output_index: The index of the output.
+            output_sims: An array with dimension (number simulations x number time steps) containing the simulations
+                         for the output.
+        """
+        number_simulations = output_sims.shape[0]
+        self.count[output_index] = number_simulations
+        if number_simulations == 0:
+            return
+
+        mean = np.mean(output_sims, axis=0, dtype=np.float64)
+        self.mean[output_index, :] = mean
+
+        sum_squared_differences = self.sum_squared_differences[output_index, :]
+        sum_squared_differences.fill(0.0)
+        chunk_number_of_simulations = self.get_scratch_shape(*output_sims.shape)[0]
+        scratch = np.empty([chunk_number_of_simulations, output_sims.shape[1]], dtype=np.float64)
+        for first_simulation in range(0, number_simulations, chunk_number_of_simulations):
+            chunk = output_sims[first_simulation:first_simulation + chunk_number_of_simulations, :]
+            differences = scratch[:chunk.shape[0], :]
+            np.subtract(chunk, mean, out=differences)
+            np.square(differences, out=differences)
+            sum_squared_differences += np.sum(differences, axis=0)
+
+        self.minimum[output_index, :] = np.min(output_sims, axis=0)
+        self.maximum[output_index, :] = np.max(output_sims, axis=0)
+
+    @classmethod
+    def get_scratch_shape(cls, number_simulations: int, number_time_steps: int) -> tuple:
+        """
+        Returns the shape of the scratch array used when calculating summary statistics for a single output.
+        Args:
+            number_simulations: The number of simulations.
+            number_time_steps: The number of time steps.
+
+        Returns:
+            A tuple of the form (number simulations in each chunk, number time steps). The scratch array holds double
+            precision values.
+        """
+        chunk_number_of_simulations = max(cls.scratch_number_of_values // max(number_time_steps, 1), 1)
+        return min(chunk_number_of_simulations, max(number_simulations, 1)), number_time_steps
+
+    def merge(self, other: 'SummaryStatistics') -> 'SummaryStatistics':
+        """
+        Merges these summary statistics with the summary statistics for another group of simulations.
+        Args:
+            other: The summary statistics for the other group of simulations.
+
+        Returns:
+            The summary statistics for both groups of simulations together.
+
+        Floating point results depend on the order in which groups are merged, so groups should always be merged in the
+        same order (e.g. by batch number) to get identical results.
+        """
+        count = self.count + other.count
+        count_self = self.count.astype(np.float64)[:, None]
+        count_other = other.count.astype(np.float64)[:, None]
+        count_total = np.maximum(count.astype(np.float64)[:, None], 1.0)  # Avoid dividing by zero for no simulations
+
+        delta = other.mean - self.mean
+        mean = self.mean + delta * (count_other / count_total)
+        sum_squared_differences = self.sum_squared_differences + other.sum_squared_differences \
+            + np.square(delta) * (count_self * count_other / count_total)
+        return SummaryStatistics(count, mean, sum_squared_differences, np.minimum(self.minimum, other.minimum),
+                                 np.maximum(self.maximum, other.maximum))
+
+    def to_bytes(self) -> bytes:
+        """
+        Encodes the summary statistics as bytes for storing in a pyESG file.
+        Returns:
+            The encoded summary statistics.
+        """
+        number_outputs, number_time_steps = self.mean.shape
+        return b"".join([
+            self._header.pack(self._version, number_outputs, number_time_steps),
+            self.count.astype("<u8").tobytes(),
+            self.mean.astype("<f8").tobytes(),
+            self.sum_squared_differences.astype("<f8").tobytes(),
+            self.minimum.astype("<f8").tobytes(),
+            self.maximum.astype("<f8").tobytes(),
+        ])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'SummaryStatistics':
+        """
+        Decodes summary statistics stored in a pyESG file.
+        Args:
+            data: The encoded summary statistics.
+
+        Returns:
+            The decoded summary statistics.
+        """
+        version, number_outputs, number_time_steps = cls._header.unpack_from(data)
+        if version != cls._version:
+            raise ValueError(f"Version {version} of the summary statistics is not supported.")
+
+        position = cls._header.size
+        count = np.frombuffer(data, dtype="<u8", count=number_outputs, offset=position)
+        position += count.nbytes
+        arrays = []
+        for _ in range(4):
+            array = np.frombuffer(data, dtype="<f8", count=number_outputs * number_time_steps, offset=position)
+            arrays.append(array.reshape(number_outputs, number_time_steps))
+            position += array.nbytes
+        return cls(count, *arrays)
+
+
+class OutputSummary:
+    """
+    Summary statistics of the simulations for a single output for each time step.
+    Attributes:
+        count (int): The number of simulations.
+        mean (np.ndarray): The mean of the simulations for each time step.
+        variance (np.ndarray): The (sample) variance of the simulations for each time step.
+        standard_deviation (np.ndarray): The (sample) standard deviation of the simulations for each time step.
+        minimum (np.ndarray): The minimum of the simulations for each time step.
+        maximum (np.ndarray): The maximum of the simulations for each time step.
+    """
+    def __init__(self, statistics: SummaryStatistics, output_index: int):
+        self.count = int(statistics.count[output_index])
+        self.mean = statistics.mean[output_index, :]
+        self.variance = statistics.sum_squared_differences[output_index, :] / max(self.count - 1, 1)
+        self.standard_deviation = np.sqrt(self.variance)
+        self.minimum = statistics.minimum[output_index, :]
+        self.maximum = statistics.maximum[output_index, :]
@@ -1,20 +1,91 @@
+import base64
+import hashlib
 import numpy as np
+import os
 
-from binaryio.open import open_binary, BinaryWriter
 from datetime import datetime
 from time import time
-from typing import List
+from typing import Dict, List
+
+from pyesg.constants.file_layouts import CONTIGUOUS, TILED
+from pyesg.io.compression import CODEC_IDS, FILTER_IDS, decode_tile, encode_tile
+from pyesg.io.journal import BatchJournal
+from pyesg.io.file_format import MAGIC, TILED_FORMAT_VERSION, TILED_HEADER_PREFIX, TIME_SAVED_POSITION_TILED, \
+    HEADER_FIELDS, STRING_LENGTH, TIMESTAMP, TILE_SHAPE, TILE_INDEX_DTYPE, TILE_INDEX_SECTION, COMPRESSION, \
+    COMPRESSION_SECTION, STATISTICS_SECTION, encode_footer
+from pyesg.io.summary_statistics import SummaryStatistics
 
 
 class PyESGWriter:
     """
     Contains functionality to write a PyESG binary file.
+
+    All values in the file are little-endian. Simulation values are written as contiguous blocks of single precision
+    floats directly from Numpy arrays (with `os.pwrite` where it is available), so they are not converted one at a time.
+    Args:
+        file_path: The path of the file to write.
+        layout: (Optional) The layout of simulations in the file. With the contiguous layout (the default), each output
+                is stored by simulation then time step. With the tiled layout, each output is stored in tiles of a
+                block of simulations and a block of time steps, listed in an index in the footer, so that reading a
+                time step for all simulations does not need the whole output to be read.
+        tile_number_of_simulations: (Optional) The maximum number of simulations in a tile for the tiled layout. Tiles
+                                    never span batches, so tiles at the end of a batch may have fewer simulations.
+        tile_number_of_time_steps: (Optional) The maximum number of time steps in a tile for the tiled layout.
+        compression: (Optional) The codec with which to compress each tile (e.g. 'zlib', 'lzma'). This is only
+                     supported for the tiled layout. If None, tiles are not compressed.
+        compression_filter: (Optional) The filter applied to the values in each tile before it is compressed (e.g.
+                            'shuffle', 'delta').
+        summary_statistics: (Optional) Whether to calculate summary statistics for each output and time step as
+                            batches are written and store them in the footer. Defaults to False. Readers which do not
+                            know about the footer ignore it.
+        journal_key: (Optional) A string identifying what is being written (e.g. a hash of the configuration). If
+                     specified, a journal of the batches written is kept in a file next to the pyESG file (with the
+                     extension '.journal' added) until the file is finalised.
+        resume: (Optional) Whether to resume writing a file which was not finalised, using its journal. If True and a
+                journal exists, the batches recorded in it are kept and `completed_batches` lists them. The journal
+                must have the same key and the file the same header, otherwise `write_header` raises a ValueError. If
+                there is no journal, the file is written from the start.
     """
-    def __init__(self, file_path: str):
-        self._writer = open_binary(file_path, 'wb', endianness="<")  # type: BinaryWriter
-        self._writer.__enter__()
-        self._header_start_position = 8  # First 8 bytes are reserved for timestamp written when finalising file
+    def __init__(self, file_path: str, layout: str = CONTIGUOUS, tile_number_of_simulations: int = 4096,
+                 tile_number_of_time_steps: int = 16, compression: str = None, compression_filter: str = None,
+                 summary_statistics: bool = False, journal_key: str = None, resume: bool = False):
+        if layout not in (CONTIGUOUS, TILED):
+            raise ValueError(f"The layout {layout} is not a valid file layout.")
+        if compression not in CODEC_IDS or compression_filter not in FILTER_IDS:
+            raise ValueError(f"The compression {compression} with filter {compression_filter} is not supported.")
+        if compression is not None and layout != TILED:
+            raise ValueError("Compression is only supported for the tiled layout.")
+
+        self._journal = BatchJournal(file_path + ".journal") if journal_key is not None else None
+        self._journal_key = journal_key
+        self._resuming = resume and self._journal is not None and self._journal.exists() and os.path.exists(file_path)
+        self.completed_batches = {}  # type: Dict[int, dict]
+
+        self._file = open(file_path, 'r+b' if self._resuming else 'wb', buffering=0)
+        self._layout = layout
+        self._tile_number_of_simulations = tile_number_of_simulations
+        self._tile_number_of_time_steps = tile_number_of_time_steps
+        self._tiles = []  # type: List[np.ndarray]
+        self._compression = compression
+        self._compression_filter = compression_filter
+
+        # Summary statistics are merged in batch order so that they do not depend on the order in which batches are
+        # written. Statistics for batches written ahead of earlier batches are held until they can be merged.
+        self._summary_statistics = None  # type: SummaryStatistics
+        self._calculate_summary_statistics = summary_statistics
+        self._pending_batch_statistics = {}  # type: Dict[int, SummaryStatistics]
+        self._next_batch_for_statistics = 1
+
+        if layout == TILED:
+            self._time_saved_position = TIME_SAVED_POSITION_TILED
+            self._header_start_position = TILED_HEADER_PREFIX.size
+        else:
+            self._time_saved_position = 0
+            self._header_start_position = 8  # First 8 bytes are reserved for timestamp written when finalising file
         self._header_end_position = None
+        self._number_simulations = None
+        self._number_outputs = None
+        self._number_time_steps = None
 
     def write_header(self, number_simulations: int, output_ids: List[str], projection_dates: List[datetime],
                      annualisation_factor: float):
@@ -26,59 +97,431 @@ class PyESGWriter:
             projection_dates: The list of projection dates in the file.
             annualisation_factor: The number of projection steps per year.
         """
-        self._writer.seek(self._header_start_position)
+        self._number_simulations = number_simulations
         number_outputs = len(output_ids)
         number_projection_dates = len(projection_dates)
+        self._number_outputs = number_outputs
+        self._number_time_steps = number_projection_dates
+        if self._calculate_summary_statistics:
+            self._summary_statistics = SummaryStatistics.empty(number_outputs, number_projection_dates)
 
-        self._writer.write_uint32(number_simulations)
-        self._writer.write_uint32(number_outputs)
-        self._writer.write_uint32(number_projection_dates)
-        self._writer.write_single(annualisation_factor)
+        header = [HEADER_FIELDS.pack(number_simulations, number_outputs, number_projection_dates, annualisation_factor)]
 
         for output_id in output_ids:
-            self._writer.write_length_prefixed_string(output_id)
+            encoded_output_id = output_id.encode("utf-8")
+            header.append(STRING_LENGTH.pack(len(encoded_output_id)) + encoded_output_id)  # Length prefixed string
 
         for date in projection_dates:
-            self._writer.write_uint64(int(date.timestamp()))  # Write dates as unix timestamps
+            header.append(TIMESTAMP.pack(int(date.timestamp())))  # Write dates as unix timestamps
+
+        if self._layout == TILED:
+            header.insert(0, TILED_HEADER_PREFIX.pack(MAGIC, TILED_FORMAT_VERSION, 0, 0))  # Time saved written later
+            header.append(TILE_SHAPE.pack(self._tile_number_of_simulations, self._tile_number_of_time_steps))
+            header_position = 0
+        else:
+            header_position = self._header_start_position
+        header_bytes = b"".join(header)
+        self._header_end_position = header_position + len(header_bytes)
+        self._end_position = self._header_end_position  # Compressed tiles are written one after the other
+
+        journal_header = {
+            "key": self._journal_key,
+            "header": hashlib.sha256(header_bytes).hexdigest(),
+            "compression": self._compression,
+            "compression_filter": self._compression_filter,
+            "summary_statistics": self._calculate_summary_statistics,
+        }
+        if self._resuming:
+            self._resume_from_journal(journal_header, header_bytes, header_position)
+            return
+
+        self._write_at(header_bytes, header_position)
+        if self._journal is not None:
+            self._journal.create(journal_header)
+
+    def _resume_from_journal(self, journal_header: dict, header_bytes: bytes, header_position: int):
+        """
+        Restores the state of the writer from the journal of a file which was not finalised.
+        Args:
+            journal_header: The record describing the file which would be written to a new journal.
+            header_bytes: The header which would be written to a new file.
+            header_position: The position of the header in the file.
+
+        The file must have the same header and be written with the same settings as when the journal was created.
+        """
+        existing_journal_header, records = self._journal.read()
+        self._file.seek(header_position)
+        if existing_journal_header != journal_header or self._file.read(len(header_bytes)) != header_bytes:
+            self._file.close()
+            raise ValueError("The pyESG file being resumed does not match the configuration. It may have been written "
+                             "with a different configuration.")
+
+        for record in records:
+            batch_number = record["batch_number"]
+            self.completed_batches[batch_number] = record["checkpoint"]
+            self._end_position = max(self._end_position, record["end_position"])
+            self._restore_batch(record)
+        self._merge_pending_batch_statistics()
+
+    def _restore_batch(self, record: dict):
+        """
+        Restores the tile index and summary statistics for a batch recorded in the journal.
+        Args:
+            record: The journal record for the batch.
+
+        The journal records the sizes of the compressed tiles and the summary statistics for each batch, so they are
+        restored without reading the batch. The summary statistics are only calculated again from the simulations in
+        the file if the journal does not record them (e.g. it was written by an earlier version).
+        """
+        batch_tiles = None
+        if self._layout == TILED:
+            batch_tiles = self._restore_batch_tiles(record)
+            self._tiles.append(batch_tiles)
 
-        self._header_end_position = self._writer.tell()
+        if self._summary_statistics is None:
+            return
+        if "statistics" in record:
+            batch_statistics = SummaryStatistics.from_bytes(base64.b64decode(record["statistics"]))
+        else:
+            batch_statistics = self._read_batch_statistics(record, batch_tiles)
+        self._pending_batch_statistics[record["batch_number"]] = batch_statistics
 
-    def write_batch_of_simulations(self, batch_number: int, total_batches: int,  simulations: np.ndarray):
+    def _restore_batch_tiles(self, record: dict) -> np.ndarray:
+        """
+        Restores the tile index entries for a batch recorded in the journal.
+        Args:
+            record: The journal record for the batch.
+
+        Returns:
+            The tile index entries for the batch, in the order in which the tiles were written.
+
+        The positions of uncompressed tiles follow from the layout. Compressed tiles are written one after the other
+        from the start position of the batch, so their positions follow from their sizes recorded in the journal.
+        """
+        size_of_float = 4  # 4 bytes per float
+        first_simulation = record["first_simulation"]
+        number_simulations_in_batch = record["number_simulations"]
+        number_steps = self._number_time_steps
+        start_of_batch_within_output = first_simulation * number_steps * size_of_float
+        size_of_each_output = self._number_simulations * number_steps * size_of_float
+        if self._compression is not None and "tile_sizes" not in record:
+            raise ValueError("The journal does not record the sizes of the compressed tiles, so the pyESG file cannot "
+                             "be resumed.")
+
+        batch_tiles = []
+        for i_output in range(self._number_outputs):
+            position = self._header_end_position + i_output * size_of_each_output + start_of_batch_within_output
+            for tile_first_sim in range(0, number_simulations_in_batch, self._tile_number_of_simulations):
+                number_simulations_in_tile = min(self._tile_number_of_simulations,
+                                                 number_simulations_in_batch - tile_first_sim)
+                tiles = self._create_tiles(i_output, first_simulation + tile_first_sim, number_simulations_in_tile,
+                                           number_steps)
+                if self._compression is None:
+                    position = self._set_uncompressed_tile_positions(tiles, position)
+                batch_tiles.append(tiles)
+        batch_tiles = np.concatenate(batch_tiles)
+
+        if self._compression is not None:
+            batch_tiles["size"] = record["tile_sizes"]
+            batch_tiles["position"] = record["start_position"] + \
+                np.concatenate([[0], np.cumsum(batch_tiles["size"][:-1])])
+        return batch_tiles
+
+    def _read_batch_statistics(self, record: dict, batch_tiles: np.ndarray = None) -> SummaryStatistics:
+        """
+        Calculates the summary statistics for a batch recorded in the journal from its simulations in the file.
+        Args:
+            record: The journal record for the batch.
+            batch_tiles: (Optional) The tile index entries for the batch if the file has the tiled layout.
+
+        Returns:
+            The summary statistics for the batch, which are exactly the same as when the batch was written.
+        """
+        size_of_float = 4  # 4 bytes per float
+        first_simulation = record["first_simulation"]
+        number_simulations_in_batch = record["number_simulations"]
+        number_steps = self._number_time_steps
+        start_of_batch_within_output = first_simulation * number_steps * size_of_float
+        size_of_each_output = self._number_simulations * number_steps * size_of_float
+
+        batch_statistics = SummaryStatistics.empty(self._number_outputs, number_steps)
+        for i_output in range(self._number_outputs):
+            if batch_tiles is None:
+                position = self._header_end_position + i_output * size_of_each_output + start_of_batch_within_output
+                output_sims = np.frombuffer(self._read_at(position, number_simulations_in_batch * number_steps *
+                                                          size_of_float), dtype="<f4").reshape(-1, number_steps)
+                batch_statistics.calculate_for_output(i_output, output_sims)
+                continue
+
+            output_sims = np.empty([number_simulations_in_batch, number_steps], dtype="<f4")
+            for tile in batch_tiles[batch_tiles["output"] == i_output]:
+                data = self._read_at(int(tile["position"]), int(tile["size"]))
+                number_simulations_in_tile = int(tile["number_simulations"])
+                number_steps_in_tile = int(tile["number_time_steps"])
+                if self._compression is not None:
+                    tile_values = decode_tile(data, number_simulations_in_tile, number_steps_in_tile,
+                                              self._compression, self._compression_filter)
+                else:
+                    tile_values = np.frombuffer(data, dtype="<f4").reshape(number_simulations_in_tile, -1)
+                tile_first_sim = int(tile["first_simulation"]) - first_simulation
+                first_step = int(tile["first_time_step"])
+                output_sims[tile_first_sim:tile_first_sim + number_simulations_in_tile,
+                            first_step:first_step + number_steps_in_tile] = tile_values
+            batch_statistics.calculate_for_output(i_output, output_sims)
+        return batch_statistics
+
+    def write_batch_of_simulations(self, batch_number: int, total_batches: int,  simulations: np.ndarray,
+                                   first_simulation: int = None, checkpoint: dict = None):
         """
         Writes a batch of simulations to the file.
         Args:
             batch_number: The batch number amongst all batches.
             total_batches: The total number of batches.
             simulations: A 3-dimensional array containing the simulations for the batch.
+            first_simulation: (Optional) The (zero-indexed) index of the first simulation in the batch amongst all
+                              simulations. If None, all batches are assumed to have the same number of simulations.
+            checkpoint: (Optional) Information needed to carry on after the batch if writing is resumed (e.g. the state
+                        of the random generator), which must be JSON serialisable. It is stored in the journal and
+                        returned in `completed_batches` when resuming.
+
+        The dimensions of the `simulations` array should be (number_outputs, number_simulations, number_steps), which is
+        the order in which values are stored in the file.
 
-        The dimensions of the `simulations` array should be (number_outputs, number_steps, number_simulations)
+        Batches can be written in any order (e.g. as they finish when generated in parallel) because the position of
+        each batch in the file depends only on its first simulation. Batches may have different numbers of simulations
+        (e.g. a smaller last batch) if `first_simulation` is specified.
         """
-        number_outputs_in_batch, number_steps_in_batch, number_simulations_in_batch = simulations.shape
+        if not 1 <= batch_number <= total_batches:
+            raise ValueError(f"The batch number must satisfy 1 <= number <= {total_batches}")
+
+        number_outputs_in_batch, number_simulations_in_batch, number_steps_in_batch = simulations.shape
 
         # Binary file is organised so that each output is written (with all its sims) one after the other.
-        # For each output we need to seek to the start of the output + start of batch within that output
+        # For each output we need to write at the start of the output + start of batch within that output
+
+        if first_simulation is None:
+            first_simulation = (batch_number - 1) * number_simulations_in_batch
 
         size_of_float = 4  # 4 bytes per float
-        start_of_batch_within_output = (batch_number - 1) * number_simulations_in_batch * number_steps_in_batch \
-                                       * size_of_float
-        size_of_each_output = total_batches * number_simulations_in_batch * number_steps_in_batch * size_of_float
+        start_of_batch_within_output = first_simulation * number_steps_in_batch * size_of_float
+        size_of_each_output = self._number_simulations * number_steps_in_batch * size_of_float
+
+        batch_statistics = None
+        if self._calculate_summary_statistics:
+            batch_statistics = SummaryStatistics.empty(number_outputs_in_batch, number_steps_in_batch)
+        start_position = self._end_position
+        number_tiles_before_batch = len(self._tiles)
 
         for i_output in range(number_outputs_in_batch):
-            output_sims = simulations[i_output, :, :]
-            position_to_seek = self._header_end_position + i_output * size_of_each_output + start_of_batch_within_output
-            self._writer.seek(position_to_seek)
+            # The simulations for an output in the batch are already arranged by simulation then time step, so they
+            # are a single contiguous block in the file. They only need copying if they are not already little-endian
+            # single precision floats.
+            output_sims = np.ascontiguousarray(simulations[i_output, :, :], dtype="<f4")
+            if batch_statistics is not None:
+                batch_statistics.calculate_for_output(i_output, output_sims)
+
+            position = self._header_end_position + i_output * size_of_each_output + start_of_batch_within_output
+            if self._layout == TILED:
+                self._write_tiles_for_output(i_output, output_sims, first_simulation, position)
+            else:
+                self._write_at(memoryview(output_sims).cast("B"), position)
+            del output_sims  # Release any copy before the next output is converted
+
+        if batch_statistics is not None:
+            self._pending_batch_statistics[batch_number] = batch_statistics
+            self._merge_pending_batch_statistics()
+
+        if self._journal is not None:
+            # The batch is only recorded once its simulations are on disk, so that a recorded batch is never lost.
+            os.fsync(self._file.fileno())
+            # The positions of the tiles follow from the layout and the start position of the batch, so only the sizes
+            # of compressed tiles are recorded. The summary statistics are recorded so the batch need not be read back.
+            record = {
+                "batch_number": batch_number,
+                "first_simulation": first_simulation,
+                "number_simulations": number_simulations_in_batch,
+                "start_position": start_position,
+                "end_position": self._end_position,
+                "checkpoint": checkpoint,
+            }
+            if self._compression is not None:
+                record["tile_sizes"] = np.concatenate(self._tiles[number_tiles_before_batch:])["size"].tolist()
+            if batch_statistics is not None:
+                record["statistics"] = base64.b64encode(batch_statistics.to_bytes()).decode("ascii")
+            self._journal.append(record)
+            self.completed_batches[batch_number] = checkpoint
+
+    def _merge_pending_batch_statistics(self, all_batches: bool = False):
+        """
+        Merges the summary statistics for batches which have been written into the summary statistics for the file.
+        Args:
+            all_batches: (Optional) Whether to merge the statistics for all batches written. If False, the statistics
+                         for a batch are only merged once all earlier batches have been merged.
+        """
+        while self._pending_batch_statistics:
+            if all_batches:
+                batch_number = min(self._pending_batch_statistics)
+            elif self._next_batch_for_statistics in self._pending_batch_statistics:
+                batch_number = self._next_batch_for_statistics
+            else:
+                return
+            batch_statistics = self._pending_batch_statistics.pop(batch_number)
+            self._summary_statistics = self._summary_statistics.merge(batch_statistics)
+            self._next_batch_for_statistics = batch_number + 1
+
+    def _write_tiles_for_output(self, output_index: int, output_sims: np.ndarray, first_simulation: int,
+                                position: int):
+        """
+        Writes the simulations for an output in a batch as tiles and records the tiles in the tile index.
+        Args:
+            output_index: The index of the output.
+            output_sims: An array with dimension (number_simulations, number_steps) containing the simulations for the
+                         output in the batch.
+            first_simulation: The (zero-indexed) index of the first simulation in the batch amongst all simulations.
+            position: The position in the file at which to write the tiles for the output in the batch.
+
+        The tiles for a batch take up the same space as the simulations would in the contiguous layout, so the position
+        of every tile is known in advance and batches can be written in any order. The tiles for each block of
+        simulations are contiguous in the file, so they are written at once. If tiles are compressed, their sizes are
+        not known in advance, so they are written after all tiles written so far and `position` is not used.
+        """
+        number_simulations_in_batch, number_steps = output_sims.shape
+        tile_time_steps = range(0, number_steps, self._tile_number_of_time_steps)
+
+        for tile_first_sim in range(0, number_simulations_in_batch, self._tile_number_of_simulations):
+            tile_sims = output_sims[tile_first_sim:tile_first_sim + self._tile_number_of_simulations, :]
+            tiles = self._create_tiles(output_index, first_simulation + tile_first_sim, tile_sims.shape[0],
+                                       number_steps)
+
+            if self._compression is not None:
+                compressed_tiles = [encode_tile(tile_sims[:, first_step:first_step + self._tile_number_of_time_steps],
+                                                self._compression, self._compression_filter)
+                                    for first_step in tile_time_steps]
+                tiles["size"] = [len(compressed_tile) for compressed_tile in compressed_tiles]
+                tiles["position"] = self._end_position + np.concatenate([[0], np.cumsum(tiles["size"][:-1])])
+                self._tiles.append(tiles)
+                self._write_at(b"".join(compressed_tiles), self._end_position)
+                self._end_position += int(tiles["size"].sum())
+                continue
 
-            # Need to transpose because output_sims has shape (number_steps, number_simulations).
-            # We need to convert it into (number_simulations, number_steps) for writing because writing in batches
-            # by flattening stacks batches of the first dimension (which therefore needs to be sims).
-            self._writer.write_singles(output_sims.transpose().flatten())
+            self._set_uncompressed_tile_positions(tiles, position)
+            self._tiles.append(tiles)
+
+            block = np.concatenate([tile_sims[:, first_step:first_step + self._tile_number_of_time_steps].ravel()
+                                    for first_step in tile_time_steps])
+            self._write_at(memoryview(block).cast("B"), position)
+            position += block.nbytes
+
+    def _create_tiles(self, output_index: int, first_simulation: int, number_simulations: int,
+                      number_steps: int) -> np.ndarray:
+        """
+        Creates the tile index entries for a block of simulations of an output, without their positions and sizes.
+        Args:
+            output_index: The index of the output.
+            first_simulation: The (zero-indexed) index of the first simulation in the block amongst all simulations.
+            number_simulations: The number of simulations in the block.
+            number_steps: The number of time steps.
+
+        Returns:
+            The tile index entries for the tiles in the block, in the order in which they are written.
+        """
+        tile_time_steps = range(0, number_steps, self._tile_number_of_time_steps)
+        tiles = np.zeros(len(tile_time_steps), dtype=TILE_INDEX_DTYPE)
+        tiles["output"] = output_index
+        tiles["first_simulation"] = first_simulation
+        tiles["number_simulations"] = number_simulations
+        tiles["first_time_step"] = tile_time_steps
+        tiles["number_time_steps"] = np.minimum(self._tile_number_of_time_steps,
+                                                number_steps - tiles["first_time_step"])
+        return tiles
+
+    @staticmethod
+    def _set_uncompressed_tile_positions(tiles: np.ndarray, position: int) -> int:
+        """
+        Sets the sizes and positions of the uncompressed tiles for a block of simulations.
+        Args:
+            tiles: The tile index entries for the block.
+            position: The position in the file of the first tile in the block.
+
+        Returns:
+            The position in the file after the last tile in the block.
+        """
+        size_of_float = 4  # 4 bytes per float
+        tiles["size"] = tiles["number_simulations"] * tiles["number_time_steps"] * size_of_float
+        tiles["position"] = position + np.concatenate([[0], np.cumsum(tiles["size"][:-1])])
+        return position + int(tiles["size"].sum())
+
+    def _read_at(self, position: int, size: int) -> bytes:
+        """
+        Reads bytes from the file at a specific position.
+        Args:
+            position: The position in the file at which to read the bytes.
+            size: The number of bytes to read.
+
+        Returns:
+            The bytes read.
+        """
+        if hasattr(os, "pread"):
+            data = os.pread(self._file.fileno(), size, position)
+        else:
+            self._file.seek(position)
+            data = self._file.read(size)
+        if len(data) != size:
+            raise ValueError("The pyESG file being resumed ends before a batch recorded in its journal.")
+        return data
+
+    def _write_at(self, data: bytes, position: int):
+        """
+        Writes bytes to the file at a specific position.
+        Args:
+            data: The bytes (or any object supporting the buffer protocol) to write.
+            position: The position in the file at which to write the bytes.
+        """
+        if hasattr(os, "pwrite"):
+            data = memoryview(data)
+            while data:
+                bytes_written = os.pwrite(self._file.fileno(), data, position)
+                data = data[bytes_written:]
+                position += bytes_written
+        else:
+            self._file.seek(position)
+            self._file.write(data)
 
     def finalise(self):
         """
         Finalises the writing of the PyESG binary file.
 
-        It writes the current time (as a Unix timestamp) at the start of the file and then closes the file.
+        It writes the footer at the end of the file, the current time (as a Unix timestamp) at the start of the file
+        and then closes the file. The footer contains the tile index for the tiled layout and the summary statistics if
+        they are calculated. Files with the contiguous layout without summary statistics have no footer. The journal is
+        deleted once the file is complete.
         """
-        self._writer.seek(0)
-        self._writer.write_uint64(int(time()))
-        self._writer.close()
+        sections = {}
+        if self._layout == TILED:
+            tiles = np.concatenate(self._tiles) if self._tiles else np.zeros(0, dtype=TILE_INDEX_DTYPE)
+            tiles.sort(order=["output", "first_simulation", "first_time_step"])
+            sections[TILE_INDEX_SECTION] = tiles.tobytes()
+            if self._compression is not None:
+                sections[COMPRESSION_SECTION] = COMPRESSION.pack(CODEC_IDS[self._compression],
+                                                                 FILTER_IDS[self._compression_filter])
+
+        if self._summary_statistics is not None:
+            self._merge_pending_batch_statistics(all_batches=True)
+            sections[STATISTICS_SECTION] = self._summary_statistics.to_bytes()
+
+        if self._compression is not None:
+            end_position = self._end_position
+        else:
+            end_position = self._header_end_position + \
+                self._number_outputs * self._number_simulations * self._number_time_steps * 4
+        if sections:
+            footer = encode_footer(sections, end_position)
+            self._write_at(footer, end_position)
+            end_position += len(footer)
+
+        # A resumed file may contain compressed tiles from a batch which was not finished beyond the end of the file.
+        self._file.truncate(end_position)
+        self._write_at(TIMESTAMP.pack(int(time())), self._time_saved_position)
+        self._file.close()
+        if self._journal is not None:
+            self._journal.delete()
@@ -0,0 +1,96 @@
+from typing import List
+
+from pyesg.simulation.fusion import FusedOutput, fuse_outputs
+from pyesg.simulation.models.base_model import BaseOutput
+
+
+class ExecutionPlan:
+    """
+    An ordered list of all model outputs in which every output comes after the outputs on which it depends.
+
+    The plan is built from the dependency graph between outputs (the edges are created by `get_or_create_output`) by
+    sorting the graph topologically. Calculating outputs in the order of the plan means each output is calculated
+    exactly once for each projection step.
+    Args:
+        outputs: The outputs to calculate.
+        fuse: (Optional) Whether to fuse outputs of the same class which can be calculated at the same time (e.g. the
+              same output in the asset classes for several economies), so that they are calculated together. Defaults
+              to False.
+    Attributes:
+        outputs (List[BaseOutput]): The outputs in the order in which they are to be calculated.
+    """
+    def __init__(self, outputs: List[BaseOutput], fuse: bool = False):
+        self.outputs = self._sort_topologically(outputs)
+        if fuse:
+            self.outputs = fuse_outputs(self.outputs)
+
+    @staticmethod
+    def _sort_topologically(outputs: List[BaseOutput]) -> List[BaseOutput]:
+        """
+        Sorts outputs so that every output comes after the outputs on which it depends.
+        Args:
+            outputs: The outputs to sort.
+
+        Returns:
+            The sorted outputs. Outputs without a dependency between them keep their original relative order.
+        """
+        sorted_outputs = []  # type: List[BaseOutput]
+        visited = set()
+        in_progress = set()
+
+        def visit(output: BaseOutput):
+            if id(output) in visited:
+                return
+            if id(output) in in_progress:
+                raise ValueError(f"Circular dependency between outputs involving {output.label}.")
+
+            in_progress.add(id(output))
+            for dependency in output.dependencies:
+                visit(dependency)
+            in_progress.remove(id(output))
+
+            visited.add(id(output))
+            sorted_outputs.append(output)
+
+        for output in outputs:
+            visit(output)
+        return sorted_outputs
+
+    def to_text(self) -> str:
+        """
+        Returns a description of the plan as text.
+        Returns:
+            A description of the plan with one line for each output in the order in which outputs are calculated.
+
+        Each line shows the output, whether it is written to the output file and the outputs on which it depends.
+        Outputs which are not written to the file are those created only as dependencies for other outputs.
+        """
+        lines = []
+        for step, output in enumerate(self.outputs, start=1):
+            if isinstance(output, FusedOutput):
+                written = "fused"
+            else:
+                written = "written" if output.output_index is not None else "dependency"
+            line = f"{step}. {output.label} [{output.model.asset_class.model_id}, {written}]"
+            if output.dependencies:
+                line += " <- " + ", ".join(dependency.label for dependency in output.dependencies)
+            lines.append(line)
+        return "\n".join(lines)
+
+    def to_dot(self) -> str:
+        """
+        Returns a description of the dependency graph for the plan in the DOT language (e.g. for rendering by Graphviz).
+        Returns:
+            A description of the dependency graph in which there is an edge from each output to the outputs which depend
+            on it. Outputs which are not written to the output file are drawn with dashed outlines.
+        """
+        node_ids = {id(output): f"output_{i}" for i, output in enumerate(self.outputs)}
+        lines = ["digraph execution_plan {"]
+        for output in self.outputs:
+            style = "solid" if output.output_index is not None else "dashed"
+            lines.append(f'    {node_ids[id(output)]} [label="{output.label}", style={style}];')
+        for output in self.outputs:
+            for dependency in output.dependencies:
+                lines.append(f"    {node_ids[id(dependency)]} -> {node_ids[id(output)]};")
+        lines.append("}")
+        return "\n".join(lines)
@@ -0,0 +1,234 @@
+import numpy as np
+
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from pyesg.configuration.pyesg_configuration import Output
+from pyesg.simulation.models.base_model import BaseOutput
+
+
+class StackedDependency:
+    """
+    The values of the outputs on which each output in a fused output depends, stacked with a row for each output in the
+    fused output.
+
+    This is used when the outputs depended on are not exactly the outputs of a single fused output in the same order
+    (e.g. when several outputs depend on the same output), so their values are stacked for each projection step. The
+    values are copied into arrays which are reused for every projection step, rather than new arrays.
+    Args:
+        outputs: The output on which each output in the fused output depends.
+    """
+    def __init__(self, outputs: List[BaseOutput]):
+        self._outputs = outputs
+        self._latest_values = None  # type: np.ndarray
+        self._previous_values = None  # type: np.ndarray
+
+    @staticmethod
+    def _stack(values: List[np.ndarray], stacked_values: np.ndarray) -> np.ndarray:
+        """
+        Copies values into the rows of an array, which is only reallocated if the batch size has changed.
+        """
+        if stacked_values is None or stacked_values.shape[-1] != values[0].shape[-1]:
+            stacked_values = np.empty([len(values), values[0].shape[-1]], dtype=values[0].dtype)
+        for row, row_values in enumerate(values):
+            stacked_values[row] = row_values
+        return stacked_values
+
+    @property
+    def latest_projection_step_sims(self) -> np.ndarray:
+        self._latest_values = self._stack([output.latest_projection_step_sims for output in self._outputs],
+                                          self._latest_values)
+        return self._latest_values
+
+    @property
+    def previous_projection_step_sims(self) -> np.ndarray:
+        self._previous_values = self._stack([output.previous_projection_step_sims for output in self._outputs],
+                                            self._previous_values)
+        return self._previous_values
+
+
+class FusedOutput(BaseOutput):
+    """
+    Several outputs of the same class, possibly from different asset classes, calculated together for each projection
+    step.
+
+    The values of the fused output for a projection step have dimension (number outputs x batch size), with a row for
+    each of the outputs. The parameters of the outputs (listed in `fused_parameters` of the output class) are stacked
+    into arrays with a row for each output, so the same `_calculate_values_for_batch` as for a single output calculates
+    all the outputs with one Numpy operation for each step of the calculation, rather than one for each output.
+
+    If all the outputs are written to the output file and are next to each other in it, the values are calculated
+    directly into the output values for the batch. Otherwise, after each projection step, the outputs written to the
+    output file are copied into the output values for the batch. Each of the outputs is pointed at its row of the values
+    so that other outputs can still depend on it.
+    Args:
+        outputs: The outputs to fuse. They must all be of the same class and already be initialised.
+        dependencies: The fused output or stacked dependency to use for each attribute in `fused_dependencies` of the
+                      output class.
+    """
+    def __init__(self, outputs: List[BaseOutput], dependencies: Dict[str, object]):
+        # All the outputs have models of the same type, so the first model describes the fused output.
+        super().__init__(model=outputs[0].model, output=Output(type=outputs[0].output.type))
+        self.outputs = outputs
+        self.block_size = len(outputs)
+        self._output_class = type(outputs[0])
+        self._scratch_values = None
+
+        for name in self._output_class.fused_parameters:
+            values = [getattr(output, name) for output in outputs]
+            if isinstance(values[0], np.ndarray):
+                # A value for each time step, so indexing by projection step gives a column with a row for each output
+                value = np.stack(values, axis=1)[:, :, None]
+            else:
+                value = np.array(values, dtype=self.settings.dtype)[:, None]
+            setattr(self, name, value)
+
+        for name, dependency in dependencies.items():
+            setattr(self, name, dependency)
+
+        # A scratch array and the latest and previous values of each stacked dependency, with a row for each output
+        number_stacked_dependencies = sum(isinstance(dependency, StackedDependency)
+                                          for dependency in dependencies.values())
+        self.number_extra_values = (1 + 2 * number_stacked_dependencies) * self.block_size
+
+        if outputs[0].output.initial_value is None:
+            self.initial_values = None
+        else:
+            self.initial_values = np.array([output.output.initial_value for output in outputs],
+                                           dtype=self.settings.dtype)[:, None]
+
+        self._written_rows = [row for row, output in enumerate(outputs) if output.output_index is not None]
+        self._written_output_indices = [outputs[row].output_index for row in self._written_rows]
+        written_output_indices = self._written_output_indices
+        if len(written_output_indices) == self.block_size and \
+                written_output_indices == list(range(written_output_indices[0], written_output_indices[-1] + 1)):
+            # The rows are a slice of the output values, so they are calculated into it without a copy.
+            self.output_index = written_output_indices[0]
+            self._output_values_index = slice(written_output_indices[0], written_output_indices[-1] + 1)
+
+        # The index of the random driver for each output, for each random driver of the model.
+        number_random_drivers = min(len(output.model.random_driver_indices) for output in outputs)
+        self._random_driver_indices = [
+            np.array([output.model.random_driver_indices[driver_index] for output in outputs])
+            for driver_index in range(number_random_drivers)
+        ]
+
+    @property
+    def label(self) -> str:
+        return "fused(" + ", ".join(output.label for output in self.outputs) + ")"
+
+    def initialise_output(self):
+        pass  # The fused outputs are initialised before they are fused.
+
+    @property
+    def scratch_values(self) -> np.ndarray:
+        if self._scratch_values is None or self._scratch_values.shape[1] != self.settings.batch_size:
+            self._scratch_values = np.empty([self.block_size, self.settings.batch_size], dtype=self.settings.dtype)
+        return self._scratch_values
+
+    def get_random_samples(self, projection_step: int, driver_index: int) -> np.ndarray:
+        samples = self.settings.random_drivers.get_samples(projection_step)
+        return samples.T[self._random_driver_indices[driver_index]]
+
+    def release_batch_values(self):
+        super().release_batch_values()
+        for output in self.outputs:
+            output.release_batch_values()
+
+    def calculate_for_batch(self, projection_step: int):
+        sims_batch = self._get_buffer_for_projection_step(projection_step)
+        if projection_step == 0 and self.initial_values is not None:
+            sims_batch[...] = self.initial_values
+        else:
+            self._output_class._calculate_values_for_batch(self, projection_step, sims_batch)
+
+        self.previous_projection_step_calculated = self.latest_projection_step_calculated
+        self.previous_projection_step_sims = self.latest_projection_step_sims
+        self.latest_projection_step_calculated = projection_step
+        self.latest_projection_step_sims = sims_batch
+
+        if self.output_index is None:
+            # The values are calculated into the fused output's own buffers, so the written rows are copied.
+            if len(self._written_rows) == self.block_size:
+                self.settings.output_values[self._written_output_indices, :, projection_step] = sims_batch
+            elif self._written_rows:
+                self.settings.output_values[self._written_output_indices, :, projection_step] = \
+                    sims_batch[self._written_rows]
+        for row, output in enumerate(self.outputs):
+            output.previous_projection_step_calculated = output.latest_projection_step_calculated
+            output.previous_projection_step_sims = output.latest_projection_step_sims
+            output.latest_projection_step_calculated = projection_step
+            output.latest_projection_step_sims = sims_batch[row]
+
+        return self.latest_projection_step_sims
+
+    def calculate_for_batch_all_steps(self) -> np.ndarray:
+        raise NotImplementedError("Fused outputs do not support the time-vectorised engine mode.")
+
+
+def fuse_outputs(outputs: List[BaseOutput]) -> List[BaseOutput]:
+    """
+    Fuses outputs of the same class which can be calculated at the same time.
+    Args:
+        outputs: The outputs, sorted so that every output comes after the outputs on which it depends.
+
+    Returns:
+        The outputs with each group of outputs which can be fused replaced by a single fused output, sorted so that
+        every output comes after the outputs on which it depends.
+
+    Each output is given a level, which is one more than the highest level of the outputs on which it depends (or zero
+    if it has no dependencies). Outputs at the same level do not depend on each other, so outputs of the same class at
+    the same level are fused, provided that the class supports fusion and that their initial values are either all
+    specified or all calculated.
+    """
+    levels = {}  # type: Dict[int, int]
+    groups = OrderedDict()  # type: Dict[Tuple, List[BaseOutput]]
+    for output in outputs:
+        level = max((levels[id(dependency)] + 1 for dependency in output.dependencies), default=0)
+        levels[id(output)] = level
+        output_class = type(output)
+        if output_class.fused_parameters is None:
+            key = (level, id(output))  # Outputs which cannot be fused are in a group of their own.
+        else:
+            key = (level, output_class, output.output.initial_value is None)
+        groups.setdefault(key, []).append(output)
+
+    fused_rows = {}  # type: Dict[int, Tuple[FusedOutput, int]]
+    fused_outputs = []  # type: List[BaseOutput]
+
+    def get_plan_dependencies(dependencies: List[BaseOutput]) -> List[BaseOutput]:
+        # Outputs which have been fused are replaced by their fused output.
+        plan_dependencies = []
+        for dependency in dependencies:
+            dependency = fused_rows.get(id(dependency), (dependency,))[0]
+            if dependency not in plan_dependencies:
+                plan_dependencies.append(dependency)
+        return plan_dependencies
+
+    for key in sorted(groups, key=lambda group_key: group_key[0]):  # Sorting is stable, so order within levels is kept
+        group = groups[key]
+        if len(group) == 1:
+            # The output is calculated on its own, but the outputs on which it depends may have been fused, in which
+            # case it depends on the fused outputs in the plan.
+            group[0].dependencies = get_plan_dependencies(group[0].dependencies)
+            fused_outputs.append(group[0])
+            continue
+
+        dependencies = {}
+        for name in type(group[0]).fused_dependencies:
+            group_dependencies = [getattr(output, name) for output in group]
+            fused_output, _ = fused_rows.get(id(group_dependencies[0]), (None, None))
+            if fused_output is not None and \
+                    [fused_rows.get(id(dependency)) for dependency in group_dependencies] == \
+                    [(fused_output, row) for row in range(len(fused_output.outputs))]:
+                dependencies[name] = fused_output  # The rows of the fused output are exactly the dependencies
+            else:
+                dependencies[name] = StackedDependency(group_dependencies)
+
+        fused_output = FusedOutput(group, dependencies)
+        fused_output.dependencies = get_plan_dependencies(sum([output.dependencies for output in group], []))
+        for row, output in enumerate(group):
+            fused_rows[id(output)] = (fused_output, row)
+        fused_outputs.append(fused_output)
+
+    return fused_outputs
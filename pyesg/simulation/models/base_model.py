@@ -1,8 +1,8 @@
 import numpy as np
 
-from typing import List, Dict, Type
+from typing import List, Dict, Tuple, Type
 
-from pyesg.configuration.pyesg_configuration import AssetClass, Output
+from pyesg.configuration.pyesg_configuration import AssetClass, Output, Parameters
 from pyesg.simulation.exceptions import OutputNotExistsError
 from pyesg.simulation.settings import InitialisedSettings
 
@@ -16,9 +16,12 @@ class BaseModel:
     def __init__(self, settings: InitialisedSettings, asset_class: AssetClass):
         self.settings = settings
         self.asset_class = asset_class
-        self.random_samples = None
         self.outputs =[]  # type: List[BaseOutput]
 
+        # Index of each of the random drivers for the model in the list of all random drivers
+        self.random_driver_indices = [settings.random_driver_ids.index(driver_id)
+                                      for driver_id in asset_class.random_drivers]
+
     def initialise_model(self):
         """
         Initialises the model, creating the output classes for specified outputs.
@@ -54,13 +57,40 @@ class BaseModel:
         Returns:
             An array containing the random samples for the specified random driver for the specified projection step.
         """
-        return self.random_samples[projection_step - 1, :, driver_index]
+        random_driver_index = self.random_driver_indices[driver_index]
+        return self.settings.random_drivers.get_samples(projection_step)[:, random_driver_index]
+
+    def get_random_samples_for_all_steps(self, driver_index: int) -> np.ndarray:
+        """
+        Returns the random samples for a specific random driver for all projection steps.
+        Args:
+            driver_index: The index of the random driver for which the random samples are required. This is the index
+                          of the random drivers for the model (as opposed to the index for the random driver in the list
+                          of random drivers for all models).
+
+        Returns:
+            An array with dimension (number projection steps x batch size) containing the random samples for the
+            specified random driver. The first row contains the samples for the first projection step (i.e. step 1).
+        """
+        random_driver_index = self.random_driver_indices[driver_index]
+        return self.settings.random_drivers.get_samples_for_all_steps()[:, :, random_driver_index]
 
 
 class BaseOutput:
     """
     Base class for model output.
+
+    Outputs of the same class can be fused (see pyesg.simulation.fusion) so that they are calculated together for each
+    projection step. To allow this, an output class lists the attributes used by `_calculate_values_for_batch` in
+    `fused_parameters` (numbers, or arrays with a value for each time step) and `fused_dependencies` (the outputs on
+    which it depends), and gets random samples and scratch arrays from `get_random_samples` and `scratch_values`.
     """
+    fused_parameters = None  # type: Tuple[str, ...]
+    fused_dependencies = ()  # type: Tuple[str, ...]
+    # The number of values for each simulation which the output holds in its own arrays, besides its values for the
+    # latest and previous projection steps, when it is calculated one projection step at a time
+    number_extra_values = 0
+
     def __init__(self, model: BaseModel, output: Output):
         self.model = model
         self.settings = model.settings
@@ -69,9 +99,21 @@ class BaseOutput:
         self.latest_projection_step_sims = None
         self.previous_projection_step_calculated = None
         self.previous_projection_step_sims = None
+        self.all_projection_steps_sims = None
+        self._step_buffers = None
+        self.dependencies = []  # type: List[BaseOutput]
+
+        # An output with a list of terms calculates a value for each term, so its values for a projection step have
+        # dimension (number terms x batch size). It is written to the output file as a block of consecutive outputs.
+        terms = getattr(output.parameters, "terms", None)
+        self.block_size = len(terms) if isinstance(terms, list) else None  # type: int
 
         if output.id:
-            self.output_index = self.settings.output_ids.index(output.id)
+            self.output_index = self.settings.output_ids.index(output.get_output_ids()[0])
+            if self.block_size is None:
+                self._output_values_index = self.output_index
+            else:
+                self._output_values_index = slice(self.output_index, self.output_index + self.block_size)
         else:
             self.output_index = None
 
@@ -81,6 +123,19 @@ class BaseOutput:
         """
         raise NotImplementedError
 
+    @property
+    def label(self) -> str:
+        """
+        Returns a label which identifies the output.
+        Returns:
+            The output id if the output has one; otherwise a label made up of the asset class id, output type and
+            output parameters.
+        """
+        if self.output.id:
+            return self.output.id
+        parameters = ", ".join(f"{key}={value}" for key, value in self.output.parameters.__dict__.items())
+        return f"{self.model.asset_class.id}:{self.output.type}({parameters})"
+
     def get_or_create_output(self, output_type: str, asset_class_id: str = None,  **output_parameters) -> 'BaseOutput':
         """
         Gets an existing or creates a new output of a specified type with specified parameters from any asset class.
@@ -93,6 +148,8 @@ class BaseOutput:
 
         Returns:
             The output for the specified asset class with the specified type and parameters.
+
+        The output returned is recorded as a dependency of this output so that it is calculated before this output.
         """
         # If no asset class id specified then assume you are looking for output in existing model (most common case)
         if asset_class_id is None:
@@ -106,42 +163,135 @@ class BaseOutput:
         # Search through the model outputs to see if the required output already exists
         for output in model.outputs:
             if output.output.type == output_type and output.output.parameters.__dict__ == output_parameters:
+                self.dependencies.append(output)
                 return output
 
         # If output doesn't exist then create and initialise it
-        output = Output(type=output_type, **output_parameters)
-        model_output = self.model.create_output(output)
+        output = Output(type=output_type, parameters=Parameters(**output_parameters))
+        model_output = model.create_output(output)
         self.settings.dependent_model_outputs.append(model_output)
-        self.model.outputs.append(model_output)
+        model.outputs.append(model_output)
+        self.dependencies.append(model_output)
 
         model_output.initialise_output()
         return model_output
 
+    @property
+    def scratch_values(self) -> np.ndarray:
+        """
+        Returns an array for intermediate results while calculating the output for a projection step.
+        Returns:
+            An array with the same dimension as the values of the output for a projection step. It is shared with other
+            outputs, so it must not be used to keep values between projection steps.
+        """
+        return self.settings.scratch_values
+
+    def get_random_samples(self, projection_step: int, driver_index: int) -> np.ndarray:
+        """
+        Returns the random samples for a specific random driver of the output's model for a specific projection step.
+        Args:
+            projection_step: The projection step for which the random samples are required.
+            driver_index: The index of the random driver amongst the random drivers for the model.
+
+        Returns:
+            An array with the same dimension as the values of the output for a projection step containing the random
+            samples.
+        """
+        return self.model.get_random_samples(projection_step, driver_index)
+
+    def release_batch_values(self):
+        """
+        Releases the references to the values of the output for the previous batch.
+
+        The values of outputs which are written to the output file are views of the output values for the batch, so
+        this allows the output values to be freed before those for the next batch are allocated.
+        """
+        self.latest_projection_step_calculated = None
+        self.latest_projection_step_sims = None
+        self.previous_projection_step_calculated = None
+        self.previous_projection_step_sims = None
+        self.all_projection_steps_sims = None
+
     def calculate_for_batch(self, projection_step: int):
         """
         Calculates values for all simulations in a batch for the output for a specific projection step.
         Args:
             projection_step: The project step to calculate.
-        """
-        if self.latest_projection_step_calculated == projection_step:
-            return self.latest_projection_step_sims
 
+        The outputs on which this output depends must already have been calculated for the projection step. The
+        execution plan in the settings orders the outputs so that this is the case.
+        """
+        sims_batch = self._get_buffer_for_projection_step(projection_step)
         if projection_step == 0 and self.output.initial_value is not None:
-            config = self.model.settings.config
-            batch_size = int(config.number_of_simulations / config.number_of_batches)
-            sims_batch = np.full(batch_size, self.output.initial_value)
+            sims_batch.fill(self.output.initial_value)
         else:
-            sims_batch = self._calculate_values_for_batch(projection_step)
+            self._calculate_values_for_batch(projection_step, sims_batch)
 
         self.previous_projection_step_calculated = self.latest_projection_step_calculated
         self.previous_projection_step_sims = self.latest_projection_step_sims
         self.latest_projection_step_calculated = projection_step
         self.latest_projection_step_sims = sims_batch
 
+        return self.latest_projection_step_sims
+
+    def _get_buffer_for_projection_step(self, projection_step: int) -> np.ndarray:
+        """
+        Returns the array into which the values of the output are calculated for a projection step.
+        Args:
+            projection_step: The projection step to calculate.
+
+        Returns:
+            An array with dimension (batch size) for the values of the output, or (number terms x batch size) for an
+            output with a list of terms.
+
+        Outputs which are written to the output file are calculated directly into the output values for the batch, so
+        no copy is needed. Other outputs alternate between two buffers of their own so that the values for the
+        previous projection step are still available. The buffers are only reallocated when the batch size changes.
+        """
         if self.output_index is not None:
-            self.settings.output_values[self.output_index, projection_step, :] = sims_batch
+            return self.settings.output_values[self._output_values_index, :, projection_step]
 
-        return self.latest_projection_step_sims
+        if self._step_buffers is None or self._step_buffers.shape[-1] != self.settings.batch_size:
+            shape = [2, self.settings.batch_size] if self.block_size is None \
+                else [2, self.block_size, self.settings.batch_size]
+            self._step_buffers = np.empty(shape, dtype=self.settings.dtype)
+        return self._step_buffers[projection_step % 2]
 
-    def _calculate_values_for_batch(self, projection_step: int):
+    def _calculate_values_for_batch(self, projection_step: int, out: np.ndarray):
+        """
+        Calculates values for all simulations in a batch for the output for a specific projection step.
+        Args:
+            projection_step: The projection step to calculate.
+            out: The array with dimension (batch size), or (number terms x batch size) for an output with a list of
+                 terms, into which the values are written.
+
+        Implementations should write into `out` with in-place operations (e.g. using the `out` argument of Numpy
+        ufuncs) rather than creating new arrays. `scratch_values` can hold intermediate results.
+        """
         raise NotImplementedError
+
+    def calculate_for_batch_all_steps(self) -> np.ndarray:
+        """
+        Calculates values for all simulations in a batch for the output for all projection steps at once.
+
+        Returns:
+            An array with dimension (number time steps x batch size), or (number time steps x number terms x batch size)
+            for an output with a list of terms, containing the values of the output. The first row contains the values
+            for the initial time step.
+
+        This is used by the time-vectorised engine mode. The outputs on which this output depends must already have been
+        calculated for the batch.
+        """
+        sims = self._calculate_values_for_all_steps()
+        if self.output.initial_value is not None:
+            sims[0, :] = self.output.initial_value
+
+        self.all_projection_steps_sims = sims
+        if self.output_index is not None:
+            # The output values for the batch are arranged by simulation then time step, as in the output file.
+            self.settings.output_values[self._output_values_index, :, :] = np.moveaxis(sims, 0, -1)
+
+        return self.all_projection_steps_sims
+
+    def _calculate_values_for_all_steps(self) -> np.ndarray:
+        raise NotImplementedError(f"{self.output.type} output does not support the time-vectorised engine mode.")
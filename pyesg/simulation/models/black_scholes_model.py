@@ -8,26 +8,48 @@ class BlackScholesOutputTotalReturnIndex(BaseOutput):
     """
     Output class for Total Return Index under Black Scholes model.
     """
+    fused_parameters = ("drift", "random_sample_coefficient")
+    fused_dependencies = ("discount_factor_output",)
+
     def initialise_output(self):
         self.sigma = self.model.asset_class.parameters.sigma
         self.discount_factor_output = self.get_or_create_output(
             output_type=DISCOUNT_FACTOR,
             asset_class_id=self.model.asset_class.dependencies[0]  # Nominal rates dependency
         )
+        self.drift = - 0.5 / self.settings.annualisation_factor * self.sigma * self.sigma
+        self.random_sample_coefficient = self.sigma / self.settings.annualisation_factor
 
-    def _calculate_values_for_batch(self, projection_step: int):
-        random_samples = self.model.get_random_samples(projection_step, 0)
-        exp_term = - 0.5 / self.settings.annualisation_factor * self.sigma * self.sigma \
-                   + self.sigma / self.settings.annualisation_factor * random_samples
+    def _calculate_values_for_batch(self, projection_step: int, out: np.ndarray):
+        random_samples = self.get_random_samples(projection_step, 0)
+        np.multiply(self.random_sample_coefficient, random_samples, out=out)
+        out += self.drift
+        np.exp(out, out=out)
 
-        # Make sure discount factor calculated for this step and then get previous step too
-        discount_factor_sims = self.discount_factor_output.calculate_for_batch(projection_step)
+        # Discount factor has already been calculated for this step so get this step and the previous step
+        discount_factor_sims = self.discount_factor_output.latest_projection_step_sims
         discount_factor_sims_previous_step = self.discount_factor_output.previous_projection_step_sims
 
         # Calculate nominal rates growth component of TRI
-        nominal_rate_growth = discount_factor_sims_previous_step / discount_factor_sims
+        nominal_rate_growth = np.divide(discount_factor_sims_previous_step, discount_factor_sims,
+                                        out=self.scratch_values)
+
+        out *= self.latest_projection_step_sims
+        out *= nominal_rate_growth
+
+    def _calculate_values_for_all_steps(self):
+        random_samples = self.model.get_random_samples_for_all_steps(0)
+        exp_term = self.drift + self.random_sample_coefficient * random_samples
+
+        discount_factor_sims = self.discount_factor_output.all_projection_steps_sims
+        nominal_rate_growth = discount_factor_sims[:-1, :] / discount_factor_sims[1:, :]
 
-        return self.latest_projection_step_sims * np.exp(exp_term) * nominal_rate_growth
+        # The TRI for each step is the initial value multiplied by the cumulative growth over all previous steps.
+        sims = np.empty(discount_factor_sims.shape, dtype=self.settings.dtype)
+        sims[0, :] = self.output.initial_value
+        np.cumprod(np.exp(exp_term) * nominal_rate_growth, axis=0, out=sims[1:, :])
+        sims[1:, :] *= self.output.initial_value
+        return sims
 
 
 class BlackScholesModel(BaseModel):
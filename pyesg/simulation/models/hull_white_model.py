@@ -1,7 +1,9 @@
 import numpy as np
 
+from scipy.signal import lfilter
+
 from pyesg.constants.outputs import BROWNIAN_MOTION, OU_PROCESS, DISCOUNT_FACTOR, CASH_ACCOUNT, ZERO_COUPON_BOND, \
-    BOND_INDEX
+    ZERO_COUPON_BOND_CURVE, BOND_INDEX
 from pyesg.simulation.models.base_model import BaseModel, BaseOutput
 from pyesg.simulation.utils import extract_yield_curve_from_parameters
 from pyesg.yield_curve import yield_curve
@@ -11,35 +13,63 @@ class HullWhiteOutputBrownianMotion(BaseOutput):
     """
     Output class for Brownian motion with unit variance for Hull-White model
     """
+    fused_parameters = ("increment_scale",)
+
     def initialise_output(self):
         self.output.initial_value = 0.0
+        self.increment_scale = float(np.sqrt(1.0 / self.settings.annualisation_factor))
 
-    def _calculate_values_for_batch(self, projection_step: int):
-        random_samples = self.model.get_random_samples(projection_step, 0)
-        return self.latest_projection_step_sims + np.sqrt(1.0 / self.settings.annualisation_factor) * random_samples
+    def _calculate_values_for_batch(self, projection_step: int, out: np.ndarray):
+        random_samples = self.get_random_samples(projection_step, 0)
+        np.multiply(self.increment_scale, random_samples, out=out)
+        out += self.latest_projection_step_sims
+
+    def _calculate_values_for_all_steps(self):
+        random_samples = self.model.get_random_samples_for_all_steps(0)
+        sims = np.zeros([random_samples.shape[0] + 1, random_samples.shape[1]], dtype=self.settings.dtype)
+        np.cumsum(self.increment_scale * random_samples, axis=0, out=sims[1:, :])
+        return sims
 
 
 class HulllWhiteOutputOUProcess(BaseOutput):
     """
     Output class for OU process with 0 drift and initial value of 0.
     """
+    fused_parameters = ("previous_step_factor", "increment_scale")
+
     def initialise_output(self):
         self.alpha = self.model.asset_class.parameters.alpha
         self.output.initial_value = 0.0
 
-    def _calculate_values_for_batch(self, projection_step: int):
-        random_samples = self.model.get_random_samples(projection_step, 0)
         time_step_length = 1.0 / self.settings.annualisation_factor
-        previous_step_factor = np.exp(- time_step_length * self.alpha)
+        self.previous_step_factor = float(np.exp(- time_step_length * self.alpha))
         increment_variance = (1.0 - np.exp(-2.0 * self.alpha * time_step_length)) / (2.0 * self.alpha)
+        self.increment_scale = float(np.sqrt(increment_variance))
 
-        return previous_step_factor * self.latest_projection_step_sims + np.sqrt(increment_variance) * random_samples
+    def _calculate_values_for_batch(self, projection_step: int, out: np.ndarray):
+        random_samples = self.get_random_samples(projection_step, 0)
+        scratch = self.scratch_values
+        np.multiply(self.previous_step_factor, self.latest_projection_step_sims, out=out)
+        np.multiply(self.increment_scale, random_samples, out=scratch)
+        out += scratch
+
+    def _calculate_values_for_all_steps(self):
+        random_samples = self.model.get_random_samples_for_all_steps(0)
+
+        # The recursion X(t) = previous_step_factor * X(t-1) + increment_scale * Z(t) with X(0) = 0 is a
+        # first-order linear filter applied to the random samples along the time axis.
+        sims = np.zeros([random_samples.shape[0] + 1, random_samples.shape[1]], dtype=self.settings.dtype)
+        sims[1:, :] = lfilter([self.increment_scale], [1.0, -self.previous_step_factor], random_samples, axis=0)
+        return sims
 
 
 class HullWhiteOutputDiscountFactor(BaseOutput):
     """
     Output class for the discount factor for the one-factor Hull-White model.
     """
+    fused_parameters = ("deterministic_factor", "stochastic_coefficient")
+    fused_dependencies = ("ou_process_output", "brownian_motion_output")
+
     def initialise_output(self):
         self.alpha = self.model.asset_class.parameters.alpha
         self.sigma = self.model.asset_class.parameters.sigma
@@ -47,58 +77,138 @@ class HullWhiteOutputDiscountFactor(BaseOutput):
         self.brownian_motion_output = self.get_or_create_output(output_type=BROWNIAN_MOTION)
         self.ou_process_output = self.get_or_create_output(output_type=OU_PROCESS)
 
-    def _calculate_values_for_batch(self, projection_step: int):
-        time = projection_step / self.settings.annualisation_factor
-        term_1 = (self.sigma * self.sigma) / (4 * self.alpha ** 3) * \
+        # The discount factor is deterministic_factor(t) * exp(stochastic_coefficient * (OU(t) - BM(t))). The
+        # deterministic factor only depends on time so it is calculated once for every time step, in double precision,
+        # and then stored in the compute type. Scalar coefficients are kept as Python floats so that they do not
+        # promote single precision simulations to double precision.
+        time = self.settings.projection_times
+        det_term = (self.sigma * self.sigma) / (4 * self.alpha ** 3) * \
                    (2 * self.alpha * time - 3 + 4 * np.exp(- self.alpha * time) - np.exp(-2 * self.alpha * time))
-        term_2 = self.sigma / self.alpha * self.brownian_motion_output.calculate_for_batch(projection_step)
-        term_3 = - self.sigma / self.alpha * self.ou_process_output.calculate_for_batch(projection_step)
+        zcb = self.model.yield_curve.get_rates_on_grid(time, yield_curve.ZCB)
+        self.deterministic_factor = (zcb * np.exp(-det_term)).astype(self.settings.dtype)
+        self.stochastic_coefficient = self.sigma / self.alpha
+
+    def _calculate_values_for_batch(self, projection_step: int, out: np.ndarray):
+        np.subtract(self.ou_process_output.latest_projection_step_sims,
+                    self.brownian_motion_output.latest_projection_step_sims, out=out)
+        out *= self.stochastic_coefficient
+        np.exp(out, out=out)
+        out *= self.deterministic_factor[projection_step]
 
-        zcb = self.model.yield_curve.get_rate(time, yield_curve.ZCB)
-        return zcb * np.exp(-(term_1 + term_2 + term_3))
+    def _calculate_values_for_all_steps(self):
+        stoch_term = self.ou_process_output.all_projection_steps_sims \
+                     - self.brownian_motion_output.all_projection_steps_sims
+        return self.deterministic_factor[:, None] * np.exp(self.stochastic_coefficient * stoch_term)
 
 
 class HullWhiteOutputCashAccount(BaseOutput):
     """
     Output class for the cash account for the one-factor Hull-White model
     """
+    fused_parameters = ()
+    fused_dependencies = ("discount_factor_output",)
+
     def initialise_output(self):
         self.discount_factor_output = self.get_or_create_output(output_type=DISCOUNT_FACTOR)
 
-    def _calculate_values_for_batch(self, projection_step: int):
-        return 1.0 / self.discount_factor_output.calculate_for_batch(projection_step)
+    def _calculate_values_for_batch(self, projection_step: int, out: np.ndarray):
+        np.divide(1.0, self.discount_factor_output.latest_projection_step_sims, out=out)
+
+    def _calculate_values_for_all_steps(self):
+        return 1.0 / self.discount_factor_output.all_projection_steps_sims
 
 
 class HullWhiteOutputZCB(BaseOutput):
     """
     Output class for a zero-coupon bond for the one-factor Hull-White model
     """
+    fused_parameters = ("deterministic_factor", "stochastic_coefficient")
+    fused_dependencies = ("ou_process_output",)
+
     def initialise_output(self):
         self.alpha = self.model.asset_class.parameters.alpha
         self.sigma = self.model.asset_class.parameters.sigma
         self.term = self.output.parameters.term
         self.ou_process_output = self.get_or_create_output(output_type=OU_PROCESS)
 
-    def _calculate_values_for_batch(self, projection_step: int):
-        time = projection_step / self.settings.annualisation_factor
+        # The ZCB price is deterministic_factor(t) * exp(- stochastic_coefficient * OU(t)). The deterministic factor
+        # only depends on time so it is calculated once for every time step.
+        time = self.settings.projection_times
         det_term = (self.sigma ** 2) / (4.0 * self.alpha ** 3) * (
             (1.0 - np.exp(-2.0 * self.alpha * self.term)) * (1.0 - np.exp(-2.0 * self.alpha * time))
             - 4.0 * (1.0 - np.exp(- self.alpha * self.term)) * (1.0 - np.exp(-self.alpha * time))
         )
-        stoch_term = self.sigma / self.alpha * (1.0 - np.exp(-self.alpha * self.term)) \
-                     * self.ou_process_output.calculate_for_batch(projection_step)
+        zcb_now = self.model.yield_curve.get_rates_on_grid(time, yield_curve.ZCB)
+        zcb_expiry = self.model.yield_curve.get_rates_on_grid(time, yield_curve.ZCB, term_offset=self.term)
+        self.deterministic_factor = (zcb_expiry / zcb_now * np.exp(det_term)).astype(self.settings.dtype)
+        self.stochastic_coefficient = float(self.sigma / self.alpha * (1.0 - np.exp(-self.alpha * self.term)))
 
-        expiry_time = time + self.term
-        zcb_now = self.model.yield_curve.get_rate(time, yield_curve.ZCB)
-        zcb_expiry = self.model.yield_curve.get_rate(expiry_time, yield_curve.ZCB)
+    def _calculate_values_for_batch(self, projection_step: int, out: np.ndarray):
+        np.multiply(-self.stochastic_coefficient, self.ou_process_output.latest_projection_step_sims, out=out)
+        np.exp(out, out=out)
+        out *= self.deterministic_factor[projection_step]
 
-        return zcb_expiry / zcb_now * np.exp(det_term - stoch_term)
+    def _calculate_values_for_all_steps(self):
+        stoch_term = self.stochastic_coefficient * self.ou_process_output.all_projection_steps_sims
+        return self.deterministic_factor[:, None] * np.exp(-stoch_term)
+
+
+class HullWhiteOutputZCBCurve(BaseOutput):
+    """
+    Output class for the zero-coupon bonds for a list of terms (i.e. the simulated yield curve) for the one-factor
+    Hull-White model.
+
+    The bond for each term has the same values as the zero-coupon bond output for that term, but all terms are
+    calculated together with one operation on an array with dimension (number terms x batch size) for each projection
+    step. It is written to the output file as a block of outputs, one for each term.
+    """
+    def initialise_output(self):
+        self.alpha = self.model.asset_class.parameters.alpha
+        self.sigma = self.model.asset_class.parameters.sigma
+        self.terms = np.array(self.output.parameters.terms, dtype=np.float64)
+        if self.terms.size == 0:
+            raise ValueError(f"The zero-coupon bond curve {self.label} must have at least one term.")
+        self.ou_process_output = self.get_or_create_output(output_type=OU_PROCESS)
+
+        # The ZCB prices are deterministic_factor(t, T) * exp(- stochastic_coefficient(T) * OU(t)) for each term T. The
+        # deterministic factor has dimension (number time steps x number terms) and the stochastic coefficient has
+        # dimension (number terms x 1) so that it broadcasts against the OU process for the batch. Both are stored in
+        # the compute type so that single precision simulations are not promoted to double precision.
+        time = self.settings.projection_times[:, None]
+        terms = self.terms[None, :]
+        det_term = (self.sigma ** 2) / (4.0 * self.alpha ** 3) * (
+            (1.0 - np.exp(-2.0 * self.alpha * terms)) * (1.0 - np.exp(-2.0 * self.alpha * time))
+            - 4.0 * (1.0 - np.exp(- self.alpha * terms)) * (1.0 - np.exp(-self.alpha * time))
+        )
+        zcb_now = self.model.yield_curve.get_rates_on_grid(self.settings.projection_times, yield_curve.ZCB)
+        zcb_expiry = np.stack([
+            self.model.yield_curve.get_rates_on_grid(self.settings.projection_times, yield_curve.ZCB, term_offset=term)
+            for term in self.output.parameters.terms
+        ], axis=1)
+        self.deterministic_factor = (zcb_expiry / zcb_now[:, None] * np.exp(det_term)).astype(self.settings.dtype)
+        self.stochastic_coefficient = (self.sigma / self.alpha * (1.0 - np.exp(-self.alpha * self.terms)))[:, None] \
+            .astype(self.settings.dtype)
+
+    def _calculate_values_for_batch(self, projection_step: int, out: np.ndarray):
+        np.multiply(-self.stochastic_coefficient, self.ou_process_output.latest_projection_step_sims, out=out)
+        np.exp(out, out=out)
+        out *= self.deterministic_factor[projection_step, :, None]
+
+    def _calculate_values_for_all_steps(self):
+        # The array for all steps and terms is large, so it is calculated in place.
+        sims = np.multiply(-self.stochastic_coefficient, self.ou_process_output.all_projection_steps_sims[:, None, :])
+        np.exp(sims, out=sims)
+        sims *= self.deterministic_factor[:, :, None]
+        return sims
 
 
 class HullWhiteOutputBondIndex(BaseOutput):
     """
     Output class for a bond index output for the one-factor Hull-White model
     """
+    fused_parameters = ("deterministic_factor", "brownian_motion_coefficient", "ou_coefficient")
+    fused_dependencies = ("ou_process_output", "brownian_motion_output")
+
     def initialise_output(self):
         self.alpha = self.model.asset_class.parameters.alpha
         self.sigma = self.model.asset_class.parameters.sigma
@@ -106,21 +216,31 @@ class HullWhiteOutputBondIndex(BaseOutput):
         self.ou_process_output = self.get_or_create_output(output_type=OU_PROCESS)
         self.brownian_motion_output = self.get_or_create_output(output_type=BROWNIAN_MOTION)
 
-    def _calculate_values_for_batch(self, projection_step: int):
-        time = projection_step / self.settings.annualisation_factor
+        # The bond index is deterministic_factor(t) * exp(brownian_motion_coefficient * BM(t) - ou_coefficient * OU(t)).
+        # The deterministic factor only depends on time so it is calculated once for every time step.
+        time = self.settings.projection_times
         det_term = (self.sigma ** 2) / (4.0 * self.alpha ** 3) * (
             4.0 * time * self.alpha * np.exp(-self.alpha * self.term)
           - 2.0 * time * self.alpha * np.exp(- 2.0 * self.alpha * self.term)
           - 3.0 - np.exp(-2.0 * self.alpha * time) + 4 * np.exp(-self.alpha * time)
         )
+        zcb_now = self.model.yield_curve.get_rates_on_grid(time, yield_curve.ZCB)
+        self.deterministic_factor = (np.exp(det_term) / zcb_now).astype(self.settings.dtype)
+        self.brownian_motion_coefficient = float(self.sigma / self.alpha * np.exp(-self.alpha * self.term))
+        self.ou_coefficient = self.sigma / self.alpha
 
-        stoch_term = self.sigma / self.alpha * (
-            np.exp(-self.alpha * self.term) * self.brownian_motion_output.calculate_for_batch(projection_step)
-            - self.ou_process_output.calculate_for_batch(projection_step)
-        )
+    def _calculate_values_for_batch(self, projection_step: int, out: np.ndarray):
+        scratch = self.scratch_values
+        np.multiply(self.brownian_motion_coefficient, self.brownian_motion_output.latest_projection_step_sims, out=out)
+        np.multiply(self.ou_coefficient, self.ou_process_output.latest_projection_step_sims, out=scratch)
+        out -= scratch
+        np.exp(out, out=out)
+        out *= self.deterministic_factor[projection_step]
 
-        zcb_now = self.model.yield_curve.get_rate(time, yield_curve.ZCB)
-        return 1.0 / zcb_now * np.exp(det_term + stoch_term)
+    def _calculate_values_for_all_steps(self):
+        stoch_term = self.brownian_motion_coefficient * self.brownian_motion_output.all_projection_steps_sims \
+                     - self.ou_coefficient * self.ou_process_output.all_projection_steps_sims
+        return self.deterministic_factor[:, None] * np.exp(stoch_term)
 
 
 class HullWhiteModel(BaseModel):
@@ -128,8 +248,9 @@ class HullWhiteModel(BaseModel):
     Class for one-factor Hull White model
     """
     def initialise_model(self):
-        super().initialise_model()
+        # The yield curve is extracted first because outputs use it when they are initialised.
         self.yield_curve = extract_yield_curve_from_parameters(self.asset_class.parameters)
+        super().initialise_model()
 
     output_class_mapping = {
         BROWNIAN_MOTION: HullWhiteOutputBrownianMotion,
@@ -137,5 +258,6 @@ class HullWhiteModel(BaseModel):
         DISCOUNT_FACTOR: HullWhiteOutputDiscountFactor,
         CASH_ACCOUNT: HullWhiteOutputCashAccount,
         ZERO_COUPON_BOND: HullWhiteOutputZCB,
+        ZERO_COUPON_BOND_CURVE: HullWhiteOutputZCBCurve,
         BOND_INDEX: HullWhiteOutputBondIndex,
     }
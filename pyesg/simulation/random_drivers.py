@@ -0,0 +1,149 @@
+import numpy as np
+
+from typing import List, Union
+
+from pyesg.simulation.settings import InitialisedSettings
+
+
+def draw_standard_normal_samples(random_generator: Union[np.random.RandomState, np.random.Generator],
+                                 size: List[int], dtype: np.dtype) -> np.ndarray:
+    """
+    Draws independent standard normal samples from a random generator.
+    Args:
+        random_generator: The random generator from which to draw the samples.
+        size: The shape of the array of samples.
+        dtype: The floating point type of the samples.
+
+    Returns:
+        An array of independent standard normal samples with the specified shape and type.
+
+    A Numpy Generator draws samples directly in the required type. The legacy Numpy RandomState only draws double
+    precision samples, so for other types the samples are drawn one slice of the first dimension at a time and
+    converted into the result, so that a double precision copy of all the samples is never needed. The legacy
+    generator produces the same sequence of samples however many it draws at once.
+    """
+    if isinstance(random_generator, np.random.Generator):
+        return random_generator.standard_normal(size=size, dtype=dtype)
+    if np.dtype(dtype) == np.float64:
+        return random_generator.standard_normal(size=size)
+
+    samples = np.empty(size, dtype=dtype)
+    for samples_slice in samples:
+        samples_slice[...] = random_generator.standard_normal(size=samples_slice.shape)
+    return samples
+
+
+def generate_random_drivers(settings: InitialisedSettings,
+                            random_generator: Union[np.random.RandomState, np.random.Generator] = None)->np.ndarray:
+    """
+    Generates random drivers for a batch of simulations.
+    Args:
+        settings: The initialised settings for the pyESG configuration.
+        random_generator: (Optional) The random generator from which to draw the random drivers. If None, the random
+                          generator in `settings` is used.
+
+    Returns:
+        An array with dimension (number projection steps x number of simulations x number drivers in batch) containing
+        the random drivers required for a batch of simulations.
+    """
+    if random_generator is None:
+        random_generator = settings.random_generator
+
+    # For each projection step and simulation, we want to generate samples from a set of correlated random drivers.
+    # Independent standard normal samples are correlated by post-multiplying by the factor of the correlation matrix,
+    # which is calculated once when the settings are initialised. The multiplication is done in-place one projection
+    # step at a time, because Numpy copies the whole input when the output of a multiplication overlaps it.
+    random_drivers = draw_standard_normal_samples(
+        random_generator,
+        size=[settings.config.number_of_projection_steps, settings.batch_size, settings.number_random_drivers],
+        dtype=settings.dtype
+    )
+    for step_random_drivers in random_drivers:
+        np.matmul(step_random_drivers, settings.random_driver_correlation_factor, out=step_random_drivers)
+    return random_drivers
+
+
+class BaseRandomDrivers:
+    """
+    Base class for a source of correlated random drivers for a batch of simulations.
+    """
+    def __init__(self, settings: InitialisedSettings,
+                 random_generator: Union[np.random.RandomState, np.random.Generator]):
+        self.settings = settings
+        self.random_generator = random_generator
+        self.batch_size = settings.batch_size
+
+    def get_samples(self, projection_step: int) -> np.ndarray:
+        """
+        Returns the random drivers for all simulations in the batch for a projection step.
+        Args:
+            projection_step: The projection step for which the random drivers are required. The first projection step
+                             is 1.
+
+        Returns:
+            An array with dimension (batch size x number random drivers) containing the random drivers.
+        """
+        raise NotImplementedError
+
+    def get_samples_for_all_steps(self) -> np.ndarray:
+        """
+        Returns the random drivers for all simulations in the batch for all projection steps.
+
+        Returns:
+            An array with dimension (number projection steps x batch size x number random drivers) containing the
+            random drivers. The first element of the first dimension is for the first projection step (i.e. step 1).
+        """
+        raise NotImplementedError
+
+
+class MaterialisedRandomDrivers(BaseRandomDrivers):
+    """
+    Source of random drivers which generates the random drivers for all projection steps of the batch up front.
+    """
+    def __init__(self, settings: InitialisedSettings,
+                 random_generator: Union[np.random.RandomState, np.random.Generator]):
+        super().__init__(settings, random_generator)
+        self._samples = generate_random_drivers(settings, random_generator)
+
+    def get_samples(self, projection_step: int) -> np.ndarray:
+        return self._samples[projection_step - 1, :, :]
+
+    def get_samples_for_all_steps(self) -> np.ndarray:
+        return self._samples
+
+
+class StreamingRandomDrivers(BaseRandomDrivers):
+    """
+    Source of random drivers which only generates the random drivers for the projection step currently being calculated.
+
+    The memory needed for the random drivers therefore does not depend on the number of projection steps. The random
+    drivers are drawn from the random generator in the same order as `MaterialisedRandomDrivers` and correlated in the
+    same way, so the same seeded random drivers are produced.
+    """
+    def __init__(self, settings: InitialisedSettings,
+                 random_generator: Union[np.random.RandomState, np.random.Generator]):
+        super().__init__(settings, random_generator)
+        self._projection_step = 0
+        self._samples = np.zeros([self.batch_size, settings.number_random_drivers], dtype=settings.dtype)
+
+    def get_samples(self, projection_step: int) -> np.ndarray:
+        if projection_step == self._projection_step + 1:
+            self._generate_next_step()
+        elif projection_step != self._projection_step:
+            raise ValueError(f"Random drivers for projection step {projection_step} cannot be streamed after projection "
+                             f"step {self._projection_step}. Projection steps must be requested in order.")
+        return self._samples
+
+    def _generate_next_step(self):
+        """
+        Generates the random drivers for the next projection step, overwriting those for the current projection step.
+        """
+        if isinstance(self.random_generator, np.random.Generator):
+            self.random_generator.standard_normal(dtype=self._samples.dtype, out=self._samples)
+        else:
+            self._samples[:, :] = self.random_generator.standard_normal(size=self._samples.shape)
+        np.matmul(self._samples, self.settings.random_driver_correlation_factor, out=self._samples)
+        self._projection_step += 1
+
+    def get_samples_for_all_steps(self) -> np.ndarray:
+        raise ValueError("Random drivers for all projection steps are not available when streaming random drivers.")
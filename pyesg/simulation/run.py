@@ -1,78 +1,189 @@
+import hashlib
+import itertools
+import json
 import numpy as np
 import os
 
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from typing import Union
 
 from pyesg.configuration.pyesg_configuration import PyESGConfiguration
+from pyesg.constants.engine_modes import TIME_VECTORISED
+from pyesg.io.background_writer import BackgroundWriter
 from pyesg.io.writer import PyESGWriter
+from pyesg.simulation.execution_plan import ExecutionPlan
+from pyesg.simulation.random_drivers import MaterialisedRandomDrivers, StreamingRandomDrivers
 from pyesg.simulation.models.model_factory import get_model_for_asset_class
-from pyesg.simulation.settings import InitialisedSettings, validate_initialised_settings
+from pyesg.simulation.settings import InitialisedSettings, get_random_generator_state, set_random_generator_state, \
+    validate_initialised_settings
 
 
-def generate_random_drivers(settings: InitialisedSettings)->np.ndarray:
+def initialise_models_and_outputs(settings: InitialisedSettings):
     """
-    Generates random drivers for a batch of simulations.
+    Creates all model and output classes, initialises them and stores them in `settings`.
     Args:
         settings: The initialised settings for the pyESG configuration.
 
+    The execution plan for calculating the outputs is also built from the dependencies between outputs and stored in
+    `settings`, and the sizes of the batches of simulations are calculated. In the per-step engine mode, outputs of the
+    same type which can be calculated at the same time (e.g. in asset classes with the same model in several economies)
+    are fused in the plan if `fuse_outputs` is set in the configuration.
+    """
+    for economy in settings.config.economies:
+        for asset_class in economy.asset_classes:
+            model = get_model_for_asset_class(asset_class, settings)
+            settings.asset_class_models.append(model)
+            model.initialise_model()  # Initialising the model will create all outputs specified for the model.
+
+    for output in settings.specified_model_outputs:
+        output.initialise_output()
+
+    # Time-vectorised outputs are calculated once for each batch rather than for each projection step, so there is
+    # little to gain from fusing them.
+    fuse = settings.config.fuse_outputs and settings.config.engine_mode != TIME_VECTORISED
+    settings.execution_plan = ExecutionPlan(settings.dependent_model_outputs + settings.specified_model_outputs,
+                                            fuse=fuse)
+    settings.calculate_batch_sizes()  # Batch sizes depend on the execution plan when sized from the maximum memory.
+
+
+def build_execution_plan(pyesg_config: Union[str, PyESGConfiguration]) -> ExecutionPlan:
+    """
+    Builds the execution plan for a pyESG configuration without generating any simulations.
+    Args:
+        pyesg_config: The pyESG configuration object or the file path for the configuration file.
+
     Returns:
-        An array with dimension (number projection steps x number of simulations x number drivers in batch) containing
-        the random drivers required for a batch of simulations.
+        The execution plan containing all outputs (including those created as dependencies of specified outputs) in the
+        order in which they are calculated. Use `to_text` or `to_dot` on the plan to inspect it.
     """
-    # For each projection step and simulation, we want to generate samples from a set of correlated random drivers.
-    # We use the multivariate_normal random generator from numpy and the covariance matrix is equal to the
-    # correlation matrix because all random drivers have variance = 1.
-    batch_size = int(settings.config.number_of_simulations / settings.config.number_of_batches)
-    means = np.zeros(settings.number_random_drivers)
-    return settings.random_generator.multivariate_normal(
-        mean=means,
-        cov=settings.random_driver_correlation_matrix,
-        size=[settings.config.number_of_projection_steps, batch_size]
-    )
+    if isinstance(pyesg_config, str):
+        pyesg_config = PyESGConfiguration.load_from_file(pyesg_config)
+
+    settings = InitialisedSettings(pyesg_config)
+    initialise_models_and_outputs(settings)
+    return settings.execution_plan
+
+
+def generate_batch(settings: InitialisedSettings, batch_number: int,
+                   random_generator: Union[np.random.RandomState, np.random.Generator] = None) -> np.ndarray:
+    """
+    Generates a single batch of simulations for all outputs.
+    Args:
+        settings: The initialised settings for the pyESG configuration. Models and outputs must already have been
+                  initialised.
+        batch_number: The (zero-indexed) batch number.
+        random_generator: (Optional) The random generator from which to draw the random drivers for the batch. If None,
+                          the random generator in `settings` is used.
 
+    Returns:
+        The output values for the batch. The array has dimension (number outputs x batch size x number time steps).
+    """
+    # The random drivers and output values for the previous batch are released first so that they are not held while
+    # those for this batch are allocated.
+    settings.random_drivers = None
+    for output in settings.execution_plan.outputs:
+        output.release_batch_values()
+    settings.reset_output_values(batch_number)  # Set output values array to zeros.
+
+    if random_generator is None:
+        random_generator = settings.random_generator
+
+    # Models get the random drivers for the batch from the random drivers source in the settings.
+    if settings.config.stream_random_drivers:
+        settings.random_drivers = StreamingRandomDrivers(settings, random_generator)
+    else:
+        settings.random_drivers = MaterialisedRandomDrivers(settings, random_generator)
+
+    execution_plan_outputs = settings.execution_plan.outputs
+    if settings.config.engine_mode == TIME_VECTORISED:
+        # Each output is calculated for all projection steps at once.
+        for output in execution_plan_outputs:
+            output.calculate_for_batch_all_steps()
+    else:
+        for projection_step in range(settings.config.number_of_projection_steps + 1):
+            for output in execution_plan_outputs:
+                output.calculate_for_batch(projection_step)
 
-def assign_generated_random_drivers_to_models(generated_random_drivers: np.ndarray, settings: InitialisedSettings):
-    for model in settings.asset_class_models:
-        # Get the index of the random drivers for the model in the list of all random drivers
-        driver_indices = [settings.random_driver_ids.index(driver_id) for driver_id in model.asset_class.random_drivers]
+    return settings.output_values
 
-        # Slice the generated random drivers to extract relevant drivers for model
-        model.random_samples = generated_random_drivers[:, :, driver_indices]
 
+# Settings for the pyESG configuration in a worker process. This is set once per process by `_initialise_worker`.
+_worker_settings = None  # type: InitialisedSettings
 
-def initialise_models_and_outputs(settings: InitialisedSettings):
+
+def _initialise_worker(pyesg_config_json: dict):
     """
-    Creates all model and output classes, initialises them and stores them in `settings`.
+    Initialises a worker process so that it can generate batches of simulations.
     Args:
-        settings: The initialised settings for the pyESG configuration.
+        pyesg_config_json: The JSON encoding of the pyESG configuration.
+
+    The configuration is passed as its JSON encoding (rather than the configuration object itself) so that it can be
+    pickled when sending it to the worker process.
     """
-    for economy in settings.config.economies:
-        for asset_class in economy.asset_classes:
-            model = get_model_for_asset_class(asset_class, settings)
-            settings.asset_class_models.append(model)
-            model.initialise_model()  # Initialising the model will create all outputs specified for the model.
+    global _worker_settings
+    _worker_settings = InitialisedSettings(PyESGConfiguration._decode_json(pyesg_config_json))
+    initialise_models_and_outputs(_worker_settings)
 
-    for output in settings.specified_model_outputs:
-        output.initialise_output()
 
+def _generate_batch_in_worker(batch_number: int) -> (int, np.ndarray):
+    """
+    Generates a batch of simulations in a worker process.
+    Args:
+        batch_number: The (zero-indexed) batch number.
 
-def generate_simulations(pyesg_config: Union[str, PyESGConfiguration]):
+    Returns:
+        A tuple of the form (batch_number, output_values) where `output_values` contains the values for the batch.
+    """
+    random_generator = _worker_settings.get_batch_random_generator(batch_number)
+    return batch_number, generate_batch(_worker_settings, batch_number, random_generator)
+
+
+def generate_simulations(pyesg_config: Union[str, PyESGConfiguration], workers: int = None, resume: bool = False):
     """
     Generates simulations based on pyESG configuration object.
     Args:
         pyesg_config: The pyESG configuration object or the file path for the configuration file.
+        workers: (Optional) The number of worker processes over which to spread the batches of simulations.
+        resume: (Optional) Whether to resume a run which was interrupted before it finished. Only the batches which
+                were not written to the output file are generated, and the output file is the same as if the run had
+                not been interrupted. If there is no interrupted run, all batches are generated. A ValueError is raised
+                if the interrupted run had a different configuration.
+
+    If `workers` is None, batches are generated one after another in the current process and all batches draw from a
+    single random stream seeded with the random seed. If `workers` is specified, each batch draws from its own random
+    stream, derived from the random seed and the batch number, so the simulations produced are the same regardless of
+    the number of workers. Batches are sized from `max_memory` in each worker process, so the memory used by a run is
+    up to `max_memory` for each worker, plus the memory of up to `workers` finished batches waiting to be written in
+    the current process.
+
+    While the output file is written, a journal of the batches written is kept next to it. A run can only be resumed
+    with the same configuration and with `workers` either None in both runs or specified in both runs.
     """
     # Load the config if it has been specified as a file path.
     if isinstance(pyesg_config, str):
         pyesg_config = PyESGConfiguration.load_from_file(pyesg_config)
 
+    if workers is not None and workers < 1:
+        raise ValueError("The number of workers must be at least 1.")
+
     pyesg_config.validate()
     settings = InitialisedSettings(pyesg_config)
     validate_initialised_settings(settings)
 
-    # Initialise PyESG writer to write results to binary file.
+    # Initialise PyESG writer to write results to binary file. The journal key identifies the configuration and the
+    # random streams used, so that a run is only resumed from a journal which would produce the same simulations.
     output_file_path = os.path.join(pyesg_config.output_file_directory, pyesg_config.output_file_name + ".pyesg")
-    pyesg_writer = PyESGWriter(output_file_path)
+    journal_key = hashlib.sha256(json.dumps({
+        "config": pyesg_config._encode_json(),
+        "batch_random_streams": workers is not None,
+    }, sort_keys=True).encode("utf-8")).hexdigest()
+    pyesg_writer = PyESGWriter(output_file_path, layout=pyesg_config.output_file_layout,
+                               tile_number_of_simulations=pyesg_config.tile_number_of_simulations,
+                               tile_number_of_time_steps=pyesg_config.tile_number_of_time_steps,
+                               compression=pyesg_config.output_file_compression,
+                               compression_filter=pyesg_config.output_file_compression_filter,
+                               summary_statistics=pyesg_config.output_file_summary_statistics,
+                               journal_key=journal_key, resume=resume)
     pyesg_writer.write_header(
         pyesg_config.number_of_simulations,
         settings.output_ids,
@@ -82,17 +193,62 @@ def generate_simulations(pyesg_config: Union[str, PyESGConfiguration]):
 
     initialise_models_and_outputs(settings)
 
-    for batch_number in range(pyesg_config.number_of_batches):
-        settings.reset_output_values()  # Set output values array to zeros.
-
-        generated_random_drivers = generate_random_drivers(settings)
-        assign_generated_random_drivers_to_models(generated_random_drivers, settings)
-
-        for projection_step in range(pyesg_config.number_of_projection_steps + 1):
-            for output in settings.dependent_model_outputs + settings.specified_model_outputs:
-                output.calculate_for_batch(projection_step)
+    # When writing in the background, batch k is written while batch k + 1 is generated in the other array of output
+    # values, so only one batch can be waiting to be written.
+    background_writer = None
+    if pyesg_config.write_in_background:
+        background_writer = BackgroundWriter(pyesg_writer, max_pending_batches=settings.number_output_value_buffers - 1)
+    batch_writer = background_writer or pyesg_writer
 
+    def write_batch(batch_number: int, output_values: np.ndarray, checkpoint: dict = None):
         # Add 1 to `batch_number` because it's zero-indexed and the argument expects a one-indexed number.
-        pyesg_writer.write_batch_of_simulations(batch_number + 1, pyesg_config.number_of_batches, settings.output_values)
-
-    pyesg_writer.finalise()
+        batch_writer.write_batch_of_simulations(batch_number + 1, settings.number_of_batches, output_values,
+                                                first_simulation=settings.get_batch_first_simulation(batch_number),
+                                                checkpoint=checkpoint)
+
+    # Batches already written by an interrupted run (keyed by their one-indexed batch number) are not generated again.
+    completed_batches = pyesg_writer.completed_batches
+    remaining_batches = [batch_number for batch_number in range(settings.number_of_batches)
+                         if batch_number + 1 not in completed_batches]
+
+    try:
+        if workers is None or workers == 1:
+            for batch_number in remaining_batches:
+                if workers is None:
+                    # All batches draw from a single random stream, so the state of the stream after the previous
+                    # batch is needed to carry on from it. The previous batch has one-indexed number `batch_number`.
+                    random_generator = settings.random_generator
+                    if batch_number in completed_batches:
+                        set_random_generator_state(random_generator, completed_batches[batch_number]["random_state"])
+                else:
+                    random_generator = settings.get_batch_random_generator(batch_number)
+                output_values = generate_batch(settings, batch_number, random_generator)
+                checkpoint = {"random_state": get_random_generator_state(random_generator)} if workers is None else {}
+                write_batch(batch_number, output_values, checkpoint)
+                del output_values  # Release the output values (if reallocated) before the next batch is generated
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_initialise_worker,
+                                     initargs=(pyesg_config._encode_json(),)) as executor:
+                # Only one batch per worker is submitted at a time, so that finished batches waiting to be written do
+                # not build up in memory. Another batch is submitted each time a batch is written.
+                batches_to_submit = iter(remaining_batches)
+                futures = {executor.submit(_generate_batch_in_worker, batch_number)
+                           for batch_number in itertools.islice(batches_to_submit, workers)}
+                try:
+                    while futures:
+                        # Batches are written as soon as they finish, which may not be the order in which they were
+                        # submitted.
+                        finished_futures, futures = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in finished_futures:
+                            write_batch(*future.result(), checkpoint={})
+                            for batch_number in itertools.islice(batches_to_submit, 1):
+                                futures.add(executor.submit(_generate_batch_in_worker, batch_number))
+                except BaseException:
+                    # Batches which have not started are cancelled rather than generated before the error is raised.
+                    executor.shutdown(cancel_futures=True)
+                    raise
+    finally:
+        if background_writer is not None:
+            background_writer.close()  # Stop the background thread even if generating a batch failed
+
+    batch_writer.finalise()
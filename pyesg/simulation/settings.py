@@ -2,10 +2,105 @@ import itertools
 import numpy as np
 
 from dateutil import parser, rrule
+from typing import List, Union
 
 from pyesg.configuration.pyesg_configuration import PyESGConfiguration
+from pyesg.constants.engine_modes import TIME_VECTORISED
+from pyesg.constants.file_layouts import TILED
 from pyesg.constants.projection_frequency import *
-from pyesg.utils import get_duplicates
+from pyesg.constants.random_number_generators import *
+from pyesg.io.compression import ENCODER_MEMORY
+from pyesg.io.summary_statistics import SummaryStatistics
+from pyesg.utils import get_duplicates, parse_memory_size
+
+
+def create_random_generator(seed_sequence: np.random.SeedSequence,
+                            random_number_generator: str) -> Union[np.random.RandomState, np.random.Generator]:
+    """
+    Creates a Numpy random generator of the required type.
+    Args:
+        seed_sequence: The seed sequence from which to seed the random generator.
+        random_number_generator: The random number generator. This is a value from
+                                 pyesg.constants.random_number_generators.
+
+    Returns:
+        The random generator.
+
+    For the legacy random number generator, a seed sequence without a spawn key is seeded directly with its entropy so
+    that the random numbers match those from `np.random.RandomState(random_seed)`.
+    """
+    if random_number_generator == LEGACY:
+        if not seed_sequence.spawn_key:
+            return np.random.RandomState(seed_sequence.entropy)
+        return np.random.RandomState(np.random.MT19937(seed_sequence))
+    elif random_number_generator == PCG64:
+        return np.random.Generator(np.random.PCG64(seed_sequence))
+    elif random_number_generator == PHILOX:
+        return np.random.Generator(np.random.Philox(seed_sequence))
+    raise ValueError(f"Random number generator {random_number_generator} is not supported.")
+
+
+def get_random_generator_state(random_generator: Union[np.random.RandomState, np.random.Generator]) -> dict:
+    """
+    Returns the state of a Numpy random generator in a form which can be serialised as JSON.
+    Args:
+        random_generator: The random generator.
+
+    Returns:
+        The state of the random generator, with any arrays in the state stored as lists with their type.
+    """
+    def encode(value):
+        if isinstance(value, dict):
+            return {key: encode(item) for key, item in value.items()}
+        if isinstance(value, np.ndarray):
+            return {"array": value.tolist(), "dtype": value.dtype.str}
+        return value.item() if isinstance(value, np.generic) else value
+
+    if isinstance(random_generator, np.random.Generator):
+        return encode(random_generator.bit_generator.state)
+    return encode(random_generator.get_state(legacy=False))
+
+
+def set_random_generator_state(random_generator: Union[np.random.RandomState, np.random.Generator], state: dict):
+    """
+    Restores the state of a Numpy random generator from the state returned by `get_random_generator_state`.
+    Args:
+        random_generator: The random generator.
+        state: The state of the random generator.
+    """
+    def decode(value):
+        if isinstance(value, dict):
+            if set(value) == {"array", "dtype"}:
+                return np.array(value["array"], dtype=value["dtype"])
+            return {key: decode(item) for key, item in value.items()}
+        return value
+
+    if isinstance(random_generator, np.random.Generator):
+        random_generator.bit_generator.state = decode(state)
+    else:
+        random_generator.set_state(decode(state))
+
+
+def factorise_correlation_matrix(correlation_matrix: np.ndarray, random_number_generator: str) -> np.ndarray:
+    """
+    Factorises a correlation matrix into a matrix which can be used to correlate independent standard normal samples.
+    Args:
+        correlation_matrix: The correlation matrix.
+        random_number_generator: The random number generator. This is a value from
+                                 pyesg.constants.random_number_generators.
+
+    Returns:
+        A matrix F such that F.T @ F is equal to the correlation matrix. If each row of an array contains independent
+        standard normal samples, then post-multiplying the array by F gives rows of correlated samples.
+
+    For the legacy random number generator, the factor is calculated from the singular value decomposition in exactly
+    the same way as `np.random.RandomState.multivariate_normal` so that the same seeded random drivers are produced.
+    Otherwise, the factor is the transpose of the Cholesky factor.
+    """
+    if random_number_generator == LEGACY:
+        _, s, v = np.linalg.svd(correlation_matrix)
+        return np.sqrt(s)[:, None] * v
+    return np.linalg.cholesky(correlation_matrix).T
 
 
 class InitialisedSettings:
@@ -15,28 +110,56 @@ class InitialisedSettings:
         annualisation_factor (float): The number of projection steps per year.
         asset_class_ids (List[str]): List of the IDs of all asset classes being modelled.
         asset_class_models (List[BaseModel]): List of all model classes for asset classes being modelled.
+        batch_size (int): The number of simulations in the current batch of simulations.
+        batch_sizes (List[int]): The number of simulations in each batch of simulations.
+        number_of_batches (int): The number of batches into which the simulations are split during generation.
         specified_model_outputs (List[BaseOutput]): List of all output classes for outputs specified for asset classes.
         dependent_model_outputs (List[BaseOutput]): List of all output classes which are created as dependencies
                                                     for the specified outputs.
+        execution_plan (ExecutionPlan): The order in which all model outputs are calculated for each projection step.
         config (PyESGConfiguration): The underlying pyESG configuration.
-        number_outputs (int): The total number of outputs specified in the pyESG configuration.
+        dtype (np.dtype): The floating point type used for random drivers, model state and output values.
+        number_outputs (int): The total number of outputs written to the output file. An output with a list of terms
+                              counts as one output for each term.
         number_random_drivers (int): The total number of random drivers specified in the pyESG configuration
-        output_ids (List[str]): List of the IDs of all outputs.
+        output_ids (List[str]): List of the IDs of all outputs written to the output file.
         random_driver_ids (List[str]): List of the IDs of all random drivers.
         projection_dates (List[datetime.datetime]): List of projection dates.
-        random_generator (np.random.RandomState): Numpy RandomState for generating seeded random numbers.
+        projection_times (np.ndarray): The time (in years) of each time step, including the initial time step.
+        random_driver_correlation_matrix (np.ndarray): The correlation matrix between all random drivers.
+        random_driver_correlation_factor (np.ndarray): A factor of the correlation matrix which transforms independent
+                                                      standard normal samples into correlated samples when
+                                                      post-multiplied. It is calculated once and reused for all batches.
+        random_generator (Union[np.random.RandomState, np.random.Generator]): Numpy random generator for generating
+                                                                               seeded random numbers.
+        random_drivers (BaseRandomDrivers): The source of random drivers for the current batch of simulations.
+        output_values (np.ndarray): Array containing the values of all outputs for the current batch of simulations.
+                                    It has dimension (number outputs x batch size x number time steps), which matches
+                                    the order of values in the output file.
+        scratch_values (np.ndarray): Array for the values of one output for one projection step in the current batch.
+                                     Outputs use it to hold intermediate results while they are calculated.
+        number_output_value_buffers (int): The number of arrays of output values which are used in turn by successive
+                                           batches. There are two when batches are written in the background, so that
+                                           one batch can be generated while the previous batch is written.
     """
+    # The fraction of the maximum memory, and the number of bytes besides, which are not used for batches of simulations
+    # to allow for memory which is not included in the estimates (e.g. the models and small temporary arrays)
+    memory_safety_margin = 0.05
+    memory_reserve = 1024 ** 2
+
     def __init__(self, pyesg_config: PyESGConfiguration):
         self.config = pyesg_config
+        self.dtype = np.dtype(pyesg_config.compute_dtype)
 
         all_asset_classes = sum([economy.asset_classes for economy in pyesg_config.economies], [])
         self.asset_class_ids = [asset_class.id for asset_class in all_asset_classes]
 
-        self.number_outputs = sum([len(asset_class.outputs) for asset_class in all_asset_classes])
+        all_outputs = sum([asset_class.outputs for asset_class in all_asset_classes], [])
+        self.output_ids = sum([output.get_output_ids() for output in all_outputs], [])
 
-        self.number_random_drivers = sum([len(asset_class.random_drivers) for asset_class in all_asset_classes])
+        self.number_outputs = len(self.output_ids)
 
-        self.output_ids = sum([[output.id for output in asset_class.outputs] for asset_class in all_asset_classes], [])
+        self.number_random_drivers = sum([len(asset_class.random_drivers) for asset_class in all_asset_classes])
 
         self.random_driver_ids = sum([asset_class.random_drivers for asset_class in all_asset_classes], [])
 
@@ -58,6 +181,7 @@ class InitialisedSettings:
             WEEKLY: 52.0,
         }
         self.annualisation_factor = annualisation_factor_mapping[pyesg_config.projection_frequency]
+        self.projection_times = np.arange(pyesg_config.number_of_projection_steps + 1) / self.annualisation_factor
 
         correlation_matrix = np.ones([self.number_random_drivers, self.number_random_drivers])
         combinations = itertools.product(enumerate(self.random_driver_ids), enumerate(self.random_driver_ids))
@@ -65,25 +189,173 @@ class InitialisedSettings:
             correlation_matrix[row_index, column_index] = pyesg_config.correlations.get_correlation(row_driver_id,
                                                                                                     column_driver_id)
         self.random_driver_correlation_matrix = correlation_matrix
-        self.random_generator = np.random.RandomState(pyesg_config.random_seed)
+        self.random_driver_correlation_factor = factorise_correlation_matrix(
+            correlation_matrix, pyesg_config.random_number_generator).astype(self.dtype)
+        self.random_generator = create_random_generator(np.random.SeedSequence(pyesg_config.random_seed),
+                                                        pyesg_config.random_number_generator)
 
         self.asset_class_models = []
         self.specified_model_outputs = []
         self.dependent_model_outputs = []
+        self.execution_plan = None
+
+        self.number_of_batches = None
+        self.batch_sizes = None  # type: List[int]
+        self.batch_size = None
 
+        self.random_drivers = None
         self.output_values = None
+        self.scratch_values = None
+        self.number_output_value_buffers = 2 if pyesg_config.write_in_background else 1
+        self._output_value_buffers = [None] * self.number_output_value_buffers  # type: List[np.ndarray]
 
-    def reset_output_values(self):
+    def estimate_memory_per_simulation(self) -> int:
         """
-        Resets the `output_values` attribute to an array of zeros.
+        Estimates the number of bytes of memory needed for each simulation in a batch of simulations.
+        Returns:
+            The estimated number of bytes of memory needed for each simulation in a batch.
 
-        This should be used in between batches of simulations to reset the values.
+        The estimate includes the output values for all outputs, the random drivers, the values held by each output
+        in the execution plan (including temporary arrays created when calculating them) and the copy of the values of
+        an output which the writer makes to convert them to single precision. The execution plan must have been built
+        before calling this method.
         """
-        batch_size = int(self.config.number_of_simulations / self.config.number_of_batches)
+        size_of_float = self.dtype.itemsize
+        number_time_steps = self.config.number_of_projection_steps + 1
+        # Outputs with a list of terms hold a value for each term
+        number_values_in_plan = sum(output.block_size or 1 for output in self.execution_plan.outputs)
+
+        # Output values for the batch (and the previous batch while it is written in the background)
+        memory = self.number_output_value_buffers * self.number_outputs * number_time_steps * size_of_float
+
+        if self.config.stream_random_drivers:
+            memory += self.number_random_drivers * size_of_float
+        else:
+            memory += self.config.number_of_projection_steps * self.number_random_drivers * size_of_float
+
+        if self.config.engine_mode == TIME_VECTORISED:
+            # Each output holds its values for all time steps plus a similar amount in temporary arrays
+            memory += 2 * number_values_in_plan * number_time_steps * size_of_float
+        else:
+            # Outputs which are not written hold their latest and previous values in their own buffers and all outputs
+            # share one scratch array for intermediate results (fused outputs also have their own arrays)
+            number_extra_values = sum(output.number_extra_values for output in self.execution_plan.outputs)
+            memory += (2 * number_values_in_plan + 1 + number_extra_values) * size_of_float
+
+        # The writer converts the values of one output at a time to single precision floats, unless they already are
+        if self.dtype != np.float32:
+            memory += number_time_steps * np.dtype(np.float32).itemsize
+
+        return memory
+
+    def estimate_fixed_memory(self) -> int:
+        """
+        Estimates the number of bytes of memory needed for a batch of simulations which does not depend on the number
+        of simulations in the batch.
+        Returns:
+            The estimated number of bytes of memory needed regardless of the batch size.
+
+        This includes the scratch array used to calculate the summary statistics for the output file, if they are
+        stored, and the tiles for a block of simulations of an output and the memory used by the compression codec while
+        they are written, if the output file has the tiled layout.
+        """
+        number_time_steps = self.config.number_of_projection_steps + 1
+        size_of_single = np.dtype(np.float32).itemsize
+        memory = 0
+
+        if self.config.output_file_summary_statistics:
+            number_simulations, _ = SummaryStatistics.get_scratch_shape(self.config.number_of_simulations,
+                                                                        number_time_steps)
+            memory += number_simulations * number_time_steps * np.dtype(np.float64).itemsize
+
+        if self.config.output_file_layout == TILED:
+            # The tiles for a block of simulations are built up and then joined before they are written
+            number_simulations = min(self.config.tile_number_of_simulations, self.config.number_of_simulations)
+            memory += 2 * number_simulations * number_time_steps * size_of_single
+            if self.config.output_file_compression is not None:
+                # Each tile is copied and filtered before it is compressed
+                tile_size = number_simulations * min(self.config.tile_number_of_time_steps, number_time_steps)
+                memory += 4 * tile_size * size_of_single + ENCODER_MEMORY[self.config.output_file_compression]
+
+        return memory
+
+    def calculate_batch_sizes(self):
+        """
+        Calculates the number of batches and the number of simulations in each batch.
+
+        If the number of batches is specified in the pyESG configuration, all batches have the same size. Otherwise,
+        the batch size is the largest that fits within the maximum memory specified in the pyESG configuration, less
+        `memory_safety_margin` of it and `memory_reserve` bytes for memory which is not estimated, and the last batch
+        may be smaller than the others. The execution plan must have been built before calling this method.
+        """
+        number_of_simulations = self.config.number_of_simulations
+        if self.config.number_of_batches is not None:
+            batch_size = number_of_simulations // self.config.number_of_batches
+            self.batch_sizes = [batch_size] * self.config.number_of_batches
+        else:
+            max_memory = parse_memory_size(self.config.max_memory) * (1.0 - self.memory_safety_margin)
+            available_memory = int(max_memory) - self.memory_reserve - self.estimate_fixed_memory()
+            max_batch_size = max(available_memory, 0) // self.estimate_memory_per_simulation()
+            if max_batch_size < 1:
+                raise ValueError(f"The maximum memory {self.config.max_memory} is not enough for a single simulation.")
+            batch_size = min(number_of_simulations, max_batch_size)
+            number_of_full_batches, last_batch_size = divmod(number_of_simulations, batch_size)
+            self.batch_sizes = [batch_size] * number_of_full_batches + ([last_batch_size] if last_batch_size else [])
+
+        self.number_of_batches = len(self.batch_sizes)
+
+    def get_batch_first_simulation(self, batch_number: int) -> int:
+        """
+        Returns the index of the first simulation in a batch amongst all simulations.
+        Args:
+            batch_number: The (zero-indexed) batch number.
+
+        Returns:
+            The (zero-indexed) index of the first simulation in the batch.
+        """
+        return sum(self.batch_sizes[:batch_number])
+
+    def get_batch_random_generator(self, batch_number: int) -> Union[np.random.RandomState, np.random.Generator]:
+        """
+        Returns a random generator with an independent random stream for a single batch of simulations.
+        Args:
+            batch_number: The (zero-indexed) batch number.
+
+        Returns:
+            A Numpy random generator for generating random numbers for the batch.
+
+        The stream is derived deterministically from the random seed and the batch number so the random numbers for a
+        batch do not depend on the order in which batches are generated.
+        """
+        seed_sequence = np.random.SeedSequence(self.config.random_seed, spawn_key=(batch_number,))
+        return create_random_generator(seed_sequence, self.config.random_number_generator)
+
+    def reset_output_values(self, batch_number: int = 0):
+        """
+        Resets the `output_values` attribute to an array of zeros and sets the batch size for a batch.
+        Args:
+            batch_number: The (zero-indexed) batch number of the batch about to be generated.
+
+        This should be used in between batches of simulations to reset the values. Batches use the arrays of output
+        values in `number_output_value_buffers` in turn. An array is zero-filled and reused if the batch size has not
+        changed, so that it is only allocated once for all batches of the same size.
+        """
+        self.batch_size = self.batch_sizes[batch_number]
         # Add 1 to number of projection steps because the value in config doesn't include initial time step.
-        self.output_values = np.zeros([self.number_outputs,
-                                       self.config.number_of_projection_steps + 1,
-                                       batch_size])
+        shape = (self.number_outputs, self.batch_size, self.config.number_of_projection_steps + 1)
+        buffer_index = batch_number % self.number_output_value_buffers
+        output_values = self._output_value_buffers[buffer_index]
+        if output_values is not None and output_values.shape == shape:
+            output_values.fill(0.0)
+        else:
+            # Release the array for a different batch size before allocating the new one.
+            self._output_value_buffers[buffer_index] = output_values = self.output_values = None
+            output_values = np.zeros(shape, dtype=self.dtype)
+            self._output_value_buffers[buffer_index] = output_values
+        self.output_values = output_values
+
+        if self.scratch_values is None or self.scratch_values.shape != (self.batch_size,):
+            self.scratch_values = np.empty(self.batch_size, dtype=self.dtype)
 
 
 def validate_initialised_settings(settings: InitialisedSettings):
@@ -94,9 +366,20 @@ def validate_initialised_settings(settings: InitialisedSettings):
     Args:
         settings: The initialised settings for the pyESG configuration.
     """
+    # Check that exactly one of number of batches and max memory is specified
+    assert (settings.config.number_of_batches is None) != (settings.config.max_memory is None), \
+        "Exactly one of number of batches and max memory must be specified."
+
     # Check that number of batches divides number of sims
-    assert settings.config.number_of_simulations % settings.config.number_of_batches == 0, \
-        "Number of simulations must be a multiple of the number of batches."
+    if settings.config.number_of_batches is not None:
+        assert settings.config.number_of_simulations % settings.config.number_of_batches == 0, \
+            "Number of simulations must be a multiple of the number of batches."
+
+    assert not (settings.config.stream_random_drivers and settings.config.engine_mode == TIME_VECTORISED), \
+        "Random drivers cannot be streamed in the time-vectorised engine mode."
+
+    assert settings.config.output_file_compression is None or settings.config.output_file_layout == TILED, \
+        "The output file can only be compressed if it has the tiled layout."
 
     duplicate_asset_classes = get_duplicates(settings.asset_class_ids)
     assert len(duplicate_asset_classes) == 0, \
@@ -1,5 +1,6 @@
 from pyesg.configuration.pyesg_configuration import Parameters
-from pyesg.yield_curve.yield_curve import YieldCurve
+from pyesg.constants.yield_curve_methods import LINEAR, NO_EXTRAPOLATION
+from pyesg.yield_curve.yield_curve import YieldCurve, get_yield_curve
 
 
 def extract_yield_curve_from_parameters(parameters: Parameters) -> YieldCurve:
@@ -13,11 +14,25 @@ def extract_yield_curve_from_parameters(parameters: Parameters) -> YieldCurve:
 
     Points on the yield curve are specified as a key, value pair in `parameters` where the key is of the form
     "yc_{term}" and the value is the continuously compounded short rate associated with the term.
+
+    The methods of interpolating and extrapolating the points are specified by the optional parameters
+    "yield_curve_interpolation" (e.g. "linear", "monotone_cubic") and "yield_curve_extrapolation" (e.g. "none",
+    "smith_wilson"). Smith-Wilson extrapolation also uses the parameters "ultimate_forward_rate" (continuously
+    compounded) and "convergence_speed" (optional, defaults to 0.1).
+
+    Yield curves are shared between all parameters with the same points, so the curve (and any rates cached on it) is
+    only built once for all models and validators which use it.
     """
-    yield_curve = YieldCurve()
     yc_prefix = "yc_"
+    points = []
     for key, value in parameters.__dict__.items():
         if key.lower().startswith("yc_"):
             term = float(key.split(yc_prefix)[1])
-            yield_curve.add_point(term, value)
-    return yield_curve
+            points.append((term, value))
+    return get_yield_curve(
+        tuple(points),
+        interpolation=getattr(parameters, "yield_curve_interpolation", LINEAR),
+        extrapolation=getattr(parameters, "yield_curve_extrapolation", NO_EXTRAPOLATION),
+        ultimate_forward_rate=getattr(parameters, "ultimate_forward_rate", None),
+        convergence_speed=getattr(parameters, "convergence_speed", 0.1),
+    )
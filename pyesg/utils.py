@@ -1,5 +1,7 @@
+import re
+
 from collections import Counter
-from typing import Iterable
+from typing import Iterable, Union
 
 
 def get_duplicates(x: Iterable):
@@ -12,3 +14,24 @@ def get_duplicates(x: Iterable):
         The duplicate values in `x`
     """
     return [item for item, count in Counter(x).items() if count > 1]
+
+
+def parse_memory_size(memory_size: Union[str, int]) -> int:
+    """
+    Returns the number of bytes in a memory size.
+    Args:
+        memory_size: The memory size. This is either a number of bytes or a string containing a number and a unit
+                     (e.g. "4GB", "512 MB"). Units are powers of 1024 bytes (i.e. "KB" and "KiB" are both 1024 bytes).
+
+    Returns:
+        The number of bytes in the memory size.
+    """
+    if isinstance(memory_size, int):
+        return memory_size
+
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:I?B)?\s*", memory_size.upper())
+    if not match:
+        raise ValueError(f"The memory size {memory_size} is invalid. It should be of the form '4GB'.")
+
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** " KMGT".index(unit or " "))
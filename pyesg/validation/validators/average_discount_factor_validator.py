@@ -33,8 +33,8 @@ class AverageDiscountFactorValidator(BaseValidator):
         )
         # Expected values are points on initial yield curve
         yield_curve = extract_yield_curve_from_parameters(self._asset_class.parameters)
-        expected_values = [yield_curve.get_rate(i / self._data_extractor.reader.annualisation_factor)
-                           for i in np.arange(1, self._data_extractor.reader.number_of_time_steps)]
+        times = time_steps / self._data_extractor.reader.annualisation_factor
+        expected_values = yield_curve.get_rates_on_grid(times).tolist()
 
         # Transform results from bond prices to yields
         # Don't use "time" key in results because this is constructed assuming time starts at 0
@@ -50,8 +50,8 @@ class DiscountedZCBValidator(BaseValidator):
         )
 
         # Expected values are points on initial yield curve. The point at time t is the rate for term (t+ zcb_term)
-        expected_values = [yield_curve.get_rate(i / self._data_extractor.reader.annualisation_factor + term)
-                           for i in np.arange(1, self._data_extractor.reader.number_of_time_steps)]
+        times = time_steps / self._data_extractor.reader.annualisation_factor
+        expected_values = yield_curve.get_rates_on_grid(times, term_offset=term).tolist()
 
         # Transform results from bond prices to yields
         # Don't use "time" key in results because this is constructed assuming time starts at 0
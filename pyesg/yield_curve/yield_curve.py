@@ -1,7 +1,12 @@
-import bisect
 import numpy as np
 
-from typing import Dict, List
+from collections import OrderedDict
+from functools import lru_cache
+from scipy.interpolate import PchipInterpolator
+from typing import Dict, Tuple, Union
+
+from pyesg.constants.yield_curve_methods import LINEAR, MONOTONE_CUBIC, INTERPOLATION_METHODS, NO_EXTRAPOLATION, \
+    SMITH_WILSON, EXTRAPOLATION_METHODS
 
 CC_SPOT_RATE = "cc_spot_rate"
 ZCB = "zcb"
@@ -10,15 +15,52 @@ ZCB = "zcb"
 class YieldCurve:
     """
     Class for specifying and extracting rates from a yield curve including interpolation of unspecified points.
+
+    Spot rates between the points are interpolated linearly or with a monotone cubic (PCHIP) spline of the spot rates,
+    which is smooth and does not overshoot the points. Beyond the last point, the curve can be extrapolated with the
+    Smith-Wilson method, which fits the prices of zero-coupon bonds at every point and converges to an ultimate forward
+    rate. The coefficients are fitted once, when the curve is first used after points are added.
+
+    Yield curves created by `get_yield_curve` are shared, so points cannot be added to them.
+    Args:
+        interpolation: (Optional) The method of interpolating between points (e.g. 'linear', 'monotone_cubic').
+                       Defaults to linear interpolation.
+        extrapolation: (Optional) The method of extrapolating beyond the last point (e.g. 'none', 'smith_wilson'). If
+                       'none' (the default), terms beyond the last point raise a ValueError.
+        ultimate_forward_rate: (Optional) The continuously compounded ultimate forward rate for Smith-Wilson
+                               extrapolation.
+        convergence_speed: (Optional) The speed (alpha) at which the forward rate converges to the ultimate forward
+                           rate for Smith-Wilson extrapolation. Defaults to 0.1.
     """
-    def __init__(self):
+    # The maximum number of grids for which rates are cached by `get_rates_on_grid`
+    grid_cache_size = 64
+
+    def __init__(self, interpolation: str = LINEAR, extrapolation: str = NO_EXTRAPOLATION,
+                 ultimate_forward_rate: float = None, convergence_speed: float = 0.1):
+        if interpolation not in INTERPOLATION_METHODS:
+            raise ValueError(f"Interpolation method {interpolation} is not supported.")
+        if extrapolation not in EXTRAPOLATION_METHODS:
+            raise ValueError(f"Extrapolation method {extrapolation} is not supported.")
+        if extrapolation == SMITH_WILSON and (ultimate_forward_rate is None or convergence_speed <= 0):
+            raise ValueError("Smith-Wilson extrapolation needs an ultimate forward rate and a positive convergence "
+                             "speed.")
+
         # Set so that term 0 gives rate = 0
         self._mapping = {0: 0}  # type: Dict[float, float]
-        self._terms = []  # type: List[float]
-        self._rates = []  # type: List[float]
+        self._terms = np.zeros(0)  # type: np.ndarray
+        self._rates = np.zeros(0)  # type: np.ndarray
         self._is_sorted = False
         self._max_term = None
         self._min_term = None
+        self._is_frozen = False
+        self._grid_cache = OrderedDict()  # type: Dict[tuple, np.ndarray]
+
+        self._interpolation = interpolation
+        self._extrapolation = extrapolation
+        self._ultimate_forward_rate = ultimate_forward_rate
+        self._convergence_speed = convergence_speed
+        self._spline = None  # type: PchipInterpolator
+        self._smith_wilson_coefficients = None  # type: Tuple[float, float]
 
         self._rate_functions = {
             CC_SPOT_RATE: self._get_spot_rate,
@@ -27,14 +69,58 @@ class YieldCurve:
 
     def _resort_terms_and_rates(self) -> None:
         """
-        Resorts the self._terms and self._rates list.
+        Resorts the terms and rates into the self._terms and self._rates arrays, which are used for interpolation.
         """
-        self._terms = sorted(self._mapping)
-        self._rates = [self._mapping[term] for term in self._terms]
+        self._terms = np.array(sorted(self._mapping), dtype=np.float64)
+        self._rates = np.array([self._mapping[term] for term in self._terms], dtype=np.float64)
         self._min_term = self._terms[0]
         self._max_term = self._terms[-1]
         self._is_sorted = True
 
+        if len(self._terms) < 2:
+            return
+        if self._interpolation == MONOTONE_CUBIC:
+            self._spline = PchipInterpolator(self._terms, self._rates)
+        if self._extrapolation == SMITH_WILSON:
+            self._fit_smith_wilson()
+
+    def _fit_smith_wilson(self) -> None:
+        """
+        Fits the Smith-Wilson curve to the prices of zero-coupon bonds for the points with positive terms.
+
+        The Smith-Wilson price of a zero-coupon bond with term t is exp(-ufr * t) + sum_j zeta_j W(t, u_j), where u_j
+        are the terms of the points and W is the Wilson kernel. Beyond the last point, this simplifies to
+        exp(-ufr * t) * (1 + a - b * exp(-alpha * t)), so only the coefficients a and b are stored.
+        """
+        ufr, alpha = self._ultimate_forward_rate, self._convergence_speed
+        terms = self._terms[self._terms > 0]
+        prices = np.exp(-terms * self._rates[self._terms > 0])
+
+        min_terms = np.minimum.outer(terms, terms)
+        max_terms = np.maximum.outer(terms, terms)
+        kernel = np.exp(-ufr * np.add.outer(terms, terms)) * (
+            alpha * min_terms - np.exp(-alpha * max_terms) * np.sinh(alpha * min_terms)
+        )
+        zeta = np.linalg.solve(kernel, prices - np.exp(-ufr * terms))
+
+        weights = zeta * np.exp(-ufr * terms)
+        self._smith_wilson_coefficients = (float(np.sum(weights * alpha * terms)),
+                                           float(np.sum(weights * np.sinh(alpha * terms))))
+
+    def _get_extrapolated_spot_rate(self, terms: np.ndarray) -> np.ndarray:
+        """
+        Returns the Smith-Wilson spot rates for terms beyond the last point.
+        Args:
+            terms: An array of terms, each greater than the last term of the points.
+
+        Returns:
+            The continuously compounded spot rates for the terms.
+        """
+        a, b = self._smith_wilson_coefficients
+        # log of exp(-ufr * t) * (1 + a - b * exp(-alpha * t)), divided by -t
+        prices_without_ufr = 1.0 + a - b * np.exp(-self._convergence_speed * terms)
+        return self._ultimate_forward_rate - np.log(prices_without_ufr) / terms
+
     def add_point(self, term: float, rate: float) -> None:
         """
         Adds a point to the yield curve.
@@ -42,64 +128,158 @@ class YieldCurve:
             term: The term of the point.
             rate: The continuously compounded spot rate of the point.
         """
+        if self._is_frozen:
+            raise ValueError("Points cannot be added to a shared yield curve.")
         self._mapping[term] = rate
         self._is_sorted = False
+        self._grid_cache.clear()
 
-    def get_rate(self, term: float, rate_type: str = CC_SPOT_RATE):
+    def freeze(self) -> None:
+        """
+        Prevents any more points being added to the yield curve, so that it can be shared. The curve is fitted to its
+        points at once.
+        """
+        self._is_frozen = True
+        if not self._is_sorted:
+            self._resort_terms_and_rates()
+
+    def get_rates_on_grid(self, times: np.ndarray, rate_type: str = CC_SPOT_RATE,
+                          term_offset: float = 0.0) -> np.ndarray:
+        """
+        Returns the rates for the terms on a grid of times (e.g. the projection times of a run), offset by a fixed term.
+        Args:
+            times: The grid of times.
+            rate_type: (Optional) The type of rate (e.g. 'cc_spot_rate', 'zcb'). Defaults to the continuously
+                       compounded spot rate.
+            term_offset: (Optional) The term added to each time (e.g. the term of a zero-coupon bond). Defaults to 0.
+
+        Returns:
+            A read-only array of the rates for the terms `times + term_offset`.
+
+        The rates are calculated the first time they are requested for a grid and cached, so models and validators
+        which use the same grid share them. Only the rates for the last `grid_cache_size` grids used are kept, so a
+        shared curve used by many runs with different grids does not grow without limit.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        key = (rate_type, float(term_offset), times.shape, times.tobytes())
+        rates = self._grid_cache.get(key)
+        if rates is not None:
+            self._grid_cache.move_to_end(key)
+            return rates
+
+        rates = np.asarray(self.get_rate(times + term_offset, rate_type), dtype=np.float64)
+        rates.setflags(write=False)
+        self._grid_cache[key] = rates
+        if len(self._grid_cache) > self.grid_cache_size:
+            self._grid_cache.popitem(last=False)  # Forget the rates used least recently
+        return rates
+
+    def get_rate(self, term: Union[float, np.ndarray], rate_type: str = CC_SPOT_RATE) -> Union[float, np.ndarray]:
+        """
+        Returns the rate of the specified type for a term or an array of terms.
+        Args:
+            term: The term of the point on the yield curve, or an array of terms.
+            rate_type: (Optional) The type of rate (e.g. 'cc_spot_rate', 'zcb'). Defaults to the continuously
+                       compounded spot rate.
+
+        Returns:
+            The rate for the term, or an array of the rates for each term with the same shape as `term`.
+        """
         rate_function = self._rate_functions.get(rate_type)
         if not rate_function:
             raise ValueError(f"Rate type {rate_type} is not supported.")
 
         return rate_function(term)
 
-    def _get_spot_rate(self, term: float) -> float:
+    def _get_spot_rate(self, term: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
         """
         Returns a rate with the specified term. If the term does not exist, interpolation between points is attempted.
         Args:
-            term: The term of the point on the yield curve.
+            term: The term of the point on the yield curve, or an array of terms.
 
         Returns:
-            The continuously compounded spot rate for the specified term.
+            The continuously compounded spot rate for the specified term, or an array of rates for an array of terms.
+
+        All terms are interpolated at once using the sorted terms and rates, which are only rebuilt when points are
+        added.
         """
-        if term < 0:
+        terms = np.asarray(term, dtype=np.float64)
+        if np.any(terms < 0):
             raise ValueError("A negative term cannot be used.")
 
-        # Get rate if it's already been specified.
-        rate = self._mapping.get(term)
-
         if not self._is_sorted:
             self._resort_terms_and_rates()
 
         # Can't find rate so need to interpolate with what we've got
-        if not self._terms:
+        if len(self._terms) < 2:
             raise ValueError("No terms and rates specified that can be used for interpolation in the yield curve.")
 
-        if term > self._max_term:
+        beyond_max_term = terms > self._max_term
+        if self._extrapolation == NO_EXTRAPOLATION and np.any(beyond_max_term):
             raise ValueError("The specified term exceeds the maximum term in the yield curve. Interpolation cannot"
                              "be carried out.")
 
-        if term < self._min_term:
+        if np.any(terms < self._min_term):
             raise ValueError("The specified term is below the minimum term in the yield curve. Interpolation cannot"
                              "be carried out.")
 
-        # Look up the index in self._terms and self._rates for the first term immediately AFTER the specified term.
-        index_after = bisect.bisect_left(self._terms, term)
-        term_after = self._terms[index_after]
-        term_before = self._terms[index_after - 1]
-        rate_after = self._rates[index_after]
-        rate_before = self._rates[index_after - 1]
+        # Terms beyond the maximum term are interpolated at the maximum term and then replaced by extrapolated rates.
+        interpolated_terms = np.minimum(terms, self._max_term)
+        if self._interpolation == MONOTONE_CUBIC:
+            rates = self._spline(interpolated_terms)
+        else:
+            # Look up the index in self._terms and self._rates for the first term at or AFTER each specified term. The
+            # first term (0) is interpolated between the first two points.
+            index_after = np.searchsorted(self._terms, interpolated_terms, side="left")
+            index_after = np.clip(index_after, 1, len(self._terms) - 1)
+            term_after = self._terms[index_after]
+            term_before = self._terms[index_after - 1]
+            rate_after = self._rates[index_after]
+            rate_before = self._rates[index_after - 1]
+
+            # interpolate
+            rates = rate_before + (interpolated_terms - term_before) / (term_after - term_before) \
+                * (rate_after - rate_before)
 
-        # interpolate
-        return rate_before + (term - term_before) / (term_after - term_before) * (rate_after - rate_before)
+        if np.any(beyond_max_term):
+            extrapolated_rates = self._get_extrapolated_spot_rate(np.maximum(terms, self._max_term))
+            rates = np.where(beyond_max_term, extrapolated_rates, rates)
+        return float(rates) if rates.ndim == 0 else rates
 
-    def _get_zcb(self, term: float) -> float:
+    def _get_zcb(self, term: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
         """
         Returns a rate with the specified term. If the term does not exist, interpolation between points is attempted.
         Args:
-            term: The term of the point on the yield curve.
+            term: The term of the point on the yield curve, or an array of terms.
 
         Returns:
-            The rate for the specified term expressed as a zero coopon bond price.
+            The rate for the specified term expressed as a zero coopon bond price, or an array of prices for an array of
+            terms.
         """
         cc_rate = self._get_spot_rate(term)
-        return np.exp(- term * cc_rate)
+        return np.exp(- np.asarray(term) * cc_rate)
+
+
+@lru_cache(maxsize=32)
+def get_yield_curve(points: Tuple[Tuple[float, float], ...], interpolation: str = LINEAR,
+                    extrapolation: str = NO_EXTRAPOLATION, ultimate_forward_rate: float = None,
+                    convergence_speed: float = 0.1) -> YieldCurve:
+    """
+    Returns the yield curve with the specified points and methods, creating it the first time it is requested.
+    Args:
+        points: The term and continuously compounded spot rate of each point, as a tuple of (term, rate) tuples.
+        interpolation: (Optional) The method of interpolating between points. Defaults to linear interpolation.
+        extrapolation: (Optional) The method of extrapolating beyond the last point. Defaults to no extrapolation.
+        ultimate_forward_rate: (Optional) The continuously compounded ultimate forward rate for Smith-Wilson
+                               extrapolation.
+        convergence_speed: (Optional) The convergence speed for Smith-Wilson extrapolation. Defaults to 0.1.
+
+    Returns:
+        The yield curve. It is shared by everything which requests a yield curve with the same points and methods, so
+        it cannot be changed.
+    """
+    yield_curve = YieldCurve(interpolation, extrapolation, ultimate_forward_rate, convergence_speed)
+    for term, rate in points:
+        yield_curve.add_point(term, rate)
+    yield_curve.freeze()
+    return yield_curve
@@ -0,0 +1,45 @@
+import pytest
+
+from voluptuous import Invalid
+
+from pyesg.configuration.pyesg_configuration import PyESGConfiguration
+from tests.test_simulation import get_simulation_test_input_file_path
+
+
+def load_config_with_output_parameters(tmpdir, **parameters) -> PyESGConfiguration:
+    config = PyESGConfiguration.load_from_file(get_simulation_test_input_file_path("hull_white_annual_all_outputs"))
+    config.output_file_directory = str(tmpdir)
+    config.output_file_name = "parameters"
+    output = config.economies[0].asset_classes[0].outputs[0]
+    for name, value in parameters.items():
+        setattr(output.parameters, name, value)
+    return config
+
+
+def test_valid_parameters_accepted(tmpdir):
+    config = load_config_with_output_parameters(tmpdir, alpha=0.1, terms=[1, 2.5], yield_curve_interpolation="linear",
+                                                yield_curve_extrapolation="smith_wilson")
+    config.validate()
+
+
+@pytest.mark.parametrize("parameters", [
+    {"alpha": "0.1O"},  # Malformed number
+    {"alpha": [0.1]},  # Only the terms are a list
+    {"terms": 1},
+    {"terms": [1, "2O"]},
+    {"yield_curve_interpolation": "cubic"},
+    {"yield_curve_extrapolation": 0.1},
+])
+def test_invalid_parameters_rejected(tmpdir, parameters):
+    config = load_config_with_output_parameters(tmpdir, **parameters)
+    with pytest.raises(Invalid):
+        config.validate()
+
+
+def test_batches_sized_from_max_memory_need_not_specify_number_of_batches(tmpdir):
+    config = load_config_with_output_parameters(tmpdir)
+    config.number_of_batches = None
+    config.max_memory = "1GB"
+    json_obj = config._encode_json()
+    del json_obj["number_of_batches"]
+    PyESGConfiguration._validation_schema(json_obj)
@@ -0,0 +1,220 @@
+import numpy as np
+import os
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List
+
+from pyesg.constants.compression import ZLIB, LZMA, SHUFFLE, DELTA
+from pyesg.constants.file_layouts import CONTIGUOUS, TILED
+from pyesg.io.reader import PyESGReader
+from pyesg.io.writer import PyESGWriter
+from tests.utils import get_tests_directory
+
+
+def get_comparison_file_path(test_name: str) -> str:
+    return os.path.join(get_tests_directory(), "test_files", "simulation_tests", test_name, "comparison.pyesg")
+
+
+def test_memory_mapped_reader_matches_reader():
+    file_path = get_comparison_file_path("hull_white_annual_all_outputs")
+    reader = PyESGReader(file_path)
+    memory_mapped_reader = PyESGReader(file_path, memory_map=True)
+
+    assert memory_mapped_reader.output_ids == reader.output_ids
+    for output_id in reader.output_ids:
+        simulations = memory_mapped_reader.get_output_simulations(output_id)
+        assert isinstance(simulations, np.memmap)
+        assert simulations.dtype == np.float32
+        assert not simulations.flags.writeable
+        assert np.array_equal(simulations, reader.get_output_simulations(output_id))
+        assert np.array_equal(memory_mapped_reader.get_output_simulations_for_single_simulation(output_id, 3),
+                              reader.get_output_simulations_for_single_simulation(output_id, 3))
+
+    reader.close()
+    memory_mapped_reader.close()
+
+
+def test_header_read_in_small_pieces(monkeypatch):
+    file_path = get_comparison_file_path("hull_white_annual_all_outputs")
+    reader = PyESGReader(file_path)
+    monkeypatch.setattr(PyESGReader, "header_read_size", 5)
+    small_reads_reader = PyESGReader(file_path)
+
+    assert small_reads_reader.output_ids == reader.output_ids
+    assert small_reads_reader.time_step_dates == reader.time_step_dates
+    assert small_reads_reader.number_of_simulations == reader.number_of_simulations
+    assert small_reads_reader.annualisation_factor == reader.annualisation_factor
+    assert list(small_reads_reader.time_step_dates_datetime64.astype(datetime)) == reader.time_step_dates
+    assert np.array_equal(small_reads_reader.get_output_simulations(reader.output_ids[-1]),
+                          reader.get_output_simulations(len(reader.output_ids) - 1))
+
+    with pytest.raises(ValueError):
+        reader.get_output_simulations("Not_An_Output")
+    reader.close()
+    small_reads_reader.close()
+
+
+@pytest.mark.parametrize("memory_map", [False, True])
+def test_time_step_reads_match_full_output(memory_map):
+    reader = PyESGReader(get_comparison_file_path("hull_white_annual_all_outputs"), memory_map=memory_map)
+    reader.read_block_size = 7 * reader.number_of_time_steps * reader.size_of_float  # Force several blocks
+
+    for output_id in reader.output_ids:
+        simulations = np.asarray(reader.get_output_simulations(output_id))
+        for time_step in (0, 1, reader.number_of_time_steps - 1):
+            assert np.array_equal(reader.get_output_simulations_for_single_time_step(output_id, time_step),
+                                  simulations[:, time_step])
+
+        time_steps = range(reader.number_of_time_steps - 1, 0, -3)
+        assert np.array_equal(reader.get_output_simulations_for_time_steps(output_id, time_steps),
+                              simulations[:, list(time_steps)])
+
+    with pytest.raises(ValueError):
+        reader.get_output_simulations_for_time_steps(0, [0, reader.number_of_time_steps])
+    reader.close()
+
+
+def write_copy(reader: PyESGReader, file_path: str, batch_sizes: List[int], layout: str = TILED, **writer_kwargs):
+    """
+    Writes a copy of a pyESG file, by default with the tiled layout. The batches are written in reverse order.
+    """
+    simulations = np.stack([reader.get_output_simulations(output_id) for output_id in reader.output_ids])
+    writer = PyESGWriter(file_path, layout=layout, tile_number_of_simulations=7, tile_number_of_time_steps=4,
+                         **writer_kwargs)
+    writer.write_header(reader.number_of_simulations, reader.output_ids, reader.time_step_dates,
+                        reader.annualisation_factor)
+    first_simulations = np.cumsum([0] + batch_sizes[:-1])
+    for batch_number in reversed(range(len(batch_sizes))):
+        first_simulation = first_simulations[batch_number]
+        writer.write_batch_of_simulations(batch_number + 1, len(batch_sizes),
+                                          simulations[:, first_simulation:first_simulation + batch_sizes[batch_number]],
+                                          first_simulation=first_simulation)
+    writer.finalise()
+
+
+@pytest.mark.parametrize("memory_map, compression, compression_filter", [
+    (False, None, None),
+    (True, None, None),
+    (False, ZLIB, None),
+    (False, ZLIB, SHUFFLE),
+    (True, LZMA, DELTA),
+])
+def test_tiled_layout_matches_contiguous_layout(tmpdir, memory_map, compression, compression_filter):
+    reader = PyESGReader(get_comparison_file_path("hull_white_annual_all_outputs"))
+    tiled_file_path = os.path.join(str(tmpdir), "tiled.pyesg")
+    write_copy(reader, tiled_file_path, batch_sizes=[40, 40, 20], compression=compression,
+                     compression_filter=compression_filter)
+    tiled_reader = PyESGReader(tiled_file_path, memory_map=memory_map)
+
+    assert reader.layout == CONTIGUOUS
+    assert tiled_reader.layout == TILED
+    assert tiled_reader.compression == compression
+    assert tiled_reader.output_ids == reader.output_ids
+    assert tiled_reader.time_step_dates == reader.time_step_dates
+    assert tiled_reader.annualisation_factor == reader.annualisation_factor
+
+    for output_id in reader.output_ids:
+        simulations = reader.get_output_simulations(output_id)
+        assert np.array_equal(tiled_reader.get_output_simulations(output_id), simulations)
+        assert np.array_equal(tiled_reader.get_output_simulations_for_single_time_step(output_id, 9),
+                              simulations[:, 9])
+        assert np.array_equal(tiled_reader.get_output_simulations_for_time_steps(output_id, [30, 0, 5]),
+                              simulations[:, [30, 0, 5]])
+        assert np.array_equal(tiled_reader.get_output_simulations_for_single_simulation(output_id, 41),
+                              simulations[40])
+
+    reader.close()
+    tiled_reader.close()
+
+
+@pytest.mark.parametrize("layout", [CONTIGUOUS, TILED])
+def test_summary_statistics_match_simulations(tmpdir, layout):
+    reader = PyESGReader(get_comparison_file_path("hull_white_annual_all_outputs"))
+    file_path = os.path.join(str(tmpdir), "copy.pyesg")
+    write_copy(reader, file_path, batch_sizes=[40, 35, 25], layout=layout, summary_statistics=True)
+    copy_reader = PyESGReader(file_path)
+
+    for output_id in reader.output_ids:
+        simulations = copy_reader.get_output_simulations(output_id)
+        assert np.array_equal(simulations, reader.get_output_simulations(output_id))
+        summary = copy_reader.get_output_summary(output_id)
+        assert summary.count == reader.number_of_simulations
+        assert summary.mean == pytest.approx(np.mean(simulations, axis=0), rel=1e-12, abs=1e-12)
+        assert summary.variance == pytest.approx(np.var(simulations, axis=0, ddof=1), rel=1e-9, abs=1e-12)
+        assert np.array_equal(summary.minimum, np.min(simulations, axis=0))
+        assert np.array_equal(summary.maximum, np.max(simulations, axis=0))
+
+    with pytest.raises(ValueError):
+        reader.get_output_summary(0)
+
+    reader.close()
+    copy_reader.close()
+
+
+@pytest.mark.parametrize("layout, memory_map", [
+    (CONTIGUOUS, False),
+    (CONTIGUOUS, True),
+    (TILED, False),
+])
+def test_read_selection_matches_full_outputs(tmpdir, monkeypatch, layout, memory_map):
+    file_path = get_comparison_file_path("hull_white_annual_all_outputs")
+    if layout == TILED:
+        reader = PyESGReader(file_path)
+        file_path = os.path.join(str(tmpdir), "tiled.pyesg")
+        write_copy(reader, file_path, batch_sizes=[40, 40, 20], compression=ZLIB)
+        reader.close()
+    reader = PyESGReader(file_path, memory_map=memory_map)
+    # Small gaps and blocks so that the selections below are split into several ranges.
+    monkeypatch.setattr(PyESGReader, "read_gap_size", 2 * reader.number_of_time_steps * reader.size_of_float)
+    monkeypatch.setattr(PyESGReader, "read_block_size", 10 * reader.number_of_time_steps * reader.size_of_float)
+    simulations = np.stack([reader.get_output_simulations(output_id) for output_id in reader.output_ids])
+
+    outputs = [reader.output_ids[2], 0, reader.output_ids[-1]]
+    expected_outputs = simulations[[2, 0, len(reader.output_ids) - 1]]
+    for sims, steps in [
+        (slice(10, 60), slice(2, 20)),
+        (slice(None, None, 7), [30, 0, 5, 5]),
+        ([90, 5, 6, 8, 5, 0, 55], None),
+        ([41], [3, 4, 5]),
+    ]:
+        expected = expected_outputs[:, sims] if sims is not None else expected_outputs
+        expected = expected[:, :, steps] if steps is not None else expected
+        assert np.array_equal(reader.read(outputs=outputs, sims=sims, steps=steps), expected)
+
+    assert np.array_equal(reader.read(), simulations)
+    assert np.array_equal(reader.read(outputs=1, sims=[7]), simulations[[1], [7]][:, None])
+    assert reader.read(sims=[]).shape == (len(reader.output_ids), 0, reader.number_of_time_steps)
+    with pytest.raises(ValueError):
+        reader.read(steps=[reader.number_of_time_steps])
+    with pytest.raises(TypeError):
+        reader.read(sims=[1.5])
+
+    reader.close()
+
+
+def test_concurrent_reads_from_one_reader():
+    reader = PyESGReader(get_comparison_file_path("hull_white_annual_all_outputs"))
+    expected = [reader.get_output_simulations(output_id) for output_id in reader.output_ids]
+    number_outputs = len(expected)
+
+    def read(i):
+        output_index = i % number_outputs
+        simulations = expected[output_index]
+        return (np.array_equal(reader.get_output_simulations(output_index), simulations)
+                and np.array_equal(reader.get_output_simulations_for_single_time_step(output_index, i % 10),
+                                   simulations[:, i % 10])
+                and np.array_equal(reader.get_output_simulations_for_single_simulation(output_index, i % 50 + 1),
+                                   simulations[i % 50])
+                and np.array_equal(reader.read(output_index, sims=slice(i % 30, 90), steps=[1, 3])[0],
+                                   simulations[i % 30:90, [1, 3]]))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert all(executor.map(read, range(200)))
+
+    many = reader.read_many(list(reversed(reader.output_ids)), max_workers=4)
+    assert all(np.array_equal(simulations, expected_simulations)
+               for simulations, expected_simulations in zip(many, reversed(expected)))
+
+    reader.close()
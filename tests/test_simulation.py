@@ -1,18 +1,35 @@
+import numpy as np
 import os
 import pytest
+import tracemalloc
 
-from pyesg.configuration.pyesg_configuration import PyESGConfiguration
+from concurrent.futures import ThreadPoolExecutor
+
+from pyesg.configuration.pyesg_configuration import AssetClass, Economy, PyESGConfiguration
+from pyesg.constants.compute_dtypes import FLOAT32
+from pyesg.constants.engine_modes import TIME_VECTORISED
+from pyesg.constants.file_layouts import TILED
+from pyesg.constants.compression import DELTA, LZMA, ZLIB
+from pyesg.io.background_writer import BackgroundWriter
+from pyesg.io.journal import BatchJournal
+from pyesg.io.writer import PyESGWriter
 from pyesg.io.reader import PyESGReader
-from pyesg.simulation.run import generate_simulations
+from pyesg.simulation.run import build_execution_plan, generate_batch, generate_simulations, \
+    initialise_models_and_outputs
+from pyesg.simulation.fusion import FusedOutput
+from pyesg.simulation.settings import InitialisedSettings
+from pyesg.utils import parse_memory_size
 from tests.utils import get_tests_directory
 
 
-def compare_pyesg_files(output_file_path: str, comparison_file_path: str) -> None:
+def compare_pyesg_files(output_file_path: str, comparison_file_path: str, relative_tolerance: float = None) -> None:
     """
     Compares two pyESG files and checks that the values in each are equal (or approximately equal for FP error)
     Args:
         output_file_path: The file path of file to check.
         comparison_file_path: The file path of the file containing the "true" values to check against.
+        relative_tolerance: (Optional) The relative tolerance for simulation values. If None, the default tolerance of
+                            `pytest.approx` is used.
     """
     output = PyESGReader(output_file_path)
     comparison = PyESGReader(comparison_file_path)
@@ -29,9 +46,10 @@ def compare_pyesg_files(output_file_path: str, comparison_file_path: str) -> Non
 
     # Check simulation values for each output
     for output_id in output.output_ids:
-        assert output.get_output_simulations(output_id) == pytest.approx(comparison.get_output_simulations(output_id))
+        assert output.get_output_simulations(output_id) == pytest.approx(comparison.get_output_simulations(output_id),
+                                                                         rel=relative_tolerance)
 
-def run_simulation_test(test_name):
+def run_simulation_test(test_name, relative_tolerance=None, **config_overrides):
     top_level_directory = get_tests_directory()
     simulation_tests_directory = os.path.join(top_level_directory, "test_files", "simulation_tests")
     test_directory = os.path.join(simulation_tests_directory, test_name)
@@ -49,6 +67,10 @@ def run_simulation_test(test_name):
     config.output_file_directory = test_directory
     config.output_file_name = "output"
 
+    # Apply any overrides to the config (e.g. to run the same test in a different engine mode)
+    for key, value in config_overrides.items():
+        setattr(config, key, value)
+
     # Delete output file if it already exists
     output_file_path = os.path.join(config.output_file_directory, config.output_file_name + ".pyesg")
     if os.path.exists(output_file_path):
@@ -57,9 +79,401 @@ def run_simulation_test(test_name):
     # Generate simulations from config
     generate_simulations(config)
 
-    compare_pyesg_files(output_file_path, comparison_file_path)
+    compare_pyesg_files(output_file_path, comparison_file_path, relative_tolerance)
 
 
 def test_hull_white_annual_all_outputs():
     run_simulation_test("hull_white_annual_all_outputs")
 
+
+def test_hull_white_annual_all_outputs_time_vectorised():
+    run_simulation_test("hull_white_annual_all_outputs", engine_mode=TIME_VECTORISED)
+
+
+def test_hull_white_annual_all_outputs_streamed_random_drivers():
+    run_simulation_test("hull_white_annual_all_outputs", stream_random_drivers=True)
+
+
+def test_hull_white_annual_all_outputs_tiled_file_layout():
+    run_simulation_test("hull_white_annual_all_outputs", output_file_layout=TILED, tile_number_of_simulations=7,
+                        tile_number_of_time_steps=4)
+
+
+def test_hull_white_annual_all_outputs_float32():
+    # Single precision simulations are compared against the double precision comparison file, so the tolerance is
+    # wider than the default (see the accuracy table in the README).
+    run_simulation_test("hull_white_annual_all_outputs", relative_tolerance=1e-5, compute_dtype=FLOAT32)
+
+
+
+def get_simulation_test_input_file_path(test_name: str) -> str:
+    """
+    Returns the file path of the input pyESG config for a simulation test.
+    Args:
+        test_name: The name of the simulation test.
+
+    Returns:
+        The file path of the input pyESG config for the simulation test.
+    """
+    return os.path.join(get_tests_directory(), "test_files", "simulation_tests", test_name, "input.json")
+
+
+def test_parallel_batches_independent_of_number_of_workers(tmpdir):
+    config = PyESGConfiguration.load_from_file(get_simulation_test_input_file_path("hull_white_annual_all_outputs"))
+    config.output_file_directory = str(tmpdir)
+    config.number_of_batches = 4
+
+    output_file_paths = []
+    for workers in [1, 2]:
+        config.output_file_name = f"workers_{workers}"
+        generate_simulations(config, workers=workers)
+        output_file_paths.append(os.path.join(str(tmpdir), config.output_file_name + ".pyesg"))
+
+    output = PyESGReader(output_file_paths[0])
+    comparison = PyESGReader(output_file_paths[1])
+    for output_id in output.output_ids:
+        assert (output.get_output_simulations(output_id) == comparison.get_output_simulations(output_id)).all()
+
+
+def test_parallel_run_stops_submitting_batches_after_an_error(tmpdir, monkeypatch):
+    config = PyESGConfiguration.load_from_file(get_simulation_test_input_file_path("hull_white_annual_all_outputs"))
+    config.output_file_directory = str(tmpdir)
+    config.output_file_name = "failed_batches"
+    config.number_of_batches = 10
+
+    generated_batches = []
+
+    def failing_generate_batch_in_worker(batch_number):
+        generated_batches.append(batch_number)
+        raise RuntimeError("Generating the batch failed.")
+
+    # Threads stand in for the worker processes so that the failing batch generation is used by the workers.
+    monkeypatch.setattr("pyesg.simulation.run.ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr("pyesg.simulation.run._generate_batch_in_worker", failing_generate_batch_in_worker)
+    with pytest.raises(RuntimeError, match="Generating the batch failed."):
+        generate_simulations(config, workers=2)
+
+    # Only the batches submitted before the first error (one per worker) are generated.
+    assert len(generated_batches) <= 2
+
+
+@pytest.mark.parametrize("fuse_outputs, number_outputs_in_plan", [
+    # 5 specified outputs plus the Brownian motion and OU process created as dependencies
+    (False, 7),
+    # The two zero-coupon bonds are fused
+    (True, 6),
+])
+def test_execution_plan_calculates_dependencies_first(fuse_outputs, number_outputs_in_plan):
+    config = PyESGConfiguration.load_from_file(get_simulation_test_input_file_path("hull_white_annual_all_outputs"))
+    config.fuse_outputs = fuse_outputs
+    plan = build_execution_plan(config)
+
+    assert len(plan.outputs) == number_outputs_in_plan
+    positions = {id(output): position for position, output in enumerate(plan.outputs)}
+    for output in plan.outputs:
+        for dependency in output.dependencies:
+            assert positions[id(dependency)] < positions[id(output)]
+
+    assert plan.to_text().count("\n") == len(plan.outputs) - 1
+    assert plan.to_dot().startswith("digraph")
+
+
+def test_batches_sized_from_max_memory(tmpdir):
+    config = PyESGConfiguration.load_from_file(get_simulation_test_input_file_path("hull_white_annual_all_outputs"))
+    config.output_file_directory = str(tmpdir)
+    config.output_file_name = "max_memory"
+    config.number_of_batches = None
+    config.max_memory = "1GB"
+
+    # Allow enough memory for 40 simulations per batch so the last of the 100 simulations are in a smaller batch.
+    settings = InitialisedSettings(config)
+    initialise_models_and_outputs(settings)
+    batch_memory = settings.memory_reserve + settings.estimate_fixed_memory() + \
+        40.5 * settings.estimate_memory_per_simulation()
+    config.max_memory = int(batch_memory / (1.0 - settings.memory_safety_margin))
+    generate_simulations(config)
+
+    settings = InitialisedSettings(config)
+    initialise_models_and_outputs(settings)
+    assert settings.batch_sizes == [40, 40, 20]
+
+    # Regenerate each batch and check it has been written to the right simulations in the file.
+    reader = PyESGReader(os.path.join(str(tmpdir), "max_memory.pyesg"))
+    for batch_number, batch_size in enumerate(settings.batch_sizes):
+        output_values = generate_batch(settings, batch_number)
+        first_simulation = settings.get_batch_first_simulation(batch_number)
+        for output_index, output_id in enumerate(reader.output_ids):
+            simulations = reader.get_output_simulations(output_id)[first_simulation:first_simulation + batch_size, :]
+            assert (simulations == output_values[output_index, :, :].astype(np.float32)).all()
+
+
+@pytest.mark.parametrize("config_overrides", [
+    {},
+    {"output_file_summary_statistics": True},
+    {"engine_mode": TIME_VECTORISED},
+    {"fuse_outputs": True},
+    {"write_in_background": True},
+    {"stream_random_drivers": True, "compute_dtype": FLOAT32},
+    {"output_file_layout": TILED, "output_file_compression": ZLIB, "output_file_summary_statistics": True,
+     "tile_number_of_simulations": 256},
+])
+def test_peak_memory_within_max_memory(tmpdir, config_overrides):
+    config = PyESGConfiguration.load_from_file(get_simulation_test_input_file_path("hull_white_annual_all_outputs"))
+    config.output_file_directory = str(tmpdir)
+    config.output_file_name = "peak_memory"
+    config.number_of_simulations = 2000
+    config.number_of_projection_steps = 120
+    config.projection_frequency = "monthly"
+    config.number_of_batches = None
+    config.max_memory = "4MB"
+    for name, value in config_overrides.items():
+        setattr(config, name, value)
+
+    tracemalloc.start()
+    try:
+        generate_simulations(config)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    settings = InitialisedSettings(config)
+    initialise_models_and_outputs(settings)
+    assert len(settings.batch_sizes) > 1  # The maximum memory must limit the batch size for the test to be useful.
+    assert peak_memory <= parse_memory_size(config.max_memory)
+
+
+def test_background_writing_matches_writing_in_foreground(tmpdir):
+    config = PyESGConfiguration.load_from_file(get_simulation_test_input_file_path("hull_white_annual_all_outputs"))
+    config.output_file_directory = str(tmpdir)
+    config.number_of_batches = 5
+
+    output_file_paths = []
+    for write_in_background in [False, True]:
+        config.write_in_background = write_in_background
+        config.output_file_name = f"background_{write_in_background}"
+        generate_simulations(config)
+        output_file_paths.append(os.path.join(str(tmpdir), config.output_file_name + ".pyesg"))
+
+    output = PyESGReader(output_file_paths[1])
+    comparison = PyESGReader(output_file_paths[0])
+    for output_id in output.output_ids:
+        assert (output.get_output_simulations(output_id) == comparison.get_output_simulations(output_id)).all()
+
+
+def test_background_writer_raises_write_errors():
+    class FailingWriter:
+        finalised = False
+
+        def write_batch_of_simulations(self, batch_number, total_batches, simulations, first_simulation=None,
+                                       checkpoint=None):
+            raise OSError("No space left on device")
+
+        def finalise(self):
+            self.finalised = True
+
+    writer = FailingWriter()
+    background_writer = BackgroundWriter(writer)
+    background_writer.write_batch_of_simulations(1, 2, np.zeros([1, 1, 1]))
+    with pytest.raises(OSError):
+        background_writer.write_batch_of_simulations(2, 2, np.zeros([1, 1, 1]))
+    with pytest.raises(OSError):
+        background_writer.finalise()
+    assert not writer.finalised
+
+
+@pytest.mark.parametrize("config_overrides", [
+    {},
+    {"engine_mode": TIME_VECTORISED},
+    {"compute_dtype": FLOAT32},
+])
+def test_zcb_curve_matches_zcb_for_each_term(tmpdir, config_overrides):
+    config = PyESGConfiguration.load_from_file(get_simulation_test_input_file_path("hull_white_annual_all_outputs"))
+    config.output_file_directory = str(tmpdir)
+    config.output_file_name = "zcb_curve"
+    for key, value in config_overrides.items():
+        setattr(config, key, value)
+    config.economies[0].asset_classes[0].add_output("GBP_Nominal_ZCB_Curve", "zero_coupon_bond_curve",
+                                                    terms=[5.0, 0.5, 10.0])
+    generate_simulations(config)
+
+    reader = PyESGReader(os.path.join(str(tmpdir), "zcb_curve.pyesg"))
+    assert reader.output_ids[-3:] == ["GBP_Nominal_ZCB_Curve_5", "GBP_Nominal_ZCB_Curve_0.5",
+                                      "GBP_Nominal_ZCB_Curve_10"]
+    for term in [5, 10]:
+        assert (reader.get_output_simulations(f"GBP_Nominal_ZCB_Curve_{term}")
+                == reader.get_output_simulations(f"GBP_Nominal_ZCB_{term}")).all()
+
+
+def create_multiple_economy_config(number_of_economies: int) -> PyESGConfiguration:
+    """
+    Creates a pyESG config with a Hull-White nominal rates asset class and a Black-Scholes equity asset class for each
+    of several economies, based on the config for the Hull-White simulation test.
+    Args:
+        number_of_economies: The number of economies.
+
+    Returns:
+        The pyESG config. The parameters of the asset classes differ between economies. The equities in the last
+        economy depend on the nominal rates in the first economy, and the equities in other economies depend on the
+        nominal rates in their own economy.
+    """
+    config = PyESGConfiguration.load_from_file(get_simulation_test_input_file_path("hull_white_annual_all_outputs"))
+    economy_json = config.economies[0]._encode_json()
+    config.economies = []
+    for i_economy in range(number_of_economies):
+        economy = Economy._decode_json(economy_json)
+        economy.id = f"E{i_economy}"
+        nominal = economy.asset_classes[0]
+        nominal.id = f"E{i_economy}_Nominal"
+        nominal.parameters.alpha += 0.01 * i_economy
+        nominal.random_drivers = [nominal.id]
+        for output in nominal.outputs:
+            output.id = output.id.replace("GBP", economy.id)
+
+        nominal_dependency = "E0_Nominal" if i_economy == number_of_economies - 1 else nominal.id
+        equities = AssetClass(id=f"E{i_economy}_Equities", model_id="black_scholes",
+                              random_drivers=[f"E{i_economy}_Equities"], dependencies=[nominal_dependency])
+        equities.add_parameter("sigma", 0.15 + 0.01 * i_economy)
+        equities.add_output(f"E{i_economy}_Equities_TRI", "total_return_index", initial_value=1.0 + i_economy)
+        economy.asset_classes.append(equities)
+        config.correlations.set_correlation(nominal.id, equities.id, 0.3)
+        config.economies.append(economy)
+    return config
+
+
+@pytest.mark.parametrize("config_overrides", [
+    {},
+    {"compute_dtype": FLOAT32},
+    {"stream_random_drivers": True, "random_number_generator": "pcg64"},
+])
+def test_fused_outputs_match_unfused_outputs(tmpdir, config_overrides):
+    config = create_multiple_economy_config(4)
+    config.output_file_directory = str(tmpdir)
+    for key, value in config_overrides.items():
+        setattr(config, key, value)
+
+    output_file_paths = []
+    for fuse_outputs in [False, True]:
+        config.fuse_outputs = fuse_outputs
+        config.output_file_name = f"fused_{fuse_outputs}"
+        generate_simulations(config)
+        output_file_paths.append(os.path.join(str(tmpdir), config.output_file_name + ".pyesg"))
+
+    # The outputs of each type are fused across economies (and the two zero-coupon bonds within each economy).
+    plan = build_execution_plan(config)
+    assert len(plan.outputs) == 7
+
+    output = PyESGReader(output_file_paths[1])
+    comparison = PyESGReader(output_file_paths[0])
+    assert output.output_ids == comparison.output_ids
+    for output_id in output.output_ids:
+        assert (output.get_output_simulations(output_id) == comparison.get_output_simulations(output_id)).all()
+
+
+def test_fused_outputs_next_to_each_other_calculated_into_output_values(tmpdir):
+    config = PyESGConfiguration.load_from_file(get_simulation_test_input_file_path("hull_white_annual_all_outputs"))
+    config.output_file_directory = str(tmpdir)
+
+    output_file_paths = []
+    for fuse_outputs in [False, True]:
+        config.fuse_outputs = fuse_outputs
+        config.output_file_name = f"fused_{fuse_outputs}"
+        generate_simulations(config)
+        output_file_paths.append(os.path.join(str(tmpdir), config.output_file_name + ".pyesg"))
+
+    # The two zero-coupon bonds are next to each other in the output file, so they are fused into a slice of it.
+    plan = build_execution_plan(config)
+    fused_outputs = [output for output in plan.outputs if isinstance(output, FusedOutput)]
+    assert [output.output_index for output in fused_outputs] == [1]
+
+    output = PyESGReader(output_file_paths[1])
+    comparison = PyESGReader(output_file_paths[0])
+    for output_id in output.output_ids:
+        assert (output.get_output_simulations(output_id) == comparison.get_output_simulations(output_id)).all()
+
+
+@pytest.mark.parametrize("workers, config_overrides, journal_statistics", [
+    (None, {}, True),
+    (None, {}, False),
+    (None, {"output_file_layout": TILED, "tile_number_of_simulations": 7}, False),
+    (None, {"output_file_layout": TILED, "output_file_compression": ZLIB, "tile_number_of_simulations": 7}, True),
+    (None, {"output_file_layout": TILED, "output_file_compression": ZLIB, "tile_number_of_simulations": 7}, False),
+    (1, {"output_file_layout": TILED, "output_file_compression": LZMA, "output_file_compression_filter": DELTA}, True),
+    (None, {"random_number_generator": "pcg64", "write_in_background": True}, True),
+    (1, {}, True),
+])
+def test_resumed_run_matches_uninterrupted_run(tmpdir, monkeypatch, workers, config_overrides, journal_statistics):
+    config = PyESGConfiguration.load_from_file(get_simulation_test_input_file_path("hull_white_annual_all_outputs"))
+    config.output_file_directory = str(tmpdir)
+    config.number_of_batches = 5
+    config.output_file_summary_statistics = True
+    for key, value in config_overrides.items():
+        setattr(config, key, value)
+
+    config.output_file_name = "uninterrupted"
+    generate_simulations(config, workers=workers)
+    with open(os.path.join(str(tmpdir), "uninterrupted.pyesg"), "rb") as uninterrupted_file:
+        uninterrupted = uninterrupted_file.read()
+
+    # Interrupt the run while the third batch is being written.
+    config.output_file_name = "resumed"
+    write_batch_of_simulations = PyESGWriter.write_batch_of_simulations
+
+    def interrupted_write_batch_of_simulations(writer, batch_number, *args, **kwargs):
+        if batch_number == 3:
+            raise KeyboardInterrupt
+        write_batch_of_simulations(writer, batch_number, *args, **kwargs)
+
+    monkeypatch.setattr(PyESGWriter, "write_batch_of_simulations", interrupted_write_batch_of_simulations)
+    with pytest.raises(KeyboardInterrupt):
+        generate_simulations(config, workers=workers)
+    monkeypatch.setattr(PyESGWriter, "write_batch_of_simulations", write_batch_of_simulations)
+
+    output_file_path = os.path.join(str(tmpdir), "resumed.pyesg")
+    journal = BatchJournal(output_file_path + ".journal")
+    journal_header, records = journal.read()
+    records = list(records)
+    # The batches are restored from the journal, without reading them back from the file.
+    assert all("statistics" in record for record in records)
+    assert all(("tile_sizes" in record) == (config.output_file_compression is not None) for record in records)
+    if not journal_statistics:
+        # Journals without the summary statistics are resumed by calculating them from the batches in the file.
+        journal.create(journal_header)
+        for record in records:
+            del record["statistics"]
+            journal.append(record)
+    generated_batches = []
+    monkeypatch.setattr("pyesg.simulation.run.generate_batch",
+                        lambda settings, batch_number, *args: generated_batches.append(batch_number)
+                        or generate_batch(settings, batch_number, *args))
+    generate_simulations(config, workers=workers, resume=True)
+
+    assert generated_batches == [2, 3, 4]
+    assert not os.path.exists(output_file_path + ".journal")
+    with open(output_file_path, "rb") as resumed_file:
+        resumed = resumed_file.read()
+
+    # The files only differ in the time they were saved.
+    time_saved_position = 16 if config.output_file_layout == TILED else 0
+    assert len(resumed) == len(uninterrupted)
+    assert resumed[:time_saved_position] == uninterrupted[:time_saved_position]
+    assert resumed[time_saved_position + 8:] == uninterrupted[time_saved_position + 8:]
+
+
+def test_resume_rejects_different_configuration(tmpdir, monkeypatch):
+    config = PyESGConfiguration.load_from_file(get_simulation_test_input_file_path("hull_white_annual_all_outputs"))
+    config.output_file_directory = str(tmpdir)
+    config.output_file_name = "resumed"
+    config.number_of_batches = 5
+
+    def interrupted_finalise(writer):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(PyESGWriter, "finalise", interrupted_finalise)
+    with pytest.raises(KeyboardInterrupt):
+        generate_simulations(config)
+    monkeypatch.undo()
+
+    config.random_seed += 1
+    with pytest.raises(ValueError):
+        generate_simulations(config, resume=True)
+    assert os.path.exists(os.path.join(str(tmpdir), "resumed.pyesg.journal"))
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from pyesg.configuration.pyesg_configuration import Parameters
+from pyesg.constants.yield_curve_methods import MONOTONE_CUBIC, SMITH_WILSON
+from pyesg.simulation.utils import extract_yield_curve_from_parameters
+from pyesg.yield_curve.yield_curve import YieldCurve, CC_SPOT_RATE, ZCB
+
+
+def create_yield_curve(**kwargs) -> YieldCurve:
+    yield_curve = YieldCurve(**kwargs)
+    for term, rate in [(1, 0.01), (2, 0.015), (5, 0.02), (10, 0.03), (30, 0.025)]:
+        yield_curve.add_point(term, rate)
+    return yield_curve
+
+
+@pytest.mark.parametrize("rate_type", [CC_SPOT_RATE, ZCB])
+def test_rates_for_array_of_terms_match_single_terms(rate_type):
+    yield_curve = create_yield_curve()
+    terms = np.linspace(0, 30, 1001)
+
+    rates = yield_curve.get_rate(terms, rate_type)
+    assert rates.shape == terms.shape
+    assert np.array_equal(rates, [yield_curve.get_rate(term, rate_type) for term in terms])
+    assert yield_curve.get_rate(terms.reshape(7, 143), rate_type).shape == (7, 143)
+
+    with pytest.raises(ValueError):
+        yield_curve.get_rate(np.array([1.0, 31.0]), rate_type)
+    with pytest.raises(ValueError):
+        yield_curve.get_rate(np.array([-1.0, 1.0]), rate_type)
+
+
+def test_rates_interpolated_linearly():
+    yield_curve = create_yield_curve()
+    assert yield_curve.get_rate(0) == 0
+    assert yield_curve.get_rate(5) == 0.02
+    assert yield_curve.get_rate(7.5) == pytest.approx(0.025)
+    assert yield_curve.get_rate(7.5, ZCB) == pytest.approx(np.exp(-7.5 * 0.025))
+
+
+def test_yield_curves_with_same_points_are_shared():
+    parameters = Parameters(yc_1=0.01, yc_5=0.02, yc_10=0.03, alpha=0.1)
+    yield_curve = extract_yield_curve_from_parameters(parameters)
+    assert extract_yield_curve_from_parameters(Parameters(yc_1=0.01, yc_5=0.02, yc_10=0.03)) is yield_curve
+    assert extract_yield_curve_from_parameters(Parameters(yc_1=0.01, yc_5=0.02, yc_10=0.04)) is not yield_curve
+    with pytest.raises(ValueError):
+        yield_curve.add_point(20, 0.03)
+
+    times = np.arange(6) / 2.0
+    rates = yield_curve.get_rates_on_grid(times, ZCB, term_offset=5.0)
+    assert np.array_equal(rates, yield_curve.get_rate(times + 5.0, ZCB))
+    assert yield_curve.get_rates_on_grid(times.copy(), ZCB, term_offset=5.0) is rates
+    assert not rates.flags.writeable
+
+
+def test_rates_cached_for_recently_used_grids_only(monkeypatch):
+    monkeypatch.setattr(YieldCurve, "grid_cache_size", 2)
+    yield_curve = create_yield_curve()
+    grids = [np.arange(6) / frequency for frequency in [1.0, 2.0, 4.0]]
+    rates = [yield_curve.get_rates_on_grid(grid) for grid in grids[:2]]
+
+    # Using the first grid again keeps its rates, so the second grid's rates are forgotten for the third grid's.
+    assert yield_curve.get_rates_on_grid(grids[0]) is rates[0]
+    yield_curve.get_rates_on_grid(grids[2])
+    assert yield_curve.get_rates_on_grid(grids[0]) is rates[0]
+    assert yield_curve.get_rates_on_grid(grids[1]) is not rates[1]
+    assert len(yield_curve._grid_cache) == 2
+
+
+def test_monotone_cubic_interpolation_fits_points_without_overshooting():
+    yield_curve = create_yield_curve(interpolation=MONOTONE_CUBIC)
+    for term, rate in [(1, 0.01), (2, 0.015), (5, 0.02), (10, 0.03), (30, 0.025)]:
+        assert yield_curve.get_rate(term) == pytest.approx(rate, abs=1e-15)
+
+    # The rates increase up to 10 years and decrease after, so the spline must do the same.
+    rates = yield_curve.get_rate(np.linspace(0, 30, 3001))
+    assert np.all(np.diff(rates[:1001]) >= 0)
+    assert np.all(np.diff(rates[1000:]) <= 0)
+    assert rates.min() >= 0 and rates.max() <= 0.03
+
+
+def test_smith_wilson_extrapolation_converges_to_ultimate_forward_rate():
+    ultimate_forward_rate = 0.04
+    parameters = Parameters(yc_1=0.01, yc_2=0.015, yc_5=0.02, yc_10=0.03, yc_30=0.025,
+                            yield_curve_extrapolation=SMITH_WILSON, ultimate_forward_rate=ultimate_forward_rate)
+    yield_curve = extract_yield_curve_from_parameters(parameters)
+
+    # Interpolation is unchanged and the extrapolated curve continues from the last point.
+    assert yield_curve.get_rate(7.5) == pytest.approx(0.025)
+    assert yield_curve.get_rate(30 + 1e-9) == pytest.approx(0.025, abs=1e-9)
+
+    terms = np.array([100.0, 101.0, 500.0, 501.0])
+    log_prices = np.log(yield_curve.get_rate(terms, ZCB))
+    forward_rates = log_prices[[0, 2]] - log_prices[[1, 3]]
+    assert abs(forward_rates[1] - ultimate_forward_rate) < abs(forward_rates[0] - ultimate_forward_rate)
+    assert forward_rates[1] == pytest.approx(ultimate_forward_rate, abs=1e-6)
+    assert yield_curve.get_rate(np.linspace(0, 200, 10401)).shape == (10401,)